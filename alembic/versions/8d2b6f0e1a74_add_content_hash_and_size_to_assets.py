@@ -0,0 +1,32 @@
+"""add content hash and size to assets
+
+Revision ID: 8d2b6f0e1a74
+Revises: c41e7a9d52f3
+Create Date: 2026-10-17 12:03:27.904311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2b6f0e1a74'
+down_revision: Union[str, Sequence[str], None] = 'c41e7a9d52f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('assets', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.add_column('assets', sa.Column('size_bytes', sa.BigInteger(), nullable=True))
+    op.create_index(op.f('ix_assets_content_hash'), 'assets', ['content_hash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_assets_content_hash'), table_name='assets')
+    op.drop_column('assets', 'size_bytes')
+    op.drop_column('assets', 'content_hash')
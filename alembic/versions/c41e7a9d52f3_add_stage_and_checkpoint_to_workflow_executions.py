@@ -0,0 +1,39 @@
+"""add stage and checkpoint to workflow executions
+
+Revision ID: c41e7a9d52f3
+Revises: 2a453dc4ef7f
+Create Date: 2026-10-17 10:12:41.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41e7a9d52f3'
+down_revision: Union[str, Sequence[str], None] = '2a453dc4ef7f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+workflow_execution_stage = sa.Enum(
+    'EXTRACT', 'BUILD_PROMPT', 'AGENT', 'FINALIZE', 'DONE',
+    name='workflowexecutionstage',
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    workflow_execution_stage.create(op.get_bind(), checkfirst=True)
+    op.add_column('workflow_executions', sa.Column('stage', workflow_execution_stage, nullable=False, server_default='EXTRACT'))
+    op.add_column('workflow_executions', sa.Column('checkpoint', sa.JSON(), nullable=True))
+    # Las ejecuciones que ya terminaron no deben volver a pasar por el pipeline
+    op.execute("UPDATE workflow_executions SET stage = 'DONE' WHERE status = 'DONE'")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('workflow_executions', 'checkpoint')
+    op.drop_column('workflow_executions', 'stage')
+    workflow_execution_stage.drop(op.get_bind(), checkfirst=True)
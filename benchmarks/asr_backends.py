@@ -0,0 +1,162 @@
+"""
+Benchmark de backends de transcripción: openai-whisper vs faster-whisper (int8).
+
+Mide velocidad (factor de tiempo real) y WER contra transcripciones de
+referencia. El conjunto de muestras es una carpeta con pares audio/texto del
+mismo nombre:
+
+    muestras/
+        audiencia_01.mp3
+        audiencia_01.txt     # transcripción de referencia en español
+        declaracion_02.wav
+        declaracion_02.txt
+
+Uso:
+    python benchmarks/asr_backends.py --samples ruta/a/muestras --model base
+    python benchmarks/asr_backends.py --samples ruta/a/muestras --backends faster-whisper --workers 1
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import unicodedata
+from glob import glob
+
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+AUDIO_EXTENSIONS = [".mp3", ".wav", ".m4a", ".flac", ".ogg", ".webm"]
+
+
+def normalize_words(text: str) -> list[str]:
+    """Minúsculas y sin puntuación; los acentos se conservan porque cambian el significado."""
+    text = unicodedata.normalize("NFC", text.lower())
+    return re.sub(r"[^\w\s]", " ", text).split()
+
+
+def word_errors(reference: list[str], hypothesis: list[str]) -> int:
+    """Distancia de Levenshtein a nivel de palabra (sustituciones + inserciones + borrados)."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, start=1):
+        current = [i] + [0] * len(hypothesis)
+        for j, hyp_word in enumerate(hypothesis, start=1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word),
+            )
+        previous = current
+    return previous[-1]
+
+
+def load_samples(samples_dir: str) -> list[tuple[str, str]]:
+    samples = []
+    for path in sorted(glob(os.path.join(samples_dir, "*"))):
+        base, ext = os.path.splitext(path)
+        if ext.lower() in AUDIO_EXTENSIONS and os.path.isfile(f"{base}.txt"):
+            with open(f"{base}.txt", "r", encoding="utf-8") as f:
+                samples.append((path, f.read()))
+    return samples
+
+
+def run(samples_dir: str, model_name: str, backends: list[str], workers: int | None):
+    if workers is not None:
+        os.environ["AUDIO_TRANSCRIBE_WORKERS"] = str(workers)
+    # Se mide la transcripción, no el cache de extracción
+    os.environ["EXTRACTION_CACHE_ENABLED"] = "false"
+
+    from server.utils.audio_reader import WhisperStrategy, FasterWhisperStrategy
+    from server.utils.audio_segmenter import SAMPLE_RATE
+
+    samples = load_samples(samples_dir)
+    if not samples:
+        print(f"No se encontraron pares audio/.txt en {samples_dir}")
+        return
+
+    strategies = {"whisper": WhisperStrategy, "faster-whisper": FasterWhisperStrategy}
+    rows = []
+    per_file = []
+    for backend in backends:
+        strategy = strategies[backend](model_name)
+
+        start = time.perf_counter()
+        strategy._load_model()
+        load_seconds = time.perf_counter() - start
+
+        audio_seconds = 0.0
+        transcribe_seconds = 0.0
+        errors = 0
+        reference_words = 0
+        for path, reference in samples:
+            audio_seconds += len(strategy.load_audio(path)) / SAMPLE_RATE
+            start = time.perf_counter()
+            hypothesis = strategy.read(path)
+            elapsed = time.perf_counter() - start
+            transcribe_seconds += elapsed
+
+            ref_words = normalize_words(reference)
+            file_errors = word_errors(ref_words, normalize_words(hypothesis))
+            errors += file_errors
+            reference_words += len(ref_words)
+            per_file.append(
+                [
+                    backend,
+                    os.path.basename(path),
+                    f"{elapsed:.1f}",
+                    f"{file_errors / max(len(ref_words), 1) * 100:.1f}",
+                ]
+            )
+
+        rows.append(
+            [
+                backend,
+                f"{load_seconds:.1f}",
+                f"{audio_seconds / 60:.1f}",
+                f"{transcribe_seconds:.1f}",
+                f"{audio_seconds / transcribe_seconds:.2f}x",
+                f"{errors / max(reference_words, 1) * 100:.2f}",
+            ]
+        )
+
+    print(f"Modelo: {model_name}  Muestras: {len(samples)}")
+    print(
+        tabulate(
+            per_file,
+            headers=["backend", "archivo", "segundos", "WER %"],
+            tablefmt="psql",
+        )
+    )
+    print(
+        tabulate(
+            rows,
+            headers=[
+                "backend",
+                "carga (s)",
+                "audio (min)",
+                "transcripción (s)",
+                "tiempo real",
+                "WER %",
+            ],
+            tablefmt="psql",
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--samples", required=True, help="Carpeta con pares audio/.txt")
+    parser.add_argument("--model", default="base")
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=["whisper", "faster-whisper"],
+        default=["whisper", "faster-whisper"],
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Procesos de transcripción (AUDIO_TRANSCRIBE_WORKERS)"
+    )
+    args = parser.parse_args()
+    run(args.samples, args.model, args.backends, args.workers)
@@ -0,0 +1,109 @@
+"""
+Benchmark del arranque de la API: tiempo y memoria de `import main`.
+
+Cada medición corre en un proceso nuevo. Con --compare se mide también otra
+revisión de git (por ejemplo la anterior al import diferido de Whisper/torch)
+en un worktree temporal, para comparar antes y después.
+
+Uso:
+    python benchmarks/import_time.py --runs 5
+    python benchmarks/import_time.py --runs 5 --compare HEAD~1
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+from tabulate import tabulate
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["torch", "whisper", "fitz", "pytesseract", "PIL", "docx", "chromadb"]
+
+CHILD_SCRIPT = f"""
+import sys, time, json, resource
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules": [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure(tree: str, runs: int) -> dict:
+    env = dict(os.environ)
+    # main.py se niega a arrancar en producción con ALLOWED_ORIGINS=*
+    env.setdefault("ALLOWED_ORIGINS", "http://localhost")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [tree, env.get("PYTHONPATH")]))
+
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", CHILD_SCRIPT],
+            cwd=tree,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"`import main` falló en {tree}:\n{result.stderr}")
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    return {
+        "seconds": statistics.median(s["seconds"] for s in samples),
+        "max_rss_mb": statistics.median(s["max_rss_mb"] for s in samples),
+        "heavy_modules": samples[-1]["heavy_modules"],
+    }
+
+
+def run(runs: int, compare: str | None):
+    rows = []
+    if compare:
+        worktree = os.path.join(tempfile.mkdtemp(), "baseline")
+        subprocess.run(
+            ["git", "worktree", "add", "--detach", worktree, compare],
+            cwd=REPO_ROOT,
+            check=True,
+            capture_output=True,
+        )
+        try:
+            rows.append([compare, measure(worktree, runs)])
+        finally:
+            subprocess.run(
+                ["git", "worktree", "remove", "--force", worktree],
+                cwd=REPO_ROOT,
+                capture_output=True,
+            )
+    rows.append(["working tree", measure(REPO_ROOT, runs)])
+
+    print(f"Mediana de {runs} procesos por revisión")
+    print(
+        tabulate(
+            [
+                [
+                    label,
+                    f"{m['seconds']:.2f}",
+                    f"{m['max_rss_mb']:.0f}",
+                    ", ".join(m["heavy_modules"]) or "-",
+                ]
+                for label, m in rows
+            ],
+            headers=["revisión", "segundos", "RSS máx (MB)", "módulos pesados cargados"],
+            tablefmt="psql",
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--compare", help="Revisión de git a comparar, ej. HEAD~1")
+    args = parser.parse_args()
+    run(args.runs, args.compare)
@@ -0,0 +1,215 @@
+"""
+Benchmark del balanceo entre varios backends compatibles con OpenAI (vLLM).
+
+Levanta --backends servidores mock de /v1/chat/completions en 127.0.0.1.
+Cada uno atiende como máximo --max-num-seqs peticiones a la vez (como
+vllm serve --max-num-seqs) y tarda --latency segundos por petición; el resto
+espera en cola. --workers hilos (como los workers de Celery) hacen
+--requests llamadas con AIInterface en tres escenarios:
+- un solo endpoint en PROVIDER_BASE_URL,
+- todos los backends balanceados,
+- balanceados, con el primer backend caído a mitad de la corrida (cierra
+  las conexiones, también las que están en curso).
+
+Al final se corre un agent loop con tools que pierde su backend a mitad
+del loop, para comprobar que sigue en otro con la conversación intacta.
+
+Uso:
+    python benchmarks/load_balancer.py --backends 3 --workers 8 --requests 60
+    python benchmarks/load_balancer.py --backends 2 --weights 3 1 --latency 0.5
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_mock_handler(name: str, state: dict, latency: float, max_num_seqs: int):
+    slots = threading.Semaphore(max_num_seqs)
+
+    class MockBackendHandler(BaseHTTPRequestHandler):
+        def handle_one_request(self):
+            if state["down"]:
+                # Caído: se corta la conexión sin responder
+                self.close_connection = True
+                return
+            super().handle_one_request()
+
+        def do_GET(self):
+            self.reply({"object": "list", "data": [{"id": "mock", "object": "model", "created": 0, "owned_by": name}]})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with slots:
+                for _ in range(10):
+                    time.sleep(latency / 10)
+                    if state["down"]:
+                        self.close_connection = True
+                        return
+                state["served"] += 1
+
+            tool_results = sum(1 for m in body["messages"] if m["role"] == "tool")
+            if body.get("tools") and tool_results < state["agent_turns"]:
+                message = {
+                    "role": "assistant",
+                    "content": None,
+                    "tool_calls": [
+                        {
+                            "id": f"call_{uuid.uuid4().hex[:24]}",
+                            "type": "function",
+                            "function": {"name": "step", "arguments": json.dumps({"n": tool_results + 1})},
+                        }
+                    ],
+                }
+                finish_reason = "tool_calls"
+            else:
+                message = {"role": "assistant", "content": f"Respuesta de {name}"}
+                finish_reason = "stop"
+            self.reply(
+                {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body["model"],
+                    "choices": [{"index": 0, "finish_reason": finish_reason, "message": message}],
+                    "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+                }
+            )
+
+        def reply(self, data: dict):
+            payload = json.dumps(data).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return MockBackendHandler
+
+
+def start_backends(count: int, latency: float, max_num_seqs: int) -> list[dict]:
+    backends = []
+    for i in range(count):
+        state = {"down": False, "served": 0, "agent_turns": 0}
+        server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), make_mock_handler(f"backend-{i + 1}", state, latency, max_num_seqs)
+        )
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        backends.append({"url": f"http://127.0.0.1:{server.server_port}/v1", "state": state, "server": server})
+    return backends
+
+
+def run_scenario(base_url: str, backends: list[dict], workers: int, requests: int, kill_after: int | None) -> list:
+    from server.ai.ai_interface import AIInterface
+
+    for backend in backends:
+        backend["state"].update(down=False, served=0)
+    ai = AIInterface(provider="openai", api_key="mock", base_url=base_url)
+    latencies = []
+    errors = []
+
+    def call(i: int):
+        if kill_after is not None and i == kill_after:
+            backends[0]["state"]["down"] = True
+        start = time.perf_counter()
+        try:
+            ai.chat(messages=[{"role": "user", "content": f"Página {i}"}], model="mock")
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            errors.append(type(e).__name__)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(call, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return [
+        f"{len(latencies) / elapsed:.1f}",
+        f"{statistics.median(latencies) * 1000:.0f}" if latencies else "-",
+        f"{latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f}" if latencies else "-",
+        len(errors),
+        " / ".join(str(b["state"]["served"]) for b in backends),
+    ]
+
+
+def run_agent_failover(base_url: str, backends: list[dict], turns: int) -> str:
+    from server.ai.ai_interface import AIInterface, function_to_openai_schema
+
+    for backend in backends:
+        backend["state"].update(down=False, served=0, agent_turns=turns)
+    steps = []
+
+    def step(n: int):
+        """Un paso del agente."""
+        steps.append(n)
+        if n == turns // 2:
+            # Se cae el backend que atendió este turno; el siguiente va a otro
+            for backend in backends:
+                if backend["state"]["served"]:
+                    backend["state"]["down"] = True
+                    break
+        return f"Paso {n} listo"
+
+    ai = AIInterface(provider="openai", api_key="mock", base_url=base_url)
+    result = ai.agent_loop(
+        messages=[{"role": "user", "content": "Ejecuta los pasos."}],
+        model="mock",
+        tools=[function_to_openai_schema(step)],
+        tools_fn_map={"step": step},
+    )
+    return f"{result.describe()} Pasos ejecutados: {steps}"
+
+
+def run(n_backends: int, weights: list[float] | None, workers: int, requests: int, latency: float, max_num_seqs: int):
+    backends = start_backends(n_backends, latency, max_num_seqs)
+    weights = weights or [1] * n_backends
+    balanced_url = ",".join(f"{b['url']}|{w}" for b, w in zip(backends, weights))
+
+    rows = [
+        ["un endpoint", *run_scenario(backends[0]["url"], backends, workers, requests, None)],
+        ["balanceado", *run_scenario(balanced_url, backends, workers, requests, None)],
+        ["balanceado, se cae el 1º", *run_scenario(balanced_url, backends, workers, requests, requests // 3)],
+    ]
+    print(
+        f"Backends: {n_backends}  Pesos: {weights}  Workers: {workers}  Peticiones: {requests}  "
+        f"Latencia: {latency}s  max-num-seqs: {max_num_seqs}"
+    )
+    print(
+        tabulate(
+            rows,
+            headers=["escenario", "peticiones/s", "p50 (ms)", "p95 (ms)", "errores", "atendidas por backend"],
+            tablefmt="psql",
+        )
+    )
+
+    # Backends nuevos para que el caído no afecte al agent loop
+    backends = start_backends(n_backends, latency / 4, max_num_seqs)
+    print(run_agent_failover(",".join(b["url"] for b in backends), backends, turns=6))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backends", type=int, default=3)
+    parser.add_argument("--weights", type=float, nargs="+", default=None)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.3, help="Segundos por petición en cada backend")
+    parser.add_argument("--max-num-seqs", type=int, default=3)
+    args = parser.parse_args()
+    run(args.backends, args.weights, args.workers, args.requests, args.latency, args.max_num_seqs)
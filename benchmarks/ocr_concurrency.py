@@ -0,0 +1,125 @@
+"""
+Benchmark de OCR concurrente contra un servidor local compatible con OpenAI.
+
+Levanta un servidor mock en 127.0.0.1 que responde /v1/chat/completions con
+una latencia fija (simulando el modelo de visión), genera un PDF escaneado
+sintético y mide PyMuPDFWithOCRStrategy.read con distintos niveles de
+concurrencia.
+
+Uso:
+    python benchmarks/ocr_concurrency.py --pages 60 --latency 2 --concurrency 1 2 4 8
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fitz
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_mock_handler(latency: float):
+    class MockChatCompletionsHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            images = [
+                part
+                for part in body["messages"][-1]["content"]
+                if isinstance(part, dict) and part.get("type") == "image_url"
+            ]
+            time.sleep(latency)
+            content = "\n---PAGE---\n".join(
+                f"Texto de la página {i + 1} del lote" for i in range(len(images))
+            )
+            payload = json.dumps(
+                {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "finish_reason": "stop",
+                            "message": {"role": "assistant", "content": content},
+                        }
+                    ],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                }
+            ).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return MockChatCompletionsHandler
+
+
+def make_scanned_pdf(pages: int) -> str:
+    """PDF donde cada página es solo una imagen, para forzar OCR en todas."""
+    source = fitz.open()
+    page = source.new_page()
+    page.insert_textbox(
+        fitz.Rect(50, 50, 550, 800),
+        "Acta de nacimiento. Registro civil. " * 40,
+    )
+    pixmap = page.get_pixmap(dpi=72)
+
+    scanned = fitz.open()
+    for _ in range(pages):
+        scanned_page = scanned.new_page()
+        scanned_page.insert_image(scanned_page.rect, pixmap=pixmap)
+
+    path = os.path.join(tempfile.mkdtemp(), "scanned.pdf")
+    scanned.save(path)
+    return path
+
+
+def run(pages: int, latency: float, concurrency_levels: list[int]):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_mock_handler(latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ["PROVIDER"] = "openai"
+    os.environ["PROVIDER_API_KEY"] = "mock"
+    os.environ["PROVIDER_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+
+    from server.utils.pdf_reader import PyMuPDFWithOCRStrategy, PAGE_CONNECTOR
+
+    pdf_path = make_scanned_pdf(pages)
+    strategy = PyMuPDFWithOCRStrategy()
+    batches = -(-pages // strategy.MAX_OCR_PAGES_PER_READ)
+
+    rows = []
+    baseline = None
+    for concurrency in concurrency_levels:
+        strategy.ocr_concurrency = concurrency
+        start = time.perf_counter()
+        text = strategy.read(pdf_path)
+        elapsed = time.perf_counter() - start
+        assert len(text.split(PAGE_CONNECTOR)) == pages
+        baseline = baseline or elapsed
+        rows.append([concurrency, f"{elapsed:.2f}", f"{baseline / elapsed:.2f}x"])
+
+    server.shutdown()
+    print(f"Páginas: {pages}  Lotes: {batches}  Latencia por lote: {latency}s")
+    print(tabulate(rows, headers=["concurrencia", "segundos", "speed-up"], tablefmt="psql"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=2.0, help="Segundos por lote")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    run(args.pages, args.latency, args.concurrency)
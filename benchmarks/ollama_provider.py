@@ -0,0 +1,284 @@
+"""
+Benchmark de OllamaProvider: recarga del modelo según keep_alive y agent loop con tools.
+
+Por defecto levanta un servidor stub de /api/chat en 127.0.0.1 que imita a
+Ollama: cargar el modelo cuesta --load-seconds y queda en memoria lo que
+indique keep_alive; si num_ctx cambia entre llamadas el modelo se recarga.
+El prompt se procesa a --prefill-tps y la respuesta se genera a --gen-tps
+(en streaming, en NDJSON). Con tools contesta create_new_markdown_asset
+hasta completar --turns y después un mensaje final.
+
+Se miden dos cosas:
+- --calls llamadas seguidas de chat (como las páginas de un OCR) con
+  keep_alive=0, con OLLAMA_KEEP_ALIVE y con num_ctx distinto en cada llamada.
+- El agent loop compartido con OpenAI, con y sin streaming: turnos, tokens,
+  tiempo total y tiempo hasta el primer fragmento.
+
+Con --host se usa un Ollama real (el modelo de --model tiene que soportar
+tools para la parte del agent loop).
+
+Uso:
+    python benchmarks/ollama_provider.py --calls 5 --load-seconds 2
+    python benchmarks/ollama_provider.py --host http://localhost:11434 --model qwen2.5:3b
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DOCUMENT_TEXT = "El demandante solicita que se declare la nulidad del contrato. "
+
+
+def parse_duration(value) -> float:
+    """Segundos de un keep_alive de Ollama: número o duración como "30m" (-1 = siempre)."""
+    if value is None:
+        return 300
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    seconds = sum(float(amount) * units[unit] for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value))
+    return float("inf") if value.startswith("-") else seconds
+
+
+def make_stub_handler(turns: int, doc_kb: int, load_seconds: float, prefill_tps: float, gen_tps: float):
+    # modelo -> (num_ctx, momento en que se descarga)
+    loaded = {}
+    lock = threading.Lock()
+    document = (DOCUMENT_TEXT * (doc_kb * 1024 // len(DOCUMENT_TEXT) + 1))[: doc_kb * 1024]
+
+    class StubOllamaHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if self.path != "/api/chat":
+                return self.reply({"error": "not found"}, status=404)
+
+            model = body["model"]
+            num_ctx = (body.get("options") or {}).get("num_ctx", 2048)
+            with lock:
+                state = loaded.get(model)
+                load_duration = 0.0
+                if state is None or state[1] < time.monotonic() or state[0] != num_ctx:
+                    load_duration = load_seconds
+                    time.sleep(load_seconds)
+
+            messages = body.get("messages") or []
+            prompt_tokens = len(json.dumps(messages)) // 4
+            time.sleep(prompt_tokens / prefill_tps)
+
+            done_turns = sum(1 for m in messages if m["role"] == "tool")
+            if body.get("tools") and done_turns < turns:
+                message = {
+                    "role": "assistant",
+                    "content": "",
+                    "tool_calls": [
+                        {
+                            "function": {
+                                "name": "create_new_markdown_asset",
+                                "arguments": {"name": f"documento_{done_turns + 1}.md", "content": document},
+                            }
+                        }
+                    ],
+                }
+                chunks = [message]
+            else:
+                words = "Listo, los documentos del caso fueron generados.".split(" ")
+                chunks = [{"role": "assistant", "content": word + " "} for word in words]
+            completion_tokens = sum(
+                len(chunk["content"]) + len(json.dumps(chunk.get("tool_calls", ""))) for chunk in chunks
+            ) // 4
+
+            final = {
+                "model": model,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "done": True,
+                "done_reason": "stop",
+                "load_duration": int(load_duration * 1e9),
+                "prompt_eval_count": prompt_tokens,
+                "eval_count": completion_tokens,
+            }
+            if body.get("stream", True):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in chunks:
+                    time.sleep(completion_tokens / len(chunks) / gen_tps)
+                    self.write_chunk({"model": model, "created_at": final["created_at"], "done": False, "message": chunk})
+                self.write_chunk({**final, "message": {"role": "assistant", "content": ""}})
+                self.wfile.write(b"0\r\n\r\n")
+            else:
+                time.sleep(completion_tokens / gen_tps)
+                content = "".join(chunk["content"] for chunk in chunks)
+                self.reply({**final, "message": {**chunks[0], "content": content}})
+
+            with lock:
+                loaded[model] = (num_ctx, time.monotonic() + parse_duration(body.get("keep_alive")))
+
+        def write_chunk(self, data: dict):
+            line = json.dumps(data).encode("utf-8") + b"\n"
+            self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+            self.wfile.flush()
+
+        def reply(self, data: dict, status: int = 200):
+            payload = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return StubOllamaHandler
+
+
+def run_calls(provider, model: str, calls: int, keep_alive: str, vary_num_ctx: bool) -> list[float]:
+    from server.ai import ai_interface
+
+    ai_interface.OLLAMA_KEEP_ALIVE = keep_alive
+    base_num_ctx = ai_interface.OLLAMA_NUM_CTX
+    latencies = []
+    try:
+        for i in range(calls):
+            if vary_num_ctx:
+                ai_interface.OLLAMA_NUM_CTX = base_num_ctx + 1024 * (i % 2)
+            start = time.perf_counter()
+            response = provider.chat(
+                messages=[{"role": "user", "content": f"Extrae el texto de la página {i + 1}."}],
+                model=model,
+            )
+            latencies.append(time.perf_counter() - start)
+            assert response.choices[0].message.content
+    finally:
+        ai_interface.OLLAMA_NUM_CTX = base_num_ctx
+    return latencies
+
+
+def run_agent(provider, model: str, stream: bool) -> list:
+    from server.ai.ai_interface import function_to_openai_schema
+
+    def create_new_markdown_asset(name: str, content: str):
+        """Crea un documento markdown con el nombre y el contenido dados."""
+        return f"Asset {name} created successfully"
+
+    first_delta = []
+    start = time.perf_counter()
+
+    def on_delta(delta):
+        if not first_delta:
+            first_delta.append(time.perf_counter() - start)
+
+    result = provider.agent_loop(
+        messages=[
+            {"role": "system", "content": "Genera los documentos del caso con create_new_markdown_asset."},
+            {"role": "user", "content": "Usa la información del caso para ejecutar el workflow."},
+        ],
+        model=model,
+        tools=[function_to_openai_schema(create_new_markdown_asset)],
+        tools_fn_map={"create_new_markdown_asset": create_new_markdown_asset},
+        on_delta=on_delta if stream else None,
+    )
+    elapsed = time.perf_counter() - start
+    return [
+        "streaming" if stream else "sin streaming",
+        result.stop_reason,
+        result.turns,
+        result.total_tokens,
+        f"{elapsed:.2f}",
+        f"{first_delta[0] * 1000:.0f}" if first_delta else "-",
+    ]
+
+
+def run(host: str | None, model: str, calls: int, turns: int, doc_kb: int, load_seconds: float, prefill_tps: float, gen_tps: float):
+    server = None
+    if host is None:
+        server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), make_stub_handler(turns, doc_kb, load_seconds, prefill_tps, gen_tps)
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host = f"http://127.0.0.1:{server.server_port}"
+
+    from server.ai import ai_interface
+    from server.ai.ai_interface import OllamaProvider
+
+    os.environ["OLLAMA_HOST"] = host
+    provider = OllamaProvider()
+    keep_alive = ai_interface.OLLAMA_KEEP_ALIVE if ai_interface.OLLAMA_KEEP_ALIVE not in ("0", "0s") else "30m"
+
+    scenarios = {
+        "keep_alive=0": ("0", False),
+        f"keep_alive={keep_alive}": (keep_alive, False),
+        f"keep_alive={keep_alive}, num_ctx variable": (keep_alive, True),
+    }
+    rows = []
+    for label, (scenario_keep_alive, vary_num_ctx) in scenarios.items():
+        # Cada escenario empieza con el modelo descargado
+        run_calls(provider, model, 1, "0", False)
+        latencies = run_calls(provider, model, calls, scenario_keep_alive, vary_num_ctx)
+        rows.append(
+            [
+                label,
+                f"{latencies[0] * 1000:.0f}",
+                f"{sum(latencies[1:]) / max(1, len(latencies) - 1) * 1000:.0f}",
+                f"{sum(latencies):.2f}",
+            ]
+        )
+    ai_interface.OLLAMA_KEEP_ALIVE = keep_alive
+
+    print(
+        f"Host: {host if server is None else 'stub'}  Modelo: {model}  num_ctx: {ai_interface.OLLAMA_NUM_CTX}  "
+        f"num_thread: {ai_interface.OLLAMA_NUM_THREAD or '-'}"
+        + (f"  Carga: {load_seconds}s  Prefill: {prefill_tps} tok/s  Generación: {gen_tps} tok/s" if server else "")
+    )
+    print(
+        tabulate(
+            rows,
+            headers=["escenario", "primera llamada (ms)", "siguientes (ms, media)", f"total {calls} llamadas (s)"],
+            tablefmt="psql",
+        )
+    )
+
+    print(
+        tabulate(
+            [run_agent(provider, model, stream=False), run_agent(provider, model, stream=True)],
+            headers=["agent loop", "resultado", "turnos", "tokens", "segundos", "primer fragmento (ms)"],
+            tablefmt="psql",
+        )
+    )
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default=None, help="Ollama real (por defecto, el stub)")
+    parser.add_argument("--model", default="gemma3:1b")
+    parser.add_argument("--calls", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=3, help="Tool calls del agente en el stub")
+    parser.add_argument("--doc-kb", type=int, default=4, help="Tamaño del markdown de cada tool call en el stub")
+    parser.add_argument("--load-seconds", type=float, default=2.0, help="Tiempo de carga del modelo en el stub")
+    parser.add_argument("--prefill-tps", type=float, default=2000)
+    parser.add_argument("--gen-tps", type=float, default=500)
+    args = parser.parse_args()
+    run(
+        args.host,
+        args.model,
+        args.calls,
+        args.turns,
+        args.doc_kb,
+        args.load_seconds,
+        args.prefill_tps,
+        args.gen_tps,
+    )
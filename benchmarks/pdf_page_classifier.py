@@ -0,0 +1,118 @@
+"""
+Benchmark del clasificador local TEXT vs OCR de páginas PDF.
+
+Compara la decisión de `classify_page` contra un corpus etiquetado de PDFs
+legales escaneados y digitales. El corpus se organiza así:
+
+    corpus/
+        digital/*.pdf      # todas las páginas se etiquetan como TEXT
+        scanned/*.pdf      # todas las páginas se etiquetan como OCR
+        labels.json        # opcional, etiquetas por página para PDFs mixtos:
+                           # {"mixed/demanda.pdf": ["TEXT", "TEXT", "OCR"]}
+
+Uso:
+    python benchmarks/pdf_page_classifier.py --corpus ruta/al/corpus
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from glob import glob
+
+import fitz
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.utils.pdf_reader import classify_page, get_page_signals  # noqa: E402
+
+FOLDER_LABELS = {"digital": "TEXT", "scanned": "OCR"}
+# El método anterior enviaba hasta 3 páginas por PDF al modelo de visión
+PREVIOUS_SAMPLE_PAGES = 3
+
+
+def load_corpus(corpus_dir: str) -> list[tuple[str, list[str] | str]]:
+    """Devuelve (ruta, etiqueta) donde la etiqueta es un string o una lista por página."""
+    items = []
+    for folder, label in FOLDER_LABELS.items():
+        for path in sorted(glob(os.path.join(corpus_dir, folder, "*.pdf"))):
+            items.append((path, label))
+
+    labels_path = os.path.join(corpus_dir, "labels.json")
+    if os.path.isfile(labels_path):
+        with open(labels_path, "r", encoding="utf-8") as f:
+            for relative_path, page_labels in json.load(f).items():
+                items.append((os.path.join(corpus_dir, relative_path), page_labels))
+    return items
+
+
+def run(corpus_dir: str, show_errors: bool):
+    items = load_corpus(corpus_dir)
+    if not items:
+        print(f"No se encontraron PDFs en {corpus_dir}")
+        return
+
+    confusion = {("TEXT", "TEXT"): 0, ("TEXT", "OCR"): 0, ("OCR", "TEXT"): 0, ("OCR", "OCR"): 0}
+    errors = []
+    total_pages = 0
+    total_seconds = 0.0
+    model_calls_avoided = 0
+
+    for path, label in items:
+        with fitz.open(path, filetype="pdf") as pdf:
+            model_calls_avoided += min(pdf.page_count, PREVIOUS_SAMPLE_PAGES)
+            for page in pdf:
+                expected = label[page.number] if isinstance(label, list) else label
+                start = time.perf_counter()
+                signals = get_page_signals(page)
+                predicted = classify_page(page, signals)
+                total_seconds += time.perf_counter() - start
+                total_pages += 1
+
+                confusion[(expected, predicted)] += 1
+                if expected != predicted:
+                    errors.append(
+                        [os.path.basename(path), page.number + 1, expected, predicted, signals]
+                    )
+
+    correct = confusion[("TEXT", "TEXT")] + confusion[("OCR", "OCR")]
+    print(f"PDFs: {len(items)}  Páginas: {total_pages}")
+    print(f"Exactitud: {correct / total_pages * 100:.2f}%")
+    print(
+        f"Tiempo medio por página: {total_seconds / total_pages * 1000:.2f} ms "
+        f"(total {total_seconds:.2f} s)"
+    )
+    print(f"Llamadas al modelo de visión evitadas: {model_calls_avoided}")
+    print()
+    print(
+        tabulate(
+            [
+                ["real TEXT", confusion[("TEXT", "TEXT")], confusion[("TEXT", "OCR")]],
+                ["real OCR", confusion[("OCR", "TEXT")], confusion[("OCR", "OCR")]],
+            ],
+            headers=["", "pred TEXT", "pred OCR"],
+            tablefmt="psql",
+        )
+    )
+
+    if show_errors and errors:
+        print()
+        print(
+            tabulate(
+                errors,
+                headers=["archivo", "página", "real", "pred", "señales"],
+                tablefmt="psql",
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--corpus", required=True, help="Carpeta del corpus etiquetado")
+    parser.add_argument(
+        "--show-errors", action="store_true", help="Mostrar las páginas mal clasificadas"
+    )
+    args = parser.parse_args()
+    run(args.corpus, args.show_errors)
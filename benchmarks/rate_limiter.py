@@ -0,0 +1,178 @@
+"""
+Benchmark del rate limiter compartido: llamadas de varios workers contra un proveedor con límite.
+
+Levanta un mock de /v1/chat/completions en 127.0.0.1 que acepta
+--provider-rpm peticiones por minuto (aplicado por segundo, como hacen los
+proveedores) y responde 429 con retry-after al resto. --workers hilos (como
+los workers prefork de Celery) hacen --calls llamadas cada uno con
+OpenAIProvider.chat, que reintenta los 429 según AI_MAX_RETRIES, en tres
+escenarios:
+- sin limitador,
+- con RATE_LIMIT_RPM igual al límite del proveedor,
+- con RATE_LIMIT_RPM al doble del límite: el AIMD lo baja con los 429.
+
+El limitador usa --burst-seconds como RATE_LIMIT_BURST_SECONDS (por
+defecto 1, la ventana del mock); con una ráfaga más larga que la del
+proveedor los primeros 429 hacen que el AIMD baje el límite.
+
+Se mide el tiempo total, las llamadas que fallaron aun con los reintentos,
+los 429 y las peticiones que recibió el proveedor, y el factor AIMD final.
+Usa el Redis configurado (REDIS_HOST, REDIS_PORT), como los workers.
+
+Uso:
+    python benchmarks/rate_limiter.py --workers 8 --calls 15 --provider-rpm 600
+    python benchmarks/rate_limiter.py --burst-seconds 10
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_mock_handler(provider_rpm: float, latency: float, stats: dict):
+    rate = provider_rpm / 60
+    bucket = {"level": max(1.0, rate), "updated": time.monotonic()}
+    lock = threading.Lock()
+
+    class LimitedProviderHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with lock:
+                now = time.monotonic()
+                bucket["level"] = min(max(1.0, rate), bucket["level"] + (now - bucket["updated"]) * rate)
+                bucket["updated"] = now
+                stats["requests"] += 1
+                allowed = bucket["level"] >= 1
+                if allowed:
+                    bucket["level"] -= 1
+                else:
+                    stats["rate_limited"] += 1
+                    retry_after = (1 - bucket["level"]) / rate
+
+            if not allowed:
+                return self.reply(
+                    429,
+                    {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                    {"retry-after": f"{retry_after:.3f}"},
+                )
+            time.sleep(latency)
+            self.reply(
+                200,
+                {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body["model"],
+                    "choices": [
+                        {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "Listo"}}
+                    ],
+                    "usage": {"prompt_tokens": 200, "completion_tokens": 20, "total_tokens": 220},
+                },
+            )
+
+        def reply(self, status: int, data: dict, headers: dict | None = None):
+            payload = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return LimitedProviderHandler
+
+
+def run_scenario(
+    base_url: str, stats: dict, workers: int, calls: int, limiter_rpm: float | None, burst_seconds: float
+) -> list:
+    from server.ai import rate_limiter as limiter_module
+    from server.ai.ai_interface import OpenAIProvider
+    from server.utils.redis_cache import redis_client
+
+    model = f"bench-{uuid.uuid4().hex[:8]}"
+    limiter_module.rate_limiter.enabled = limiter_rpm is not None
+    limiter_module.RATE_LIMIT_RPM = limiter_rpm or limiter_module.RATE_LIMIT_RPM
+    limiter_module.RATE_LIMIT_BURST_SECONDS = burst_seconds
+    stats.update(requests=0, rate_limited=0)
+    provider = OpenAIProvider(api_key="mock", base_url=base_url)
+    failed = []
+
+    def worker(_):
+        for i in range(calls):
+            try:
+                provider.chat(messages=[{"role": "user", "content": f"Página {i}"}], model=model)
+            except Exception as e:
+                failed.append(type(e).__name__)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(worker, range(workers)))
+    elapsed = time.perf_counter() - start
+
+    key = limiter_module.rate_limiter.bucket_key(provider.client.base_url.netloc.decode(), model)
+    factor = redis_client.hget(key, "factor") if limiter_rpm else None
+    redis_client.delete(key)
+    return [
+        f"{elapsed:.1f}",
+        workers * calls - len(failed),
+        len(failed),
+        stats["rate_limited"],
+        stats["requests"],
+        f"{float(factor):.2f}" if factor else "-",
+    ]
+
+
+def run(workers: int, calls: int, provider_rpm: float, latency: float, burst_seconds: float):
+    stats = {"requests": 0, "rate_limited": 0}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_mock_handler(provider_rpm, latency, stats))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    rows = [
+        ["sin limitador", *run_scenario(base_url, stats, workers, calls, None, burst_seconds)],
+        [
+            f"RATE_LIMIT_RPM={provider_rpm:.0f}",
+            *run_scenario(base_url, stats, workers, calls, provider_rpm, burst_seconds),
+        ],
+        [
+            f"RATE_LIMIT_RPM={provider_rpm * 2:.0f} (AIMD)",
+            *run_scenario(base_url, stats, workers, calls, provider_rpm * 2, burst_seconds),
+        ],
+    ]
+    server.shutdown()
+    print(
+        f"Workers: {workers}  Llamadas por worker: {calls}  Límite del proveedor: {provider_rpm:.0f} RPM  "
+        f"Ráfaga del limitador: {burst_seconds}s"
+    )
+    print(
+        tabulate(
+            rows,
+            headers=["escenario", "segundos", "correctas", "fallidas", "429", "peticiones al proveedor", "factor AIMD"],
+            tablefmt="psql",
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--calls", type=int, default=15, help="Llamadas por worker")
+    parser.add_argument("--provider-rpm", type=float, default=600)
+    parser.add_argument("--latency", type=float, default=0.1, help="Segundos por respuesta del proveedor")
+    parser.add_argument("--burst-seconds", type=float, default=1.0)
+    args = parser.parse_args()
+    run(args.workers, args.calls, args.provider_rpm, args.latency, args.burst_seconds)
@@ -0,0 +1,230 @@
+"""
+Benchmark del agente V2: reenviar todo el input vs encadenar con previous_response_id.
+
+Levanta un servidor mock de /v1/responses en 127.0.0.1 que guarda cada
+respuesta (como hace OpenAI con store=true) y contesta con una llamada a
+create_new_markdown_asset por turno hasta llegar a --turns. Se ejecuta
+WorkflowAgent en tres modos y se miden los bytes enviados y la latencia de
+cada iteración.
+
+La latencia del mock es fija más el tiempo de subir el cuerpo a
+--upload-mbps; con --prefill-tps se simula además el procesamiento del
+contexto completo, que el servidor paga igual en ambos modos (encadenar no
+reduce los tokens de entrada que procesa el modelo, solo lo que se envía).
+
+Uso:
+    python benchmarks/responses_chaining.py --turns 10 --doc-kb 14
+    python benchmarks/responses_chaining.py --turns 20 --doc-kb 30 --upload-mbps 5 --prefill-tps 20000
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DOCUMENT_TEXT = "El demandante solicita que se declare la nulidad del contrato. "
+
+
+def make_mock_handler(turns: int, doc_kb: int, latency: float, upload_mbps: float, prefill_tps: float):
+    responses = {}
+    document = (DOCUMENT_TEXT * (doc_kb * 1024 // len(DOCUMENT_TEXT) + 1))[: doc_kb * 1024]
+
+    class MockResponsesHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers["Content-Length"]))
+            body = json.loads(raw)
+            previous_id = body.get("previous_response_id")
+            if previous_id and previous_id not in responses:
+                return self.reply(404, {"error": {"message": "Response not found", "type": "invalid_request_error"}})
+
+            history = (responses[previous_id] if previous_id else []) + body["input"]
+            context_chars = len(body.get("instructions") or "") + len(json.dumps(history))
+            context_tokens = context_chars // 4
+
+            done_turns = sum(1 for item in history if item.get("type") == "function_call_output")
+            if done_turns < turns:
+                output = {
+                    "type": "function_call",
+                    "id": f"fc_{uuid.uuid4().hex}",
+                    "call_id": f"call_{uuid.uuid4().hex}",
+                    "name": "create_new_markdown_asset",
+                    "arguments": json.dumps(
+                        {"name": f"documento_{done_turns + 1}.md", "content": document},
+                        ensure_ascii=False,
+                    ),
+                    "status": "completed",
+                }
+            else:
+                output = {
+                    "type": "message",
+                    "id": f"msg_{uuid.uuid4().hex}",
+                    "role": "assistant",
+                    "status": "completed",
+                    "content": [{"type": "output_text", "text": "Listo", "annotations": []}],
+                }
+
+            upload_seconds = len(raw) / (upload_mbps * 125000)
+            prefill_seconds = context_tokens / prefill_tps if prefill_tps else 0
+            time.sleep(latency + upload_seconds + prefill_seconds)
+
+            response_id = f"resp_{uuid.uuid4().hex}"
+            responses[response_id] = history + [output]
+            self.reply(
+                200,
+                {
+                    "id": response_id,
+                    "object": "response",
+                    "created_at": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "status": "completed",
+                    "output": [output],
+                    "parallel_tool_calls": True,
+                    "tool_choice": "auto",
+                    "tools": body.get("tools", []),
+                    "usage": {
+                        "input_tokens": context_tokens,
+                        "input_tokens_details": {"cached_tokens": 0},
+                        "output_tokens": len(json.dumps(output)) // 4,
+                        "output_tokens_details": {"reasoning_tokens": 0},
+                        "total_tokens": context_tokens + len(json.dumps(output)) // 4,
+                    },
+                },
+            )
+
+        def reply(self, status: int, data: dict):
+            payload = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return MockResponsesHandler
+
+
+def run_mode(base_url: str, chain: bool, compaction: bool, instructions: str) -> list[tuple[int, float]]:
+    """Ejecuta el agente y devuelve (bytes enviados, segundos) por iteración."""
+    from server.ai.context_compactor import context_compactor
+    from server.services.openai_responses_service import ResponsesAPIService
+    from server.utils.agent_v2 import WorkflowAgent, AgentTool
+
+    context_compactor.enabled = compaction
+    service = ResponsesAPIService(api_key="mock", base_url=base_url)
+    iterations = []
+    create_response = service.create_response
+
+    def timed_create_response(**kwargs):
+        sent = len(
+            json.dumps(
+                {
+                    "input": [
+                        item.model_dump(exclude_none=True) if hasattr(item, "model_dump") else item
+                        for item in kwargs["input_data"]
+                    ],
+                    "instructions": kwargs["instructions"],
+                    "tools": kwargs["tools"],
+                    "previous_response_id": kwargs.get("previous_response_id"),
+                }
+            ).encode("utf-8")
+        )
+        start = time.perf_counter()
+        response = create_response(**kwargs)
+        iterations.append((sent, time.perf_counter() - start))
+        return response
+
+    service.create_response = timed_create_response
+    agent = WorkflowAgent(openai_service=service, model="gpt-4o-mini", max_iterations=1000, chain_responses=chain)
+    tool = AgentTool(
+        name="create_new_markdown_asset",
+        description="Create a new markdown asset",
+        parameters={
+            "type": "object",
+            "properties": {"name": {"type": "string"}, "content": {"type": "string"}},
+            "required": ["name", "content"],
+        },
+    )
+    result = agent.execute(
+        system_instructions=instructions,
+        user_message="Use the following information to execute the workflow.",
+        tools=[tool],
+        tools_fn_map={"create_new_markdown_asset": lambda name, content: "Asset created successfully"},
+    )
+    if result.error:
+        raise RuntimeError(result.error)
+    return iterations
+
+
+def run(turns: int, doc_kb: int, instructions_kb: int, latency: float, upload_mbps: float, prefill_tps: float):
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), make_mock_handler(turns, doc_kb, latency, upload_mbps, prefill_tps)
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    # Las instrucciones de V2 incluyen las plantillas y ejemplos del workflow
+    instructions = ("Instrucciones del workflow y plantillas de ejemplo. " * (instructions_kb * 20))[
+        : instructions_kb * 1024
+    ]
+
+    modes = {
+        "reenvío completo": (False, False),
+        "reenvío + compactación": (False, True),
+        "encadenado": (True, True),
+    }
+    results = {label: run_mode(base_url, *flags, instructions) for label, flags in modes.items()}
+    server.shutdown()
+
+    print(
+        f"Turnos: {turns}  Documento por turno: {doc_kb} KB  Instrucciones: {instructions_kb} KB  "
+        f"Latencia base: {latency}s  Subida: {upload_mbps} Mbps  Prefill: {prefill_tps or '-'} tok/s"
+    )
+    rows = []
+    for i in range(max(len(r) for r in results.values())):
+        row = [i + 1]
+        for iterations in results.values():
+            sent, seconds = iterations[i] if i < len(iterations) else (0, 0)
+            row += [f"{sent / 1024:.1f}", f"{seconds * 1000:.0f}"]
+        rows.append(row)
+    headers = ["iteración"]
+    for label in results:
+        headers += [f"{label} KB", f"{label} ms"]
+    print(tabulate(rows, headers=headers, tablefmt="psql"))
+
+    print(
+        tabulate(
+            [
+                [
+                    label,
+                    len(iterations),
+                    f"{sum(s for s, _ in iterations) / 1024:.1f}",
+                    f"{sum(t for _, t in iterations) / len(iterations) * 1000:.0f}",
+                    f"{sum(t for _, t in iterations):.2f}",
+                ]
+                for label, iterations in results.items()
+            ],
+            headers=["modo", "iteraciones", "KB enviados", "ms por iteración", "segundos totales"],
+            tablefmt="psql",
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--doc-kb", type=int, default=14, help="Tamaño del markdown creado en cada turno")
+    parser.add_argument("--instructions-kb", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="Segundos fijos por respuesta")
+    parser.add_argument("--upload-mbps", type=float, default=10.0)
+    parser.add_argument("--prefill-tps", type=float, default=0, help="Tokens de contexto por segundo (0 = sin simular)")
+    args = parser.parse_args()
+    run(args.turns, args.doc_kb, args.instructions_kb, args.latency, args.upload_mbps, args.prefill_tps)
@@ -0,0 +1,189 @@
+"""
+Benchmark del modo recuperación: cómo escala el prompt con el tamaño del caso.
+
+Genera casos sintéticos de distintos tamaños con hechos plantados (montos y
+fechas por expediente) y compara, para cada tamaño, los tokens del prompt con
+todos los assets pegados contra el prompt de recuperación (resumen de cada
+asset + los resultados de una búsqueda). También mide el tiempo de indexar,
+la latencia de search_case_documents y si la búsqueda encuentra el hecho
+plantado (recall@k, solo con --embedding default).
+
+Por defecto usa un Chroma en memoria. --embedding default usa el modelo de
+embeddings de Chroma (lo descarga la primera vez); --embedding hashing usa
+un embedding léxico local que no necesita red y sirve para medir el costo
+de indexar y buscar, no la calidad semántica.
+
+Uso:
+    python benchmarks/retrieval_scaling.py --sizes 20000 100000 500000 2000000
+    python benchmarks/retrieval_scaling.py --chroma server --embedding default
+"""
+
+import os
+import sys
+import time
+import random
+import hashlib
+import argparse
+import statistics
+from types import SimpleNamespace
+
+import numpy as np
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FILLER = [
+    "El demandado manifestó que no reconoce la deuda reclamada en la presente causa.",
+    "Se deja constancia de que las partes comparecieron debidamente representadas.",
+    "La audiencia se suspendió por la falta de notificación al tercero interesado.",
+    "El perito presentó su informe dentro del plazo concedido por el juzgado.",
+    "Se adjuntan copias certificadas de los contratos y de los comprobantes de pago.",
+    "La parte actora solicitó la práctica de nuevas pruebas testimoniales.",
+]
+MONTHS = ["enero", "febrero", "marzo", "abril", "mayo", "junio", "julio", "agosto"]
+DOCUMENT_CHARS = 50000
+
+
+class HashingEmbeddingFunction:
+    """Embedding léxico (bolsa de palabras con hashing) para medir sin descargar modelos."""
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            vector = np.zeros(self.dimensions, dtype=np.float32)
+            for word in text.lower().split():
+                digest = hashlib.md5(word.strip(".,;:¿?").encode("utf-8")).digest()
+                vector[int.from_bytes(digest[:4], "little") % self.dimensions] += 1
+            norm = np.linalg.norm(vector)
+            vectors.append(vector / norm if norm else vector)
+        return vectors
+
+    @staticmethod
+    def name() -> str:
+        return "hashing"
+
+    def is_legacy(self) -> bool:
+        return True
+
+
+def make_case(total_chars: int, seed: int = 0) -> tuple[list, list[tuple[str, str]]]:
+    """Assets del caso y pares (consulta, respuesta esperada) de los hechos plantados."""
+    rng = random.Random(seed)
+    assets = []
+    facts = []
+    n_documents = max(1, total_chars // DOCUMENT_CHARS)
+    for d in range(n_documents):
+        sentences = []
+        size = 0
+        while size < total_chars // n_documents:
+            if rng.random() < 0.02:
+                case_number = f"{d}-{len(facts)}"
+                amount = f"{rng.randint(1000, 999999)}"
+                sentences.append(
+                    f"En el expediente {case_number} el monto reclamado asciende a {amount} pesos "
+                    f"y la audiencia fue el {rng.randint(1, 28)} de {rng.choice(MONTHS)}."
+                )
+                facts.append((f"monto reclamado en el expediente {case_number}", amount))
+            else:
+                sentences.append(rng.choice(FILLER))
+            size += len(sentences[-1]) + 1
+        assets.append(
+            SimpleNamespace(
+                id=f"bench-{total_chars}-{d}",
+                name=f"documento_{d + 1}.pdf",
+                brief=None,
+                content=" ".join(sentences),
+            )
+        )
+    return assets, facts
+
+
+def run(sizes: list[int], chroma_mode: str, embedding: str, queries: int):
+    from server.ai.vector_store import ChromaManager, get_chroma_client
+    from server.ai.context_compactor import count_text_tokens
+    from server.utils import case_retrieval
+
+    embedding_function = HashingEmbeddingFunction() if embedding == "hashing" else None
+    if chroma_mode == "local":
+        import chromadb
+
+        get_chroma_client._client = ChromaManager(
+            client=chromadb.EphemeralClient(), embedding_function=embedding_function
+        )
+    else:
+        get_chroma_client._client = ChromaManager(embedding_function=embedding_function)
+
+    rows = []
+    for size in sizes:
+        assets, facts = make_case(size)
+        execution_id = f"bench-{size}"
+        inline_text = "\n".join(
+            f'<ASSET name="{a.name}" description="No description">{a.content}</ASSET>' for a in assets
+        )
+
+        start = time.perf_counter()
+        n_chunks = case_retrieval.index_execution_assets(execution_id, assets)
+        index_seconds = time.perf_counter() - start
+
+        summary = case_retrieval.build_assets_summary(assets)
+        latencies = []
+        result_tokens = []
+        hits = 0
+        sample = random.Random(1).sample(facts, min(queries, len(facts)))
+        for query, expected in sample:
+            start = time.perf_counter()
+            result = case_retrieval.search_execution_index(execution_id, query)
+            latencies.append(time.perf_counter() - start)
+            result_tokens.append(count_text_tokens(result))
+            hits += expected in result
+        case_retrieval.delete_execution_index(execution_id)
+
+        rows.append(
+            [
+                f"{size / 1000:.0f}K",
+                len(assets),
+                n_chunks,
+                count_text_tokens(inline_text),
+                count_text_tokens(summary),
+                f"{statistics.mean(result_tokens):.0f}" if result_tokens else "-",
+                f"{index_seconds:.2f}",
+                f"{statistics.median(latencies) * 1000:.0f}" if latencies else "-",
+                # Con el embedding léxico el recall no dice nada de la calidad real
+                f"{hits / len(sample) * 100:.0f}%" if sample and embedding == "default" else "-",
+            ]
+        )
+
+    print(
+        f"Chroma: {chroma_mode}  Embedding: {embedding}  Chunks de {case_retrieval.RETRIEVAL_CHUNK_WORDS} "
+        f"palabras, k={case_retrieval.RETRIEVAL_RESULTS}"
+    )
+    print(
+        tabulate(
+            rows,
+            headers=[
+                "caracteres",
+                "assets",
+                "chunks",
+                "tokens inline",
+                "tokens resumen",
+                "tokens por búsqueda",
+                "indexar (s)",
+                "búsqueda (ms)",
+                f"recall@{case_retrieval.RETRIEVAL_RESULTS}",
+            ],
+            tablefmt="psql",
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 100000, 500000, 2000000])
+    parser.add_argument("--chroma", choices=["local", "server"], default="local")
+    parser.add_argument("--embedding", choices=["default", "hashing"], default="hashing")
+    parser.add_argument("--queries", type=int, default=20, help="Hechos plantados a buscar por tamaño")
+    args = parser.parse_args()
+    run(args.sizes, args.chroma, args.embedding, args.queries)
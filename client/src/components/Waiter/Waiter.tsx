@@ -16,12 +16,23 @@ export type Asset = {
   extracted_text: string;
 };
 
+// Texto que el agente está generando, recibido en fragmentos por streaming
+type Draft = {
+  id: string;
+  kind: "message" | "document";
+  name: string | null;
+  text: string;
+};
+
+const DRAFT_PREVIEW_CHARS = 800;
+
 export const Waiter = ({ executionId, onFinish }: WaiterProps) => {
   const logsContainerRef = useRef<HTMLDivElement>(null);
   const [logs, setLogs] = useState<string[]>([
     "Archivos recibidos",
     "Leyendo archivos",
   ]);
+  const [draft, setDraft] = useState<Draft | null>(null);
   // const [assets, setAssets] = useState<Asset[]>([]);
   const { user } = useAuthStore();
 
@@ -63,6 +74,17 @@ export const Waiter = ({ executionId, onFinish }: WaiterProps) => {
     });
 
     socket.on(`workflow_update`, (data: any) => {
+      if (data.stream) {
+        const { id, kind, name, offset, text } = data.stream;
+        setDraft((prev) => {
+          const current =
+            prev && prev.id === id ? prev : { id, kind, name, text: "" };
+          // Un fragmento que no continúa el texto recibido (p. ej. tras reconectar) se ignora
+          if (offset !== current.text.length) return current;
+          return { ...current, name: name ?? current.name, text: current.text + text };
+        });
+        return;
+      }
       console.log("workflow updated", data);
       if (data.log) {
         setLogs((prevLogs) => [...prevLogs, data.log]);
@@ -122,6 +144,19 @@ export const Waiter = ({ executionId, onFinish }: WaiterProps) => {
             </div>
           ))}
         </div>
+
+        {draft && (
+          <div className="text-left border border-gray-200 rounded-lg p-2">
+            <h5 className="text-sm font-bold text-gray-700 mb-1">
+              {draft.kind === "document"
+                ? `Escribiendo ${draft.name ?? "documento"}...`
+                : "El agente está escribiendo..."}
+            </h5>
+            <pre className="text-xs text-gray-500 whitespace-pre-wrap max-h-48 overflow-y-auto">
+              {draft.text.slice(-DRAFT_PREVIEW_CHARS)}
+            </pre>
+          </div>
+        )}
       </div>
     </div>
   );
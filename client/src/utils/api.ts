@@ -349,6 +349,10 @@ export const rerunWorkflowExecution = async (
   }
 };
 
+// Consulta del estado de las conversiones largas (PDF)
+const CONVERSION_POLL_INTERVAL_MS = 2000;
+const CONVERSION_MAX_WAIT_MS = 10 * 60 * 1000;
+
 export const convertAsset = async (
   assetId: string,
   userEmail: string,
@@ -368,8 +372,26 @@ export const convertAsset = async (
       }
     );
 
-    console.log(response.data, "response");
-    return response.data;
+    // Las conversiones largas (PDF) responden 202 y se consulta el estado.
+    // Una conversión fallida responde 500, que axios rechaza y llega al catch.
+    let data = response.data;
+    const deadline = Date.now() + CONVERSION_MAX_WAIT_MS;
+    while (data.status !== "DONE") {
+      if (Date.now() > deadline) {
+        throw new Error("La conversión tardó demasiado");
+      }
+      await new Promise((resolve) =>
+        setTimeout(resolve, CONVERSION_POLL_INTERVAL_MS)
+      );
+      data = (
+        await axios.get(`${API_URL}${data.status_url}`, {
+          headers: { "x-user-email": userEmail },
+        })
+      ).data;
+    }
+
+    console.log(data, "response");
+    return data;
   } catch (error) {
     console.error("Error al convertir el asset:", error);
     throw new Error("Hubo un error al convertir el asset");
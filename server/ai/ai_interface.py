@@ -2,13 +2,179 @@ import os
 
 import inspect
 import json
+import time
+import uuid
+import threading
+from dataclasses import dataclass
+from typing import Callable
 
+import httpx
 from ollama import Client
 from ..utils.printer import Printer
-from openai import OpenAI
+from .context_compactor import context_compactor, count_tokens
+from .rate_limiter import rate_limiter
+from .response_cache import llm_response_cache
+from .tool_executor import execute_tool_calls
+from openai import OpenAI, APITimeoutError
+from openai.types.chat import ChatCompletion
 
 printer = Printer("AI INTERFACE")
 
+# Política de conexión de los clientes de proveedores. La generación de un
+# documento largo puede tardar minutos, por eso el timeout de lectura es amplio
+# y el de conexión corto: un proveedor caído falla rápido.
+AI_HTTP_MAX_CONNECTIONS = int(os.getenv("AI_HTTP_MAX_CONNECTIONS", 20))
+AI_HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("AI_HTTP_MAX_KEEPALIVE_CONNECTIONS", 10))
+AI_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("AI_HTTP_KEEPALIVE_EXPIRY", 60))
+AI_CONNECT_TIMEOUT = float(os.getenv("AI_CONNECT_TIMEOUT", 10))
+AI_READ_TIMEOUT = float(os.getenv("AI_READ_TIMEOUT", 600))
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", 2))
+
+# Límites del agent loop: turnos con tools, tokens totales (prompt + respuesta,
+# sumados en todos los turnos) y tiempo de reloj desde que empieza el loop.
+AGENT_MAX_TURNS = int(os.getenv("AGENT_MAX_TURNS", 25))
+AGENT_MAX_TOKENS = int(os.getenv("AGENT_MAX_TOKENS", 500000))
+AGENT_DEADLINE_SECONDS = float(os.getenv("AGENT_DEADLINE_SECONDS", 1800))
+
+# Ollama: tiempo que el modelo queda cargado en memoria después de cada llamada
+# ("30m", "-1" = siempre, "0" = se descarga enseguida). Cargar un modelo grande
+# tarda varios segundos, que se pagarían en cada llamada si se descarga.
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Ventana de contexto en tokens. Si cambia entre llamadas Ollama recarga el modelo.
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", os.getenv("CONTEXT_WINDOW_SIZE", 20000)))
+# Hilos de CPU para la inferencia (0 = los que elija Ollama)
+OLLAMA_NUM_THREAD = int(os.getenv("OLLAMA_NUM_THREAD", 0))
+
+
+@dataclass
+class AgentLoopResult:
+    # "completed", "max_turns", "token_budget" o "deadline"
+    stop_reason: str
+    turns: int
+    total_tokens: int
+    elapsed_seconds: float
+
+    @property
+    def completed(self) -> bool:
+        return self.stop_reason == "completed"
+
+    def describe(self) -> str:
+        reasons = {
+            "completed": "El agente terminó",
+            "max_turns": "El agente se detuvo al alcanzar el máximo de turnos",
+            "token_budget": "El agente se detuvo al agotar el presupuesto de tokens",
+            "deadline": "El agente se detuvo al alcanzar el tiempo máximo",
+        }
+        return (
+            f"{reasons[self.stop_reason]} ({self.turns} turnos, "
+            f"{self.total_tokens} tokens, {self.elapsed_seconds:.0f}s)."
+        )
+
+
+@dataclass
+class StreamDelta:
+    """Fragmento de una respuesta en streaming que se pasa a on_delta."""
+
+    # "content" (texto del mensaje), "tool_arguments" o "done" (terminó la respuesta)
+    kind: str
+    text: str = ""
+    # Posición de la tool call dentro de la respuesta
+    index: int = 0
+    tool_name: str | None = None
+    # Argumentos de la tool call acumulados hasta este fragmento
+    arguments: str = ""
+
+
+def replay_stream(response: ChatCompletion, on_delta: callable):
+    """Pasa a on_delta una respuesta ya completa (del cache) como si llegara en streaming."""
+    message = response.choices[0].message
+    if message.content:
+        on_delta(StreamDelta(kind="content", text=message.content))
+    for i, tool_call in enumerate(message.tool_calls or []):
+        on_delta(
+            StreamDelta(
+                kind="tool_arguments",
+                text=tool_call.function.arguments,
+                index=i,
+                tool_name=tool_call.function.name,
+                arguments=tool_call.function.arguments,
+            )
+        )
+    on_delta(StreamDelta(kind="done"))
+
+
+def build_http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=AI_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=AI_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=AI_HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def build_http_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        AI_READ_TIMEOUT,
+        connect=AI_CONNECT_TIMEOUT,
+        pool=AI_CONNECT_TIMEOUT,
+    )
+
+
+class ProviderClientRegistry:
+    """
+    Clientes HTTP de los proveedores compartidos por todo el proceso, uno por
+    (proveedor, api_key, base_url). Cada AIInterface, lector y procesador
+    reutiliza el mismo pool de conexiones keep-alive en vez de abrir
+    conexiones y handshakes TLS nuevos en cada llamada. Los clientes son
+    thread-safe; tras un fork (workers prefork de Celery) se crean de nuevo.
+    """
+
+    def __init__(self):
+        self.clients: dict[tuple, OpenAI | Client] = {}
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def _get(self, key: tuple, factory: callable):
+        if self.pid != os.getpid():
+            # Las conexiones del proceso padre no se comparten con el hijo
+            self.clients = {}
+            self.lock = threading.Lock()
+            self.pid = os.getpid()
+        client = self.clients.get(key)
+        if client is not None:
+            return client
+        with self.lock:
+            if key not in self.clients:
+                self.clients[key] = factory()
+        return self.clients[key]
+
+    def openai(self, api_key: str, base_url: str | None = None, max_retries: int = AI_MAX_RETRIES) -> OpenAI:
+        def factory():
+            printer.blue(f"Creando cliente OpenAI compartido para {base_url or 'api.openai.com'}")
+            return OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                max_retries=max_retries,
+                timeout=build_http_timeout(),
+                http_client=httpx.Client(
+                    limits=build_http_limits(),
+                    timeout=build_http_timeout(),
+                    # Los 429 (también los que el SDK reintenta solo) ajustan el rate limiter
+                    event_hooks={"response": [rate_limiter.on_http_response]},
+                ),
+            )
+
+        return self._get(("openai", api_key, base_url, max_retries), factory)
+
+    def ollama(self, host: str | None = None) -> Client:
+        def factory():
+            printer.blue(f"Creando cliente Ollama compartido para {host or 'localhost'}")
+            return Client(host=host, timeout=build_http_timeout(), limits=build_http_limits())
+
+        return self._get(("ollama", host), factory)
+
+
+provider_clients = ProviderClientRegistry()
+
 
 # def check_ollama_installation() -> dict:
 #     result = {
@@ -46,74 +212,33 @@ printer = Printer("AI INTERFACE")
 #     return result
 
 
-class OllamaProvider:
-    def __init__(self):
-        self.client = Client()
-
-    def check_model(self, model: str = "gemma3:1b"):
-        """Verifica si el modelo está disponible; si no, lo descarga."""
-        model_list = self.client.list()
-        available = [m.model for m in model_list.models]
-        if model not in available:
-            print(f"Modelo '{model}' no encontrado. Descargando...")
-            self.client.pull(model)
-        else:
-            print(f"Modelo '{model}' disponible.")
-
-    def embed(self, text: str, model: str = "nomic-embed-text"):
-        return self.client.embed(model=model, input=text)
-
-    def chat(
-        self,
-        messages: list[dict],
-        model: str = "gemma3:1b",
-        stream: bool = False,
-        tools: list[dict] | list[callable] = [],
-    ):
-        # self.check_model(model)
-        context_window_size = int(os.getenv("CONTEXT_WINDOW_SIZE", 20000))
-
-        response = self.client.chat(
-            model=model,
-            messages=messages,
-            tools=tools,
-            stream=stream,
-            options={
-                "num_ctx": context_window_size
-                # "num_keep": 15,
-                # "num_thread": 10,
-                # "temperature": 0.8,
-            },
-        )
-        return response.message.content
-
+class ChatProvider:
+    """
+    Base de los proveedores de chat. Cada uno implementa chat() devolviendo un
+    ChatCompletion (formato de OpenAI, también con streaming), y sobre eso
+    todos comparten el agent loop.
+    """
 
-class OpenAIProvider:
     messages: list[dict] = []
 
-    def __init__(self, api_key: str, base_url: str = None):
-        printer.blue(f"Using OpenAI base URL: {base_url}")
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+    def cache_identity(self) -> str:
+        """Lo que, además de la petición, cambia la respuesta (para LLMResponseCache)."""
+        raise NotImplementedError
 
-    def check_model(self, model: str):
-        return True
+    def check_health(self, timeout: float | None = None):
+        """Lanza una excepción si el servidor no responde (health checks del balanceador)."""
+        raise NotImplementedError
 
     def chat(
         self,
         messages: list[dict],
-        model: str = "gpt-4o-mini",
+        model: str,
         stream: bool = False,
         tools: list[dict] | list[callable] = [],
-    ):
-        printer.blue(f"Generando respuesta con el modelo: {model}")
-        response = self.client.chat.completions.create(
-            model=model,
-            messages=messages,
-            tools=tools,
-            stream=stream,
-        )
-
-        return response
+        timeout: float | None = None,
+        on_delta: callable = None,
+    ) -> ChatCompletion:
+        raise NotImplementedError
 
     def agent_loop(
         self,
@@ -122,23 +247,67 @@ class OpenAIProvider:
         tools: list[dict] | list[callable] = [],
         tools_fn_map: dict = None,
         on_message: callable = None,
-    ):
+        on_turn: callable = None,
+        on_delta: callable = None,
+        max_turns: int = AGENT_MAX_TURNS,
+        max_tokens: int = AGENT_MAX_TOKENS,
+        deadline_seconds: float = AGENT_DEADLINE_SECONDS,
+    ) -> AgentLoopResult:
         """
-        Ejecuta un ciclo function-calling hasta que no haya tool_calls.
-        Llama a on_message(response) en cada iteración.
+        Ejecuta un ciclo function-calling hasta que no haya tool_calls o se
+        alcance alguno de los límites (turnos, tokens totales según el usage
+        de cada respuesta, o tiempo). Antes de cada llamada la conversación se
+        compacta (ver ContextCompactor). Llama a on_message(response) en cada
+        iteración y on_turn(messages) al terminar cada turno con tools, para
+        poder guardar la conversación. Con on_delta las respuestas se piden en
+        streaming y cada fragmento se pasa a on_delta(StreamDelta).
         """
         self.messages = messages.copy() if messages else self.messages.copy()
         turns = 0
+        total_tokens = 0
+        start = time.monotonic()
+        deadline = start + deadline_seconds
+
+        def stop(stop_reason: str) -> AgentLoopResult:
+            loop_result = AgentLoopResult(
+                stop_reason=stop_reason,
+                turns=turns,
+                total_tokens=total_tokens,
+                elapsed_seconds=time.monotonic() - start,
+            )
+            log = printer.green if loop_result.completed else printer.yellow
+            log(loop_result.describe())
+            return loop_result
 
         while True:
-            # printer.yellow(self.messages, "MESSAGES")
-            response = self.chat(
-                messages=self.messages,
-                model=model,
-                stream=False,
-                tools=tools,
-            )
+            if turns >= max_turns:
+                return stop("max_turns")
+            if total_tokens >= max_tokens:
+                return stop("token_budget")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return stop("deadline")
+
+            # Los argumentos y resultados de turnos viejos se reemplazan por referencias cortas
+            self.messages = context_compactor.compact(self.messages, model)
+            try:
+                response = self.chat(
+                    messages=self.messages,
+                    model=model,
+                    stream=False,
+                    tools=tools,
+                    # Una sola respuesta lenta no puede pasarse del deadline
+                    timeout=remaining,
+                    on_delta=on_delta,
+                )
+            except (httpx.TimeoutException, APITimeoutError):
+                if time.monotonic() >= deadline:
+                    return stop("deadline")
+                raise
             # printer.yellow(response.choices[0].message, "RESPONSE")
+            usage = getattr(response, "usage", None)
+            if usage and usage.total_tokens:
+                total_tokens += usage.total_tokens
 
             # OpenAI: response.choices[0].message
             if hasattr(response, "choices"):
@@ -156,25 +325,34 @@ class OpenAIProvider:
                             "tool_calls": [tc.model_dump() for tc in tool_calls],
                         }
                     )
-                    # Ejecuta tools
+                    # Ejecuta tools (las thread-safe en paralelo) y agrega los
+                    # resultados en el orden de las llamadas
+                    calls = []
                     for tool_call in tool_calls:
                         tool_name = tool_call.function.name
                         args = json.loads(tool_call.function.arguments)
-                        # Ejecuta función local si está en el mapa
                         if tools_fn_map and tool_name in tools_fn_map:
-                            result = tools_fn_map[tool_name](**args)
+                            calls.append((tools_fn_map[tool_name], args))
                         else:
-                            result = f"Function {tool_name} not implemented."
+                            calls.append(
+                                (lambda name=tool_name: f"Function {name} not implemented.", {})
+                            )
+                    results = execute_tool_calls(calls)
+                    for tool_call, tool_result in zip(tool_calls, results):
+                        if tool_result.error:
+                            raise tool_result.error
                         # Mensaje de tool
                         self.messages.append(
                             {
                                 "role": "tool",
                                 "tool_call_id": tool_call.id,
-                                "content": str(result),
+                                "content": str(tool_result.output),
                             }
                         )
                     # Sigue el loop (nuevo turno)
                     turns += 1
+                    if on_turn:
+                        on_turn(self.messages)
                     continue
                 else:
                     # Final, no hay tool_calls
@@ -186,13 +364,346 @@ class OpenAIProvider:
                     )
                     if on_message:
                         on_message(msg)
-                    break
+                    return stop("completed")
+
+
+
+def parse_keep_alive(value: str) -> float | str:
+    """Ollama acepta segundos (número, -1 = siempre) o una duración como "30m"."""
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def to_ollama_message(message: dict) -> dict:
+    """
+    Convierte un mensaje en formato de OpenAI al de Ollama: el contenido con
+    partes se une en texto y las imágenes (data URIs) pasan a `images` en
+    base64; los argumentos de las tool calls pasan de JSON a dict.
+    """
+    converted = {"role": message["role"], "content": message.get("content") or ""}
+    if isinstance(converted["content"], list):
+        texts = []
+        images = []
+        for part in converted["content"]:
+            if part.get("type") == "text":
+                texts.append(part["text"])
+            elif part.get("type") == "image_url":
+                url = part["image_url"]["url"]
+                images.append(url.split(",", 1)[1] if url.startswith("data:") else url)
+        converted["content"] = "\n".join(texts)
+        if images:
+            converted["images"] = images
+    if message.get("images"):
+        converted["images"] = message["images"]
+    if message.get("tool_calls"):
+        converted["tool_calls"] = [
+            {
+                "function": {
+                    "name": tool_call["function"]["name"],
+                    "arguments": (
+                        json.loads(tool_call["function"]["arguments"] or "{}")
+                        if isinstance(tool_call["function"]["arguments"], str)
+                        else tool_call["function"]["arguments"]
+                    ),
+                }
+            }
+            for tool_call in message["tool_calls"]
+        ]
+    return converted
+
+
+def to_ollama_tool(tool: dict | Callable) -> dict | Callable:
+    """Ollama no conoce "strict" ni otros campos propios de OpenAI."""
+    if callable(tool):
+        return tool
+    function = tool["function"]
+    return {
+        "type": "function",
+        "function": {
+            "name": function["name"],
+            "description": function.get("description", ""),
+            "parameters": function.get("parameters", {}),
+        },
+    }
+
+
+class OllamaProvider(ChatProvider):
+    """
+    Proveedor para modelos locales con Ollama (instalaciones sin acceso a
+    internet). Recibe y devuelve los mensajes en el formato de OpenAI, así
+    los lectores y el agent loop funcionan igual con ambos proveedores.
+    """
+
+    def __init__(self):
+        self.host = os.getenv("OLLAMA_HOST")
+        self.client = provider_clients.ollama(self.host)
+
+    def cache_identity(self) -> str:
+        # num_ctx cambia qué parte del prompt ve el modelo
+        return f"ollama:{self.host or 'localhost'}:{OLLAMA_NUM_CTX}"
+
+    def check_health(self, timeout: float | None = None):
+        self.client.ps()
+
+    def check_model(self, model: str = "gemma3:1b"):
+        """Verifica si el modelo está disponible; si no, lo descarga."""
+        model_list = self.client.list()
+        available = [m.model for m in model_list.models]
+        if model not in available:
+            print(f"Modelo '{model}' no encontrado. Descargando...")
+            self.client.pull(model)
+        else:
+            print(f"Modelo '{model}' disponible.")
+
+    def embed(self, text: str, model: str = "nomic-embed-text"):
+        return self.client.embed(
+            model=model, input=text, keep_alive=parse_keep_alive(OLLAMA_KEEP_ALIVE)
+        )
+
+    def get_options(self) -> dict:
+        options = {"num_ctx": OLLAMA_NUM_CTX}
+        if OLLAMA_NUM_THREAD:
+            options["num_thread"] = OLLAMA_NUM_THREAD
+        return options
+
+    def chat(
+        self,
+        messages: list[dict],
+        model: str = "gemma3:1b",
+        stream: bool = False,
+        tools: list[dict] | list[callable] = [],
+        timeout: float | None = None,
+        on_delta: callable = None,
+    ) -> ChatCompletion:
+        """
+        Devuelve un ChatCompletion como OpenAIProvider.chat, también con
+        streaming (on_delta). Ollama manda cada tool call completa en un solo
+        fragmento. El cliente de Ollama no acepta un timeout por llamada: se
+        usa AI_READ_TIMEOUT y el deadline del agent loop se revisa entre turnos.
+        """
+        printer.blue(f"Generando respuesta con el modelo de Ollama: {model}")
+        response = self.client.chat(
+            model=model,
+            messages=[to_ollama_message(message) for message in messages],
+            tools=[to_ollama_tool(tool) for tool in tools or []],
+            stream=stream or on_delta is not None,
+            options=self.get_options(),
+            keep_alive=parse_keep_alive(OLLAMA_KEEP_ALIVE),
+        )
+        if not (stream or on_delta is not None):
+            return self.to_chat_completion(
+                model, response.message.content, response.message.tool_calls, response
+            )
+
+        content = []
+        tool_calls = []
+        last_chunk = None
+        for chunk in response:
+            last_chunk = chunk
+            if chunk.message.content:
+                content.append(chunk.message.content)
+                if on_delta:
+                    on_delta(StreamDelta(kind="content", text=chunk.message.content))
+            for tool_call in chunk.message.tool_calls or []:
+                tool_calls.append(tool_call)
+                if on_delta:
+                    arguments = json.dumps(tool_call.function.arguments, ensure_ascii=False)
+                    on_delta(
+                        StreamDelta(
+                            kind="tool_arguments",
+                            text=arguments,
+                            index=len(tool_calls) - 1,
+                            tool_name=tool_call.function.name,
+                            arguments=arguments,
+                        )
+                    )
+        if on_delta:
+            on_delta(StreamDelta(kind="done"))
+        return self.to_chat_completion(model, "".join(content), tool_calls, last_chunk)
+
+    def to_chat_completion(self, model: str, content: str | None, tool_calls: list, final) -> ChatCompletion:
+        """Arma la respuesta de OpenAI; el uso sale de los contadores del último fragmento."""
+        prompt_tokens = (final.prompt_eval_count or 0) if final else 0
+        completion_tokens = (final.eval_count or 0) if final else 0
+        if tool_calls:
+            finish_reason = "tool_calls"
+        elif final and final.done_reason == "length":
+            finish_reason = "length"
+        else:
+            finish_reason = "stop"
+
+        return ChatCompletion.model_validate(
+            {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": finish_reason,
+                        "message": {
+                            "role": "assistant",
+                            "content": content or None,
+                            "tool_calls": [
+                                {
+                                    "id": f"call_{uuid.uuid4().hex[:24]}",
+                                    "type": "function",
+                                    "function": {
+                                        "name": tool_call.function.name,
+                                        "arguments": json.dumps(
+                                            tool_call.function.arguments, ensure_ascii=False
+                                        ),
+                                    },
+                                }
+                                for tool_call in tool_calls or []
+                            ]
+                            or None,
+                        },
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            }
+        )
+
+
+class OpenAIProvider(ChatProvider):
+    def __init__(self, api_key: str, base_url: str = None, max_retries: int = AI_MAX_RETRIES):
+        printer.blue(f"Using OpenAI base URL: {base_url}")
+        self.base_url = base_url
+        self.client = provider_clients.openai(api_key=api_key, base_url=base_url, max_retries=max_retries)
+
+    def cache_identity(self) -> str:
+        return f"openai:{self.base_url or 'api.openai.com'}"
+
+    def check_health(self, timeout: float | None = None):
+        self.client.models.list(**({"timeout": timeout} if timeout else {}))
+
+    def check_model(self, model: str):
+        return True
+
+    def chat(
+        self,
+        messages: list[dict],
+        model: str = "gpt-4o-mini",
+        stream: bool = False,
+        tools: list[dict] | list[callable] = [],
+        timeout: float | None = None,
+        on_delta: callable = None,
+    ):
+        """
+        Con on_delta la respuesta se pide en streaming: cada fragmento se pasa
+        a on_delta(StreamDelta) y se devuelve el ChatCompletion completo, igual
+        que sin streaming. Con RATE_LIMIT_ENABLED espera su turno en el
+        rate limiter compartido por los workers (ver RateLimiter).
+        """
+        printer.blue(f"Generando respuesta con el modelo: {model}")
+        scope = self.client.base_url.netloc.decode()
+        estimated_tokens = count_tokens(messages, model) if rate_limiter.enabled else 0
+        rate_limiter.acquire(scope, model, estimated_tokens, max_wait=timeout)
+        if on_delta is not None:
+            response = self.stream_chat(messages, model, tools, timeout, on_delta)
+        else:
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                tools=tools,
+                stream=stream,
+                **({"timeout": timeout} if timeout else {}),
+            )
+
+        usage = getattr(response, "usage", None)
+        rate_limiter.record_usage(scope, model, estimated_tokens, usage.total_tokens if usage else None)
+        return response
+
+    def stream_chat(
+        self,
+        messages: list[dict],
+        model: str,
+        tools: list[dict] | list[callable],
+        timeout: float | None,
+        on_delta: callable,
+    ) -> ChatCompletion:
+        stream = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            tools=tools,
+            stream=True,
+            # El uso llega en el último chunk; el agent loop lo necesita para el presupuesto
+            stream_options={"include_usage": True},
+            **({"timeout": timeout} if timeout else {}),
+        )
 
-        return "Agent loop terminated"
+        content = []
+        tool_calls: dict[int, dict] = {}
+        finish_reason = None
+        usage = None
+        last_chunk = None
+        for chunk in stream:
+            last_chunk = chunk
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            finish_reason = choice.finish_reason or finish_reason
+            delta = choice.delta
+            if delta.content:
+                content.append(delta.content)
+                on_delta(StreamDelta(kind="content", text=delta.content))
+            for tool_call_delta in delta.tool_calls or []:
+                tool_call = tool_calls.setdefault(
+                    tool_call_delta.index,
+                    {"id": None, "type": "function", "function": {"name": "", "arguments": ""}},
+                )
+                if tool_call_delta.id:
+                    tool_call["id"] = tool_call_delta.id
+                function = tool_call_delta.function
+                if function and function.name:
+                    tool_call["function"]["name"] += function.name
+                if function and function.arguments:
+                    tool_call["function"]["arguments"] += function.arguments
+                    on_delta(
+                        StreamDelta(
+                            kind="tool_arguments",
+                            text=function.arguments,
+                            index=tool_call_delta.index,
+                            tool_name=tool_call["function"]["name"],
+                            arguments=tool_call["function"]["arguments"],
+                        )
+                    )
+        on_delta(StreamDelta(kind="done"))
+
+        return ChatCompletion.model_validate(
+            {
+                "id": last_chunk.id if last_chunk else "",
+                "object": "chat.completion",
+                "created": last_chunk.created if last_chunk else int(time.time()),
+                "model": last_chunk.model if last_chunk else model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": finish_reason or "stop",
+                        "message": {
+                            "role": "assistant",
+                            "content": "".join(content) or None,
+                            "tool_calls": [tool_calls[i] for i in sorted(tool_calls)] or None,
+                        },
+                    }
+                ],
+                "usage": usage.model_dump() if usage else None,
+            }
+        )
 
 
 class AIInterface:
-    client: OllamaProvider | OpenAIProvider | None = None
+    client: ChatProvider | None = None
 
     def __init__(
         self,
@@ -204,7 +715,13 @@ class AIInterface:
         if provider == "ollama":
             self.client = OllamaProvider()
         elif provider == "openai":
-            self.client = OpenAIProvider(api_key=api_key, base_url=base_url)
+            from .load_balancer import LoadBalancedProvider, is_balanced
+
+            if is_balanced(base_url):
+                # Varios backends en PROVIDER_BASE_URL (ver load_balancer.py)
+                self.client = LoadBalancedProvider(api_key=api_key, base_url=base_url)
+            else:
+                self.client = OpenAIProvider(api_key=api_key, base_url=base_url)
         else:
             raise ValueError(f"Provider {provider} not supported")
 
@@ -219,13 +736,33 @@ class AIInterface:
         model: str | None = None,
         stream: bool = False,
         tools: list[dict] | list[callable] = [],
+        on_delta: callable = None,
     ):
-        return self.client.chat(
-            model=model,
-            messages=messages,
-            tools=tools,
-            stream=stream,
-        )
+        """
+        Con LLM_CACHE_ENABLED las peticiones idénticas se responden desde el
+        cache y las que están en curso al mismo tiempo se juntan en una (ver
+        LLMResponseCache). Con stream=True no se usa el cache.
+        """
+
+        def create():
+            return self.client.chat(
+                model=model,
+                messages=messages,
+                tools=tools,
+                stream=stream,
+                on_delta=on_delta,
+            )
+
+        if stream or not llm_response_cache.enabled:
+            return create()
+
+        key = llm_response_cache.build_key(self.client.cache_identity(), model, messages, tools)
+        response, source = llm_response_cache.get_or_create(key, create)
+        if source != "miss":
+            printer.green(f"Respuesta del modelo {model} reutilizada ({source})")
+            if on_delta is not None:
+                replay_stream(response, on_delta)
+        return response
 
     def agent_loop(
         self,
@@ -234,13 +771,20 @@ class AIInterface:
         tools: list[dict] | list[callable] = [],
         tools_fn_map: dict = None,
         on_message: callable = None,
-    ):
+        on_turn: callable = None,
+        on_delta: callable = None,
+        **limits,
+    ) -> AgentLoopResult:
+        """limits: max_turns, max_tokens y deadline_seconds (ver ChatProvider.agent_loop)."""
         return self.client.agent_loop(
             messages=messages,
             model=model,
             tools=tools,
             tools_fn_map=tools_fn_map,
             on_message=on_message,
+            on_turn=on_turn,
+            on_delta=on_delta,
+            **limits,
         )
 
     def check_model(self, model: str):
@@ -0,0 +1,346 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import tiktoken
+
+from server.utils.printer import Printer
+
+printer = Printer("CONTEXT")
+
+CONTEXT_COMPACTION_ENABLED = os.getenv("CONTEXT_COMPACTION_ENABLED", "true").lower() == "true"
+# Tamaño objetivo del prompt (instrucciones + mensajes) que se envía en cada turno
+CONTEXT_TARGET_TOKENS = int(os.getenv("CONTEXT_TARGET_TOKENS", 60000))
+# Las últimas N llamadas a tools se envían completas; las anteriores se compactan
+CONTEXT_KEEP_RECENT_CALLS = int(os.getenv("CONTEXT_KEEP_RECENT_CALLS", 4))
+CONTEXT_MAX_ARGUMENT_CHARS = int(os.getenv("CONTEXT_MAX_ARGUMENT_CHARS", 1500))
+CONTEXT_MAX_TOOL_RESULT_CHARS = int(os.getenv("CONTEXT_MAX_TOOL_RESULT_CHARS", 2000))
+
+# Encoding para modelos que tiktoken no conoce (Ollama, modelos compatibles)
+DEFAULT_ENCODING = "o200k_base"
+TRUNCATED_SUFFIX = "characters truncated]"
+# Tokens que agrega el formato de cada mensaje además de su contenido
+MESSAGE_OVERHEAD_TOKENS = 4
+# Tokens que se cuentan por imagen adjunta (OpenAI cobra de 85 a ~1100 según el tamaño)
+IMAGE_TOKENS = 1000
+IMAGE_PART_TYPES = ("image_url", "input_image")
+# Conteos recordados, por hash del texto: los workers viven mucho y los textos
+# (prompts, salidas de tools) pueden pesar cientos de KB, así que no se guardan
+TOKEN_COUNT_CACHE_SIZE = 2048
+# Encabezado de la nota que reemplaza a las llamadas quitadas del contexto
+DROPPED_CALLS_NOTE = "Earlier tool calls were removed from the context to save space. They already ran:\n"
+
+token_counts: OrderedDict[tuple[bytes, str | None], int] = OrderedDict()
+token_counts_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str | None) -> tiktoken.Encoding | None:
+    """
+    Encoding de tiktoken para el modelo. tiktoken descarga el vocabulario la
+    primera vez (se puede dejar en TIKTOKEN_CACHE_DIR para servidores sin
+    salida a internet); si no está disponible se estima por caracteres.
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model or "")
+        except KeyError:
+            return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        printer.yellow(f"No se pudo cargar el encoding de tiktoken, se estimará por caracteres: {e}")
+        return None
+
+
+def count_text_tokens(text: str, model: str | None = None) -> int:
+    encoding = get_encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+
+    key = (hashlib.sha1(text.encode("utf-8", "surrogatepass")).digest(), model)
+    with token_counts_lock:
+        if key in token_counts:
+            token_counts.move_to_end(key)
+            return token_counts[key]
+    count = len(encoding.encode(text, disallowed_special=()))
+    with token_counts_lock:
+        token_counts[key] = count
+        if len(token_counts) > TOKEN_COUNT_CACHE_SIZE:
+            token_counts.popitem(last=False)
+    return count
+
+
+def count_message_tokens(message, model: str | None = None) -> int:
+    """Cuenta los tokens de todos los textos del mensaje (contenido, argumentos, salidas)."""
+    if isinstance(message, str):
+        return count_text_tokens(message, model)
+    if hasattr(message, "model_dump"):
+        message = message.model_dump(exclude_none=True)
+    if isinstance(message, dict):
+        if message.get("type") in IMAGE_PART_TYPES:
+            # El base64 de la imagen no son tokens de texto
+            return IMAGE_TOKENS
+        return MESSAGE_OVERHEAD_TOKENS + sum(
+            count_message_tokens(value, model) for value in message.values()
+        )
+    if isinstance(message, list):
+        return sum(count_message_tokens(item, model) for item in message)
+    return 0
+
+
+def count_tokens(messages: list[dict], model: str | None = None, instructions: str = "") -> int:
+    return count_text_tokens(instructions, model) + sum(
+        count_message_tokens(message, model) for message in messages
+    )
+
+
+def truncate_text(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars or text.endswith(TRUNCATED_SUFFIX):
+        return text
+    return f"{text[:max_chars]}\n[... {len(text) - max_chars} {TRUNCATED_SUFFIX}"
+
+
+def is_dropped_calls_note(message: dict) -> bool:
+    content = message.get("content")
+    return (
+        message.get("role") == "assistant"
+        and isinstance(content, str)
+        and content.startswith(DROPPED_CALLS_NOTE)
+    )
+
+
+def get_call_label(args: dict) -> str | None:
+    """Nombre del asset o documento al que se refiere una llamada, si lo tiene."""
+    for key in ("name", "document_name", "template_id"):
+        if isinstance(args.get(key), str):
+            return args[key]
+    return None
+
+
+def compact_arguments(tool_name: str, arguments: str, max_chars: int) -> str:
+    """
+    Reemplaza los valores largos de los argumentos (por ejemplo el markdown
+    completo de create_new_markdown_asset) por una referencia corta. El
+    resultado sigue siendo JSON válido para que el proveedor lo acepte.
+    """
+    if len(arguments) <= max_chars:
+        return arguments
+    try:
+        args = json.loads(arguments)
+    except (TypeError, ValueError):
+        args = None
+    if not isinstance(args, dict):
+        return json.dumps(
+            {"omitted": f"{len(arguments.encode('utf-8')) / 1024:.1f} KB of arguments sent to {tool_name}"}
+        )
+
+    label = get_call_label(args)
+    target = f" for '{label}'" if label else ""
+    compacted = {}
+    for key, value in args.items():
+        if isinstance(value, str) and len(value) > max_chars // 2:
+            size_kb = len(value.encode("utf-8")) / 1024
+            value = f"[omitted: {size_kb:.1f} KB {key} already sent to {tool_name}{target}]"
+        compacted[key] = value
+    return json.dumps(compacted, ensure_ascii=False)
+
+
+class ContextCompactor:
+    """
+    Compacta la conversación del agente antes de cada turno. Sin esto cada
+    turno reenvía todos los argumentos y resultados anteriores y el costo
+    crece de forma cuadrática con el número de turnos.
+
+    Funciona con los dos formatos de conversación del proyecto: mensajes de
+    Chat Completions (agent loop V1) e items de la Responses API (V2). Las
+    llamadas viejas se compactan siempre; si aun así el prompt supera
+    target_tokens se quitan las llamadas más antiguas completas (llamada y
+    resultado juntos) y se deja un resumen de lo que hicieron. La compactación
+    es idempotente: una llamada ya compactada no vuelve a cambiar, así el
+    prefijo del prompt se mantiene estable entre turnos.
+    """
+
+    def __init__(
+        self,
+        target_tokens: int = CONTEXT_TARGET_TOKENS,
+        keep_recent_calls: int = CONTEXT_KEEP_RECENT_CALLS,
+        max_argument_chars: int = CONTEXT_MAX_ARGUMENT_CHARS,
+        max_tool_result_chars: int = CONTEXT_MAX_TOOL_RESULT_CHARS,
+        enabled: bool = CONTEXT_COMPACTION_ENABLED,
+    ):
+        self.target_tokens = target_tokens
+        self.keep_recent_calls = keep_recent_calls
+        self.max_argument_chars = max_argument_chars
+        self.max_tool_result_chars = max_tool_result_chars
+        self.enabled = enabled
+
+    def get_call_ids(self, messages: list[dict]) -> list[str]:
+        call_ids = []
+        for message in messages:
+            for tool_call in message.get("tool_calls") or []:
+                call_ids.append(tool_call["id"])
+            if message.get("type") == "function_call":
+                call_ids.append(message["call_id"])
+        return call_ids
+
+    def compact_message(self, message: dict, old_call_ids: set[str]) -> dict:
+        """Devuelve el mensaje compactado (una copia) o el mismo si no cambia."""
+        if message.get("tool_calls"):
+            tool_calls = []
+            for tool_call in message["tool_calls"]:
+                if tool_call["id"] in old_call_ids:
+                    function = tool_call["function"]
+                    tool_call = {
+                        **tool_call,
+                        "function": {
+                            **function,
+                            "arguments": compact_arguments(
+                                function["name"], function["arguments"], self.max_argument_chars
+                            ),
+                        },
+                    }
+                tool_calls.append(tool_call)
+            return {**message, "tool_calls": tool_calls}
+
+        if message.get("role") == "tool" and message.get("tool_call_id") in old_call_ids:
+            return {
+                **message,
+                "content": truncate_text(message.get("content") or "", self.max_tool_result_chars),
+            }
+
+        if message.get("type") == "function_call" and message.get("call_id") in old_call_ids:
+            return {
+                **message,
+                "arguments": compact_arguments(
+                    message["name"], message.get("arguments") or "", self.max_argument_chars
+                ),
+            }
+
+        if message.get("type") == "function_call_output" and message.get("call_id") in old_call_ids:
+            return {
+                **message,
+                "output": truncate_text(str(message.get("output", "")), self.max_tool_result_chars),
+            }
+
+        return message
+
+    def summarize_call(self, name: str, arguments: str, output: str | None) -> str:
+        try:
+            label = get_call_label(json.loads(arguments))
+        except (TypeError, ValueError, AttributeError):
+            label = None
+        summary = f"- {name}" + (f" ('{label}')" if label else "")
+        if output:
+            summary += f": {truncate_text(output, 200)}"
+        return summary
+
+    def drop_calls(self, messages: list[dict], call_ids: set[str]) -> tuple[list[dict], list[str]]:
+        """
+        Quita las llamadas indicadas junto con sus resultados. En la Responses
+        API también se quitan los items de reasoning que las precedían, porque
+        la API no acepta un reasoning sin el item que lo sigue. Las notas de
+        compactaciones anteriores también se quitan y sus resúmenes se suman,
+        para que quede una sola nota.
+        """
+        outputs = {}
+        for message in messages:
+            if message.get("role") == "tool":
+                outputs[message.get("tool_call_id")] = message.get("content")
+            elif message.get("type") == "function_call_output":
+                outputs[message.get("call_id")] = str(message.get("output", ""))
+
+        kept = []
+        summaries = []
+        for message in messages:
+            if is_dropped_calls_note(message):
+                summaries.extend(message["content"][len(DROPPED_CALLS_NOTE) :].splitlines())
+                continue
+
+            if message.get("tool_calls"):
+                remaining = []
+                for tool_call in message["tool_calls"]:
+                    if tool_call["id"] in call_ids:
+                        function = tool_call["function"]
+                        summaries.append(
+                            self.summarize_call(
+                                function["name"], function["arguments"], outputs.get(tool_call["id"])
+                            )
+                        )
+                    else:
+                        remaining.append(tool_call)
+                if remaining:
+                    kept.append({**message, "tool_calls": remaining})
+                elif message.get("content"):
+                    kept.append({k: v for k, v in message.items() if k != "tool_calls"})
+                continue
+
+            if message.get("role") == "tool" and message.get("tool_call_id") in call_ids:
+                continue
+
+            if message.get("type") == "function_call" and message.get("call_id") in call_ids:
+                summaries.append(
+                    self.summarize_call(
+                        message["name"], message.get("arguments"), outputs.get(message["call_id"])
+                    )
+                )
+                while kept and kept[-1].get("type") == "reasoning":
+                    kept.pop()
+                continue
+
+            if message.get("type") == "function_call_output" and message.get("call_id") in call_ids:
+                continue
+
+            kept.append(message)
+
+        return kept, summaries
+
+    def compact(
+        self, messages: list[dict], model: str | None = None, instructions: str = ""
+    ) -> list[dict]:
+        """
+        Devuelve una nueva lista de mensajes compactada; no modifica los
+        mensajes recibidos. `instructions` son las instrucciones de sistema
+        que la Responses API recibe aparte y cuentan para el objetivo.
+        """
+        if not self.enabled:
+            return messages
+
+        call_ids = self.get_call_ids(messages)
+        old_call_ids = call_ids[: max(len(call_ids) - self.keep_recent_calls, 0)]
+        old_call_set = set(old_call_ids)
+        compacted = [self.compact_message(message, old_call_set) for message in messages]
+
+        tokens = count_tokens(compacted, model, instructions)
+        if tokens > self.target_tokens and old_call_ids:
+            # Se quitan de a una las llamadas más antiguas hasta entrar en el objetivo
+            to_drop = set()
+            candidate = compacted
+            for call_id in old_call_ids:
+                to_drop.add(call_id)
+                candidate, summaries = self.drop_calls(compacted, to_drop)
+                note = {"role": "assistant", "content": DROPPED_CALLS_NOTE + "\n".join(summaries)}
+                # La nota va donde estaba la primera llamada (o nota) quitada
+                position = next(
+                    (i for i, (a, b) in enumerate(zip(compacted, candidate)) if a is not b),
+                    len(candidate),
+                )
+                candidate = candidate[:position] + [note] + candidate[position:]
+                if count_tokens(candidate, model, instructions) <= self.target_tokens:
+                    break
+            compacted = candidate
+
+        before = count_tokens(messages, model, instructions)
+        after = count_tokens(compacted, model, instructions)
+        if after < before:
+            printer.blue(f"Contexto compactado: {before} -> {after} tokens")
+        if after > self.target_tokens:
+            printer.yellow(
+                f"El prompt sigue en {after} tokens (objetivo {self.target_tokens}); "
+                "las instrucciones y los mensajes recientes no se compactan"
+            )
+        return compacted
+
+
+context_compactor = ContextCompactor()
@@ -0,0 +1,319 @@
+import os
+import time
+import random
+import threading
+from dataclasses import dataclass
+
+import httpx
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+from server.utils.printer import Printer
+from server.ai.ai_interface import ChatProvider, OpenAIProvider, StreamDelta
+
+printer = Printer("LOAD BALANCER")
+
+# Varios servidores compatibles con OpenAI (p. ej. un vLLM por máquina) en
+# PROVIDER_BASE_URL, separados por comas y con un peso opcional después de "|":
+# PROVIDER_BASE_URL=http://10.0.0.1:8009/v1|2,http://10.0.0.2:8009/v1
+LB_HEALTH_CHECK_INTERVAL = float(os.getenv("LB_HEALTH_CHECK_INTERVAL", 15))
+LB_HEALTH_CHECK_TIMEOUT = float(os.getenv("LB_HEALTH_CHECK_TIMEOUT", 5))
+# Errores seguidos (5xx o timeouts) para sacar un backend de la rotación
+LB_FAILURES_TO_EJECT = int(os.getenv("LB_FAILURES_TO_EJECT", 2))
+# Mínimo que un backend queda fuera antes de que el health check pueda reincorporarlo
+LB_EJECT_SECONDS = float(os.getenv("LB_EJECT_SECONDS", 30))
+
+# Errores por los que la llamada se reintenta en otro backend
+FAILOVER_ERRORS = (APIConnectionError, InternalServerError, RateLimitError, httpx.TransportError)
+
+
+def parse_backends(base_url: str) -> list[tuple[str, float]]:
+    """"http://a/v1|2,http://b/v1" -> [("http://a/v1", 2.0), ("http://b/v1", 1.0)]"""
+    backends = []
+    for entry in base_url.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        url, _, weight = entry.partition("|")
+        backends.append((url.strip(), float(weight) if weight else 1.0))
+    return backends
+
+
+def is_balanced(base_url: str | None) -> bool:
+    return bool(base_url) and len(parse_backends(base_url)) > 1
+
+
+@dataclass
+class Backend:
+    base_url: str
+    weight: float
+    provider: ChatProvider
+    # Llamadas en curso desde este proceso
+    outstanding: int = 0
+    healthy: bool = True
+    failures: int = 0
+    ejected_until: float = 0.0
+    last_error: str | None = None
+
+
+class BackendPool:
+    """
+    Estado compartido por todo el proceso de un grupo de backends: llamadas
+    en curso y salud de cada uno. Elige el backend sano con menos llamadas en
+    curso en relación a su peso, saca de la rotación a los que fallan y un
+    hilo los revisa cada LB_HEALTH_CHECK_INTERVAL segundos para volver a
+    incorporarlos (o sacarlos antes de que les llegue tráfico).
+    """
+
+    def __init__(self, api_key: str, base_url: str):
+        self.backends = [
+            Backend(
+                base_url=url,
+                weight=weight,
+                # Sin reintentos del cliente: ante un error se prueba el siguiente backend
+                provider=OpenAIProvider(api_key=api_key, base_url=url, max_retries=0),
+            )
+            for url, weight in parse_backends(base_url)
+        ]
+        self.lock = threading.Lock()
+        self.health_thread: threading.Thread | None = None
+        self.pid = os.getpid()
+
+    def acquire(self, exclude: set[str]) -> Backend | None:
+        self.start_health_checks()
+        with self.lock:
+            candidates = [b for b in self.backends if b.base_url not in exclude]
+            healthy = [b for b in candidates if b.healthy]
+            # Si todos están caídos se intenta igual con los que quedan
+            candidates = healthy or candidates
+            if not candidates:
+                return None
+            best = min((b.outstanding + 1) / b.weight for b in candidates)
+            backend = random.choice(
+                [b for b in candidates if (b.outstanding + 1) / b.weight == best]
+            )
+            backend.outstanding += 1
+            return backend
+
+    def release(self, backend: Backend, error: Exception | None = None):
+        with self.lock:
+            backend.outstanding -= 1
+            if error is None:
+                backend.failures = 0
+                return
+            backend.last_error = str(error)
+            if isinstance(error, RateLimitError):
+                # Está sano pero saturado: solo se prueba otro
+                return
+            backend.failures += 1
+            # Si no acepta conexiones no hace falta esperar a otro error
+            connection_refused = isinstance(error, (APIConnectionError, httpx.TransportError)) and not isinstance(
+                error, (APITimeoutError, httpx.TimeoutException)
+            )
+            if backend.healthy and (connection_refused or backend.failures >= LB_FAILURES_TO_EJECT):
+                self.eject(backend)
+
+    def eject(self, backend: Backend):
+        backend.healthy = False
+        backend.ejected_until = time.monotonic() + LB_EJECT_SECONDS
+        printer.yellow(f"Backend {backend.base_url} fuera de rotación: {backend.last_error}")
+
+    def check_health(self):
+        for backend in self.backends:
+            # El estado lo cambian también las llamadas en curso: se lee con el lock
+            with self.lock:
+                waiting = not backend.healthy and time.monotonic() < backend.ejected_until
+            if waiting:
+                continue
+            try:
+                backend.provider.check_health(timeout=LB_HEALTH_CHECK_TIMEOUT)
+            except Exception as e:
+                with self.lock:
+                    backend.last_error = str(e)
+                    if backend.healthy:
+                        self.eject(backend)
+                    else:
+                        backend.ejected_until = time.monotonic() + LB_EJECT_SECONDS
+                continue
+            with self.lock:
+                if not backend.healthy:
+                    printer.green(f"Backend {backend.base_url} de nuevo en rotación")
+                backend.healthy = True
+                backend.failures = 0
+
+    def start_health_checks(self):
+        # El hilo no sobrevive al fork de los workers prefork: cada proceso tiene el suyo
+        if self.health_thread is not None and self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.health_thread is not None and self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.health_thread = threading.Thread(
+                target=self.run_health_checks, name="llm-health-checks", daemon=True
+            )
+            self.health_thread.start()
+
+    def run_health_checks(self):
+        while True:
+            time.sleep(LB_HEALTH_CHECK_INTERVAL)
+            try:
+                self.check_health()
+            except Exception as e:
+                printer.red(f"Error revisando los backends: {e}")
+
+    def status(self) -> list[dict]:
+        with self.lock:
+            return [
+                {
+                    "base_url": b.base_url,
+                    "weight": b.weight,
+                    "outstanding": b.outstanding,
+                    "healthy": b.healthy,
+                    "last_error": b.last_error,
+                }
+                for b in self.backends
+            ]
+
+
+class BackendPoolRegistry:
+    """Un BackendPool por (api_key, PROVIDER_BASE_URL) en cada proceso, como ProviderClientRegistry."""
+
+    def __init__(self):
+        self.pools: dict[tuple, BackendPool] = {}
+        self.lock = threading.Lock()
+
+    def get(self, api_key: str, base_url: str) -> BackendPool:
+        key = (api_key, base_url)
+        if key not in self.pools:
+            with self.lock:
+                if key not in self.pools:
+                    printer.blue(f"Balanceando entre {len(parse_backends(base_url))} backends")
+                    self.pools[key] = BackendPool(api_key, base_url)
+        return self.pools[key]
+
+
+backend_pools = BackendPoolRegistry()
+
+
+class LoadBalancedProvider(ChatProvider):
+    """
+    Proveedor que reparte cada llamada entre los backends de un BackendPool.
+    Si un backend falla la llamada se repite en otro, así un agent loop
+    sigue desde el mismo turno con la conversación intacta.
+
+    Con on_delta, si el backend se cae a mitad del streaming lo recibido se
+    cierra con un delta "done" y la respuesta se pide de nuevo a otro. Con
+    stream=True sin on_delta se devuelve un iterador de chunks: se cambia de
+    backend mientras no llegó ningún chunk, pero un corte posterior llega al
+    llamador, porque un stream no se puede retomar a mitad.
+    """
+
+    def __init__(self, api_key: str, base_url: str):
+        self.pool = backend_pools.get(api_key, base_url)
+
+    def cache_identity(self) -> str:
+        # Todos los backends sirven el mismo modelo
+        return "openai:" + ",".join(sorted(b.base_url for b in self.pool.backends))
+
+    def check_model(self, model: str):
+        return True
+
+    def embed(self, text: str, model: str = "nomic-embed-text"):
+        raise NotImplementedError("El proveedor balanceado no genera embeddings")
+
+    def chat(
+        self,
+        messages: list[dict],
+        model: str = "gpt-4o-mini",
+        stream: bool = False,
+        tools: list[dict] | list[callable] = [],
+        timeout: float | None = None,
+        on_delta: callable = None,
+    ):
+        if stream and on_delta is None:
+            return self.stream_chunks(messages, model, tools, timeout)
+
+        deadline = time.monotonic() + timeout if timeout else None
+        tried = set()
+        last_error = None
+        while True:
+            backend = self.pool.acquire(exclude=tried)
+            if backend is None:
+                raise last_error
+            streamed = []
+
+            def forward(delta):
+                streamed.append(delta.kind)
+                on_delta(delta)
+
+            try:
+                response = backend.provider.chat(
+                    messages=messages,
+                    model=model,
+                    stream=stream,
+                    tools=tools,
+                    timeout=deadline - time.monotonic() if deadline else None,
+                    on_delta=forward if on_delta else None,
+                )
+            except FAILOVER_ERRORS as e:
+                last_error = e
+                if streamed and streamed[-1] != "done":
+                    # Lo que llegó del backend caído queda como una respuesta aparte
+                    on_delta(StreamDelta(kind="done"))
+                self.fail_over(backend, e, tried, deadline)
+                continue
+            except Exception:
+                self.pool.release(backend)
+                raise
+            self.pool.release(backend)
+            return response
+
+    def fail_over(self, backend: Backend, error: Exception, tried: set[str], deadline: float | None):
+        """Libera el backend con el error y lo excluye; relanza el error si ya no queda tiempo."""
+        self.pool.release(backend, error=error)
+        tried.add(backend.base_url)
+        if deadline and time.monotonic() >= deadline:
+            raise error
+        printer.yellow(f"Falló {backend.base_url} ({type(error).__name__}), se reintenta en otro backend")
+
+    def stream_chunks(self, messages: list[dict], model: str, tools: list, timeout: float | None):
+        """Abre el stream en un backend y espera el primer chunk, cambiando de backend si falla."""
+        deadline = time.monotonic() + timeout if timeout else None
+        tried = set()
+        last_error = None
+        while True:
+            backend = self.pool.acquire(exclude=tried)
+            if backend is None:
+                raise last_error
+            try:
+                chunks = iter(
+                    backend.provider.chat(
+                        messages=messages,
+                        model=model,
+                        stream=True,
+                        tools=tools,
+                        timeout=deadline - time.monotonic() if deadline else None,
+                    )
+                )
+                first = next(chunks, None)
+            except FAILOVER_ERRORS as e:
+                last_error = e
+                self.fail_over(backend, e, tried, deadline)
+                continue
+            except Exception:
+                self.pool.release(backend)
+                raise
+            return self.forward_chunks(backend, first, chunks)
+
+    def forward_chunks(self, backend: Backend, first, chunks):
+        # El backend cuenta como ocupado hasta que el llamador termina de leer
+        error = None
+        try:
+            if first is not None:
+                yield first
+            yield from chunks
+        except FAILOVER_ERRORS as e:
+            error = e
+            raise
+        finally:
+            self.pool.release(backend, error=error)
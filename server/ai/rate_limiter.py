@@ -0,0 +1,236 @@
+import os
+import re
+import json
+import time
+
+from server.utils.printer import Printer
+from server.utils.redis_cache import redis_client
+
+printer = Printer("RATE LIMIT")
+
+# Límite de peticiones y tokens por minuto hacia cada proveedor y modelo,
+# compartido por todos los workers a través de Redis. Evita que varios workers
+# superen juntos el límite del proveedor y terminen en tormentas de reintentos.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "false").lower() == "true"
+# RATE_LIMIT_RPM_<MODELO> y RATE_LIMIT_TPM_<MODELO> tienen prioridad, p. ej.
+# RATE_LIMIT_TPM_GPT_4O_MINI (el nombre del modelo en mayúsculas con "_")
+RATE_LIMIT_RPM = float(os.getenv("RATE_LIMIT_RPM", 500))
+RATE_LIMIT_TPM = float(os.getenv("RATE_LIMIT_TPM", 200000))
+# Máximo que una llamada espera su turno antes de fallar
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", 300))
+# AIMD: cada 429 multiplica el límite efectivo por DECREASE (como mucho una vez
+# cada COOLDOWN segundos). Pasado el COOLDOWN sin 429, las respuestas correctas
+# le suman INCREASE, como mucho una vez por segundo, hasta volver al 100%
+RATE_LIMIT_AIMD_DECREASE = float(os.getenv("RATE_LIMIT_AIMD_DECREASE", 0.5))
+RATE_LIMIT_AIMD_INCREASE = float(os.getenv("RATE_LIMIT_AIMD_INCREASE", 0.05))
+RATE_LIMIT_AIMD_COOLDOWN = float(os.getenv("RATE_LIMIT_AIMD_COOLDOWN", 10))
+RATE_LIMIT_MIN_FACTOR = float(os.getenv("RATE_LIMIT_MIN_FACTOR", 0.05))
+# Ráfaga máxima, en segundos de límite: los proveedores aplican el límite por
+# minuto en ventanas más cortas, así que no se permite gastar un minuto de golpe
+RATE_LIMIT_BURST_SECONDS = float(os.getenv("RATE_LIMIT_BURST_SECONDS", 10))
+
+BUCKET_TTL = 3600
+# Si Redis falla, el limitador se desactiva este tiempo en vez de pagar el
+# timeout de conexión en cada llamada al modelo
+REDIS_RETRY_SECONDS = 30
+
+# Dos token buckets (peticiones y tokens) que se rellenan de forma continua a
+# limit * factor por minuto, con capacidad para RATE_LIMIT_BURST_SECONDS. Si
+# alcanzan se descuentan y devuelve 0; si no, devuelve los segundos que faltan.
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local tokens = tonumber(ARGV[4])
+local burst = tonumber(ARGV[6])
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'updated', 'factor')
+local factor = tonumber(state[4]) or 1
+local requests_rate = tonumber(ARGV[2]) * factor / 60
+local tokens_rate = tonumber(ARGV[3]) * factor / 60
+local requests_cap = math.max(1, requests_rate * burst)
+local tokens_cap = tokens_rate * burst
+local elapsed = math.max(0, now - (tonumber(state[3]) or now))
+local requests_level = math.min(requests_cap, (tonumber(state[1]) or requests_cap) + elapsed * requests_rate)
+local tokens_level = math.min(tokens_cap, (tonumber(state[2]) or tokens_cap) + elapsed * tokens_rate)
+local wait = 0
+if requests_level < 1 then
+  wait = (1 - requests_level) / requests_rate
+end
+-- Una petición más grande que el bucket entero solo espera a que esté lleno;
+-- el exceso queda como deuda que pagan las siguientes
+local needed = math.min(tokens, tokens_cap)
+if tokens_level < needed then
+  wait = math.max(wait, (needed - tokens_level) / tokens_rate)
+end
+if wait == 0 then
+  requests_level = requests_level - 1
+  tokens_level = tokens_level - tokens
+end
+redis.call('HSET', KEYS[1], 'requests', requests_level, 'tokens', tokens_level, 'updated', now, 'factor', factor)
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return tostring(wait)
+"""
+
+# Ajuste AIMD del factor del límite. Devuelve el factor nuevo.
+ADJUST_SCRIPT = """
+local now = tonumber(ARGV[1])
+local state = redis.call('HMGET', KEYS[1], 'factor', 'last_decrease', 'last_increase', 'requests')
+local factor = tonumber(state[1]) or 1
+local last_decrease = tonumber(state[2]) or 0
+local cooldown = tonumber(ARGV[5])
+if ARGV[2] == 'decrease' then
+  if now - last_decrease >= cooldown then
+    factor = math.max(tonumber(ARGV[6]), factor * tonumber(ARGV[3]))
+    redis.call('HSET', KEYS[1], 'last_decrease', now)
+    -- Tras un 429 se vacía el bucket de peticiones: se espera antes de volver a llamar
+    if state[4] then
+      redis.call('HSET', KEYS[1], 'requests', math.min(tonumber(state[4]), 0))
+    end
+  end
+elseif factor < 1 and now - last_decrease >= cooldown and now - (tonumber(state[3]) or 0) >= 1 then
+  factor = math.min(1, factor + tonumber(ARGV[4]))
+  redis.call('HSET', KEYS[1], 'last_increase', now)
+end
+redis.call('HSET', KEYS[1], 'factor', factor)
+redis.call('EXPIRE', KEYS[1], ARGV[7])
+return tostring(factor)
+"""
+
+
+class RateLimitWaitExceeded(Exception):
+    pass
+
+
+def get_model_limit(name: str, model: str, default: float) -> float:
+    """<name>_<MODELO> tiene prioridad sobre <name>."""
+    suffix = re.sub(r"[^A-Z0-9]", "_", (model or "").upper())
+    return float(os.getenv(f"{name}_{suffix}", default))
+
+
+class RateLimiter:
+    """
+    Limita las llamadas a cada (proveedor, modelo) con dos token buckets en
+    Redis: peticiones y tokens por minuto. Antes de una llamada se reservan
+    los tokens estimados del prompt y, con la respuesta, se corrige con el
+    uso real. Si el proveedor igual responde 429, el límite efectivo baja a
+    la mitad y vuelve a subir de a poco con cada respuesta correcta (AIMD).
+    Si Redis no está disponible las llamadas siguen sin límite durante
+    REDIS_RETRY_SECONDS.
+    """
+
+    PREFIX = "rate_limit"
+
+    def __init__(self, enabled: bool = RATE_LIMIT_ENABLED, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        self.enabled = enabled
+        self.max_wait = max_wait
+        self.scripts = {}
+        self.unavailable_until = 0.0
+
+    def active(self) -> bool:
+        return self.enabled and time.monotonic() >= self.unavailable_until
+
+    def suspend(self, error: Exception):
+        self.unavailable_until = time.monotonic() + REDIS_RETRY_SECONDS
+        printer.yellow(f"Redis no disponible, se sigue sin límite por {REDIS_RETRY_SECONDS}s: {error}")
+
+    def get_script(self, name: str, source: str):
+        # Se registra con el cliente actual, que puede cambiar (tests, reconexiones)
+        cached = self.scripts.get(name)
+        if cached is None or cached[0] is not redis_client.client:
+            cached = (redis_client.client, redis_client.register_script(source))
+            self.scripts[name] = cached
+        return cached[1]
+
+    def bucket_key(self, scope: str, model: str) -> str:
+        return f"{self.PREFIX}:{scope}:{model}"
+
+    def acquire(self, scope: str, model: str, tokens: int, max_wait: float | None = None):
+        """
+        Espera hasta que haya una petición y `tokens` disponibles en los
+        buckets, como mucho max_wait segundos (o self.max_wait).
+        """
+        if not self.active():
+            return
+        key = self.bucket_key(scope, model)
+        rpm = get_model_limit("RATE_LIMIT_RPM", model, RATE_LIMIT_RPM)
+        tpm = get_model_limit("RATE_LIMIT_TPM", model, RATE_LIMIT_TPM)
+        max_wait = min(max_wait, self.max_wait) if max_wait else self.max_wait
+        deadline = time.monotonic() + max_wait
+        waited = 0.0
+        while True:
+            try:
+                wait = float(
+                    self.get_script("acquire", ACQUIRE_SCRIPT)(
+                        keys=[key],
+                        args=[time.time(), rpm, tpm, tokens, BUCKET_TTL, RATE_LIMIT_BURST_SECONDS],
+                    )
+                )
+            except Exception as e:
+                self.suspend(e)
+                return
+            if wait <= 0:
+                if waited >= 1:
+                    printer.yellow(f"{key}: {waited:.1f}s esperando el límite de peticiones/tokens")
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimitWaitExceeded(
+                    f"{key}: no hay capacidad para {tokens} tokens en los próximos {max_wait:.0f}s"
+                )
+            time.sleep(wait)
+            waited += wait
+
+    def adjust(self, scope: str, model: str, mode: str) -> float | None:
+        try:
+            return float(
+                self.get_script("adjust", ADJUST_SCRIPT)(
+                    keys=[self.bucket_key(scope, model)],
+                    args=[
+                        time.time(),
+                        mode,
+                        RATE_LIMIT_AIMD_DECREASE,
+                        RATE_LIMIT_AIMD_INCREASE,
+                        RATE_LIMIT_AIMD_COOLDOWN,
+                        RATE_LIMIT_MIN_FACTOR,
+                        BUCKET_TTL,
+                    ],
+                )
+            )
+        except Exception as e:
+            self.suspend(e)
+            return None
+
+    def record_usage(self, scope: str, model: str, estimated_tokens: int, total_tokens: int | None):
+        """Corrige la reserva con el uso real de la respuesta y sube el límite (AIMD)."""
+        if not self.active():
+            return
+        if total_tokens is not None and total_tokens != estimated_tokens:
+            try:
+                redis_client.hincrbyfloat(
+                    self.bucket_key(scope, model), "tokens", estimated_tokens - total_tokens
+                )
+            except Exception as e:
+                self.suspend(e)
+                return
+        self.adjust(scope, model, "increase")
+
+    def record_rate_limited(self, scope: str, model: str):
+        if not self.active():
+            return
+        factor = self.adjust(scope, model, "decrease")
+        if factor is not None:
+            printer.yellow(f"429 de {scope} para {model}: límite efectivo al {factor * 100:.0f}%")
+
+    def on_http_response(self, response):
+        """
+        Event hook de httpx de los clientes compartidos: ve los 429 también
+        cuando el SDK los reintenta por su cuenta y nunca llegan al llamador.
+        """
+        if response.status_code != 429 or not self.active():
+            return
+        try:
+            model = json.loads(response.request.content or b"{}").get("model")
+        except (ValueError, AttributeError):
+            model = None
+        if model:
+            self.record_rate_limited(response.request.url.netloc.decode(), model)
+
+
+rate_limiter = RateLimiter()
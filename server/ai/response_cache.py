@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from typing import Callable
+
+from openai.types.chat import ChatCompletion
+
+from server.utils.printer import Printer
+from server.utils.redis_cache import redis_client
+
+printer = Printer("LLM CACHE")
+
+# Cache (opcional) de respuestas de AIInterface.chat. Los reintentos y las
+# re-ejecuciones mandan prompts idénticos (mismo modelo, mensajes e imágenes),
+# por ejemplo el OCR de las mismas páginas; con el cache se responde desde
+# Redis sin volver a llamar al modelo.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 60 * 60 * 24 * 7))
+# Máximo que una llamada espera a otra idéntica que ya está en curso
+LLM_CACHE_WAIT_SECONDS = float(os.getenv("LLM_CACHE_WAIT_SECONDS", 600))
+LLM_CACHE_POLL_INTERVAL = float(os.getenv("LLM_CACHE_POLL_INTERVAL", 0.2))
+
+# Solo se guardan respuestas completas; una cortada por longitud se vuelve a pedir
+CACHEABLE_FINISH_REASONS = ("stop", "tool_calls")
+
+
+def serialize_for_key(value):
+    if hasattr(value, "model_dump"):
+        return value.model_dump(exclude_none=True)
+    if callable(value):
+        return getattr(value, "__qualname__", repr(value))
+    return repr(value)
+
+
+@dataclass
+class InFlightCall:
+    event: threading.Event = field(default_factory=threading.Event)
+    response: ChatCompletion | None = None
+
+
+class LLMResponseCache:
+    """
+    Cache de respuestas del modelo direccionado por el hash de la petición
+    (proveedor, modelo, mensajes y tools). Las llamadas idénticas que están
+    en curso al mismo tiempo se juntan en una: dentro del proceso esperan a
+    la primera, y entre workers la primera toma un lock en Redis y las demás
+    esperan a que guarde el resultado. Cuenta hits, misses y llamadas
+    juntadas por proceso y en total (hash llm_cache:stats).
+    """
+
+    PREFIX = "llm_cache"
+    STATS_KEY = "llm_cache:stats"
+
+    def __init__(
+        self,
+        ttl: int = LLM_CACHE_TTL,
+        enabled: bool = LLM_CACHE_ENABLED,
+        wait_seconds: float = LLM_CACHE_WAIT_SECONDS,
+        poll_interval: float = LLM_CACHE_POLL_INTERVAL,
+    ):
+        self.ttl = ttl
+        self.enabled = enabled
+        self.wait_seconds = wait_seconds
+        self.poll_interval = poll_interval
+        self.in_flight: dict[str, InFlightCall] = {}
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0}
+        self.lock = threading.Lock()
+
+    def build_key(self, identity: str, model: str | None, messages: list, tools: list) -> str:
+        payload = json.dumps(
+            {"identity": identity, "model": model, "messages": messages, "tools": tools},
+            sort_keys=True,
+            ensure_ascii=False,
+            default=serialize_for_key,
+        )
+        return f"{self.PREFIX}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def get(self, key: str) -> ChatCompletion | None:
+        try:
+            data = redis_client.get(key)
+            if data is None:
+                return None
+            redis_client.expire(key, self.ttl)
+            return ChatCompletion.model_validate_json(data)
+        except Exception as e:
+            printer.yellow(f"No se pudo leer el cache de respuestas: {e}")
+            return None
+
+    def set(self, key: str, response) -> None:
+        if not isinstance(response, ChatCompletion) or not response.choices:
+            return
+        if response.choices[0].finish_reason not in CACHEABLE_FINISH_REASONS:
+            return
+        try:
+            redis_client.set(key, response.model_dump_json(), ex=self.ttl)
+        except Exception as e:
+            printer.yellow(f"No se pudo guardar en el cache de respuestas: {e}")
+
+    def count(self, name: str):
+        with self.lock:
+            self.counters[name] += 1
+        try:
+            redis_client.hincrby(self.STATS_KEY, name)
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        """Contadores de este proceso y de todos los workers, con el porcentaje de aciertos."""
+        try:
+            total = {name: int(value) for name, value in redis_client.hgetall(self.STATS_KEY).items()}
+        except Exception:
+            total = {}
+        stats = {"process": dict(self.counters), "total": total}
+        for counters in stats.values():
+            requests = sum(counters.values())
+            counters["hit_ratio"] = (
+                round((counters.get("hits", 0) + counters.get("coalesced", 0)) / requests, 3)
+                if requests
+                else 0.0
+            )
+        return stats
+
+    def get_or_create(self, key: str, create: Callable[[], ChatCompletion]) -> tuple[ChatCompletion, str]:
+        """
+        Devuelve (respuesta, origen): "hit" si estaba en cache, "coalesced"
+        si la pidió otra llamada idéntica en curso y "miss" si se llamó al
+        modelo con create(). Si la llamada en curso falla, las que esperaban
+        llaman al modelo por su cuenta.
+        """
+        if not self.enabled:
+            return create(), "miss"
+
+        response = self.get(key)
+        if response is not None:
+            self.count("hits")
+            return response, "hit"
+
+        with self.lock:
+            call = self.in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self.in_flight[key] = InFlightCall()
+
+        if not leader:
+            call.event.wait(self.wait_seconds)
+            if call.response is not None:
+                self.count("coalesced")
+                return call.response, "coalesced"
+            self.count("misses")
+            return create(), "miss"
+
+        try:
+            call.response, source = self.create_once(key, create)
+            return call.response, source
+        finally:
+            call.event.set()
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+    def create_once(self, key: str, create: Callable[[], ChatCompletion]) -> tuple[ChatCompletion, str]:
+        """Entre procesos: solo el que toma el lock llama al modelo, el resto espera el resultado."""
+        lock = None
+        try:
+            lock = redis_client.lock(f"{key}:in_flight", timeout=int(self.wait_seconds))
+            if not lock.acquire(blocking=False):
+                lock = None
+                response = self.wait_for(key)
+                if response is not None:
+                    self.count("coalesced")
+                    return response, "coalesced"
+        except Exception as e:
+            printer.yellow(f"No se pudo coordinar la llamada con otros workers: {e}")
+            lock = None
+
+        try:
+            response = create()
+            self.count("misses")
+            self.set(key, response)
+            return response, "miss"
+        finally:
+            if lock is not None:
+                try:
+                    lock.release()
+                except Exception:
+                    # Expiró mientras se generaba la respuesta
+                    pass
+
+    def wait_for(self, key: str) -> ChatCompletion | None:
+        """Espera el resultado de otro worker mientras su lock siga tomado."""
+        deadline = time.monotonic() + self.wait_seconds
+        while time.monotonic() < deadline:
+            response = self.get(key)
+            if response is not None:
+                return response
+            if not redis_client.exists(f"{key}:in_flight"):
+                # Terminó (o falló) justo ahora: última lectura
+                return self.get(key)
+            time.sleep(self.poll_interval)
+        return None
+
+
+llm_response_cache = LLMResponseCache()
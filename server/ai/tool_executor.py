@@ -0,0 +1,66 @@
+import os
+from dataclasses import dataclass
+from typing import Any, Callable
+from concurrent.futures import ThreadPoolExecutor
+
+from server.utils.printer import Printer
+
+printer = Printer("TOOLS")
+
+# Máximo de tools ejecutándose a la vez dentro de un mismo turno del agente
+TOOL_CALL_CONCURRENCY = int(os.getenv("TOOL_CALL_CONCURRENCY", 4))
+
+
+def thread_safe(fn: Callable) -> Callable:
+    """
+    Declara que la tool puede correr en paralelo con otras del mismo turno.
+    La tool es responsable de proteger lo que comparte (en los procesadores,
+    la sesión de la base de datos con ExecutionCheckpoint.lock).
+    """
+    fn.thread_safe = True
+    return fn
+
+
+def is_thread_safe(fn: Callable) -> bool:
+    return getattr(fn, "thread_safe", False)
+
+
+@dataclass
+class ToolCallResult:
+    output: Any = None
+    error: Exception | None = None
+
+
+def run_tool(fn: Callable, args: dict) -> ToolCallResult:
+    try:
+        return ToolCallResult(output=fn(**args))
+    except Exception as e:
+        return ToolCallResult(error=e)
+
+
+def execute_tool_calls(
+    calls: list[tuple[Callable, dict]],
+    max_workers: int = TOOL_CALL_CONCURRENCY,
+) -> list[ToolCallResult]:
+    """
+    Ejecuta las tool calls de un turno y devuelve los resultados en el orden
+    de las llamadas. Las tools marcadas con @thread_safe corren a la vez en
+    un pool acotado; las demás corren después, de a una, en este hilo, así
+    nunca se pisan con las del pool. Los errores se devuelven en el
+    resultado para que cada agent loop decida cómo reportarlos.
+    """
+    parallel = [i for i, (fn, _) in enumerate(calls) if is_thread_safe(fn)]
+    if len(parallel) < 2 or max_workers < 2:
+        return [run_tool(fn, args) for fn, args in calls]
+
+    printer.blue(f"Ejecutando {len(parallel)} de {len(calls)} tool calls en paralelo")
+    results: list[ToolCallResult | None] = [None] * len(calls)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(parallel))) as executor:
+        futures = {i: executor.submit(run_tool, *calls[i]) for i in parallel}
+        for i, future in futures.items():
+            results[i] = future.result()
+
+    for i, (fn, args) in enumerate(calls):
+        if results[i] is None:
+            results[i] = run_tool(fn, args)
+    return results
@@ -38,7 +38,12 @@ class Chunk:
 class ChromaManager:
     client = None
 
-    def __init__(self) -> None:
+    def __init__(self, client=None, embedding_function=None) -> None:
+        # client/embedding_function permiten usar un Chroma local (benchmarks)
+        self.embedding_function = embedding_function
+        if client is not None:
+            self.client = client
+            return
         printer.yellow(
             "🔄 Cliente de Chroma se va a conectar en HOST: ",
             CHROMA_HOST,
@@ -69,6 +74,10 @@ class ChromaManager:
         return self.client.heartbeat()
 
     def get_or_create_collection(self, collection_name: str):
+        if self.embedding_function is not None:
+            return self.client.get_or_create_collection(
+                name=collection_name, embedding_function=self.embedding_function
+            )
         collection = self.client.get_or_create_collection(name=collection_name)
         return collection
 
@@ -1,4 +1,5 @@
 from celery import Celery
+from celery.signals import worker_process_init
 import os
 import platform
 import ssl
@@ -33,6 +34,8 @@ celery.conf.update(
     timezone="UTC",
     enable_utc=True,
     task_track_started=True,
+    # El warmup de Whisper en worker_process_init tarda más que los 4s por defecto
+    worker_proc_alive_timeout=float(os.getenv("CELERY_PROC_ALIVE_TIMEOUT", 120)),
 )
 
 # SSL options si usas TLS
@@ -51,3 +54,23 @@ if platform.system() == "Windows":
 else:
     celery.conf.worker_pool = os.getenv("CELERY_POOL", "prefork")
     celery.conf.worker_concurrency = int(os.getenv("CELERY_CONCURRENCY", "8"))
+
+
+@worker_process_init.connect
+def warmup_worker_process(**kwargs):
+    """
+    Cada proceso hijo del worker carga los modelos de Whisper al arrancar,
+    así la primera transcripción no paga la carga del modelo.
+    """
+    from server.utils.audio_reader import (
+        ASR_BACKEND,
+        WHISPER_WARMUP,
+        whisper_models,
+        get_warmup_model_names,
+        limit_transcription_threads,
+    )
+
+    if WHISPER_WARMUP:
+        # Con faster-whisper los hilos se fijan al cargar el modelo
+        limit_transcription_threads(ASR_BACKEND)
+        whisper_models.warmup(get_warmup_model_names())
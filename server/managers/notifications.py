@@ -22,7 +22,6 @@ async def redis_to_socketio_bridge():
         async for message in pubsub.listen():
             # printer.green("Message received: ", message)
             if message["type"] == "message":
-                printer.green("Message received in workflow_updates channel")
                 data = json.loads(message["data"])
                 # printer.green("Message parsed")
 
@@ -30,9 +29,11 @@ async def redis_to_socketio_bridge():
                 # printer.green(f"Case ID: {case_id}")
 
                 await sio.emit("workflow_update", data, room=f"workflow_{workflow_id}")
-                printer.green(
-                    f"Message sent to socketio to room: workflow_{workflow_id}"
-                )
+                # Los fragmentos de streaming llegan varias veces por segundo, no se loguean
+                if "stream" not in data:
+                    printer.green(
+                        f"Message sent to socketio to room: workflow_{workflow_id}"
+                    )
     finally:
         await pubsub.unsubscribe("workflow_updates")
         await pubsub.close()
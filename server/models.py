@@ -11,6 +11,7 @@ from sqlalchemy import (
     func,
     Integer,
     Numeric,
+    BigInteger,
 )
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
@@ -99,6 +100,14 @@ class WorkflowExecutionStatus(str, enum.Enum):
     IN_PROGRESS = "IN_PROGRESS"
 
 
+class WorkflowExecutionStage(str, enum.Enum):
+    EXTRACT = "EXTRACT"
+    BUILD_PROMPT = "BUILD_PROMPT"
+    AGENT = "AGENT"
+    FINALIZE = "FINALIZE"
+    DONE = "DONE"
+
+
 class WorkflowExecution(Base):
     __tablename__ = "workflow_executions"
 
@@ -124,6 +133,15 @@ class WorkflowExecution(Base):
 
     generation_log = Column(Text, nullable=True)
 
+    # Etapa del pipeline y progreso guardado (prompt, mensajes del agente y
+    # tools ya ejecutadas) para que un reintento continúe donde falló
+    stage = Column(
+        Enum(WorkflowExecutionStage),
+        default=WorkflowExecutionStage.EXTRACT,
+        nullable=False,
+    )
+    checkpoint = Column(JSON, nullable=True)
+
     workflow = relationship("Workflow", back_populates="workflow_executions")
 
     assets = relationship(
@@ -174,6 +192,9 @@ class Asset(Base):
     brief = Column(Text, nullable=True)
     content = Column(Text, nullable=True)
     format = Column(String(255), nullable=True)
+    # SHA-256 y tamaño del archivo subido, calculados mientras se escribe a disco
+    content_hash = Column(String(64), nullable=True, index=True)
+    size_bytes = Column(BigInteger, nullable=True)
     created_at = Column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
     )
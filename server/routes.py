@@ -1,24 +1,24 @@
 import os
 import shutil
-import subprocess
-import tempfile
+import asyncio
+from urllib.parse import quote
 
 # import traceback
 from typing import List, Optional
 from sqlalchemy.orm import selectinload
 from server.tasks import (
-    async_process_workflow_execution,
     async_request_changes,
     async_process_example_files,
     async_process_template_file,
-    async_process_workflow_execution_v2,
+    enqueue_workflow_execution,
 )
 
 from fastapi import APIRouter, Form, File, UploadFile, Depends, HTTPException, Header, Request
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response
+from fastapi.concurrency import run_in_threadpool
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, delete
 from sqlalchemy.orm import selectinload
 
 from server.examples.workflows import INITIAL_WORKFLOWS
@@ -30,6 +30,7 @@ from server.models import (
     WorkflowExecution,
     Asset,
     WorkflowExecutionStatus,
+    WorkflowExecutionStage,
     AssetOrigin,
     AssetType,
     AssetStatus,
@@ -40,6 +41,20 @@ from server.models import (
 )
 from server.utils.printer import Printer
 from server.utils.csv_logger import CSVLogger
+from server.utils.uploads import (
+    save_upload_file,
+    resumable_uploads,
+    UploadTooLargeError,
+    UploadOffsetMismatchError,
+    UploadLockedError,
+    UPLOAD_MAX_FILE_SIZE,
+)
+from server.utils.extraction_cache import hash_file
+from server.utils.converter import (
+    conversions,
+    build_conversion_id,
+    CONVERSION_WAIT_SECONDS,
+)
 from server.services.credit_service import CreditService
 from server.services.stripe_service import StripeService
 
@@ -252,22 +267,23 @@ async def create_workflow(
         # Save template file
         template_path = os.path.join(UPLOADS_PATH, str(workflow.id), "template.docx")
         os.makedirs(os.path.dirname(template_path), exist_ok=True)
-        with open(template_path, "wb") as buffer:
-            shutil.copyfileobj(template_docx.file, buffer)
+        try:
+            await save_upload_file(template_docx, template_path)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
         
         async_process_template_file.delay(workflow.id, template_path)
         print(f"Template saved as example with is_template=True: {template_path}")
     
     if output_examples:
-        file_paths = [
-            f"{UPLOADS_PATH}/{output_example.filename}"
-            for output_example in output_examples
-        ]
+        file_paths = []
         # Store the files in the uploads path
         for output_example in output_examples:
             file_path = f"{UPLOADS_PATH}/{output_example.filename}"
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(output_example.file, buffer)
+            try:
+                await save_upload_file(output_example, file_path)
+            except UploadTooLargeError as e:
+                raise HTTPException(status_code=413, detail=str(e))
             file_paths.append(file_path)
 
         async_process_example_files.delay(
@@ -446,22 +462,21 @@ async def start_workflow(
             printer.yellow(asset.id, "Asset created")
             ext = os.path.splitext(file.filename)[1]
             file_path = f"{upload_path}/{asset.id}{ext}"
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            try:
+                saved = await save_upload_file(file, file_path)
+            except UploadTooLargeError as e:
+                await session.rollback()
+                await run_in_threadpool(shutil.rmtree, upload_path, True)
+                raise HTTPException(status_code=413, detail=str(e))
+            asset.content_hash = saved.content_hash
+            asset.size_bytes = saved.size_bytes
             assets.append(asset)
     await session.commit()
 
     printer.yellow("Execution created, orchestrating tasks...")
     
-    # Feature flag to use V2 processor
-    use_v2 = os.getenv("USE_RESPONSES_API", "false").lower() == "true"
-    
-    if use_v2:
-        async_process_workflow_execution_v2.delay(execution.id)
-        printer.yellow(f"Background task V2 started for execution id: {execution.id}")
-    else:
-        async_process_workflow_execution.delay(execution.id)
-        printer.yellow(f"Background task V1 started for execution id: {execution.id}")
+    enqueue_workflow_execution(execution.id)
+    printer.yellow(f"Background task started for execution id: {execution.id}")
     return JSONResponse(
         {
             "workflow_execution_id": str(execution.id),
@@ -470,6 +485,262 @@ async def start_workflow(
     )
 
 
+# --- RESUMABLE UPLOADS -----------------------------------
+# Subidas por bloques estilo tus: se crea la subida, se envían bloques con
+# PATCH indicando el Upload-Offset y, cuando todos los archivos están
+# completos, finalize crea los assets y encola la ejecución.
+
+
+@router.post("/uploads/{workflow_id}")
+async def create_resumable_upload(
+    workflow_id: str,
+    filename: str = Form(...),
+    length: int = Form(...),
+    description: Optional[str] = Form(None),
+    workflow_execution_id: Optional[str] = Form(None),
+    session: AsyncSession = Depends(get_session),
+    x_user_email: str = Header(...),
+):
+    if length <= 0:
+        raise HTTPException(status_code=400, detail="Invalid upload length")
+    if length > UPLOAD_MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=str(UploadTooLargeError(filename, UPLOAD_MAX_FILE_SIZE)),
+        )
+
+    result = await session.execute(select(User).where(User.email == x_user_email))
+    user = result.scalar_one_or_none()
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid user")
+
+    result = await session.execute(select(Workflow).where(Workflow.id == workflow_id))
+    workflow = result.scalar_one_or_none()
+    if not workflow:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    if workflow.user_id != user.id:
+        raise HTTPException(status_code=403, detail="Not allowed")
+
+    # Varios archivos de la misma ejecución comparten workflow_execution_id
+    if workflow_execution_id:
+        result = await session.execute(
+            select(WorkflowExecution).where(
+                WorkflowExecution.id == workflow_execution_id,
+                WorkflowExecution.workflow_id == workflow.id,
+            )
+        )
+        execution = result.scalar_one_or_none()
+        if not execution:
+            raise HTTPException(status_code=404, detail="Execution not found")
+        if execution.status != WorkflowExecutionStatus.PENDING:
+            raise HTTPException(status_code=409, detail="Execution already started")
+    else:
+        execution = WorkflowExecution(
+            workflow_id=workflow.id,
+            status=WorkflowExecutionStatus.PENDING,
+        )
+        session.add(execution)
+        await session.commit()
+
+    upload = await run_in_threadpool(
+        resumable_uploads.create,
+        workflow_execution_id=str(execution.id),
+        user_email=x_user_email,
+        filename=filename,
+        length=length,
+        brief=description,
+    )
+    printer.yellow(f"Resumable upload {upload.id} created for {filename}")
+    return JSONResponse(
+        {
+            "upload_id": upload.id,
+            "workflow_execution_id": upload.workflow_execution_id,
+            "offset": upload.offset,
+            "length": upload.length,
+        },
+        status_code=201,
+        headers={"Location": f"/api/uploads/{upload.id}", "Upload-Offset": "0"},
+    )
+
+
+def get_owned_upload(upload_id: str, x_user_email: str):
+    upload = resumable_uploads.get(upload_id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if upload.user_email != x_user_email:
+        raise HTTPException(status_code=403, detail="Not allowed")
+    return upload
+
+
+@router.head("/uploads/{upload_id}")
+async def get_resumable_upload_offset(
+    upload_id: str,
+    x_user_email: str = Header(...),
+):
+    upload = await run_in_threadpool(get_owned_upload, upload_id, x_user_email)
+    return Response(
+        status_code=200,
+        headers={
+            "Upload-Offset": str(upload.offset),
+            "Upload-Length": str(upload.length),
+            "Cache-Control": "no-store",
+        },
+    )
+
+
+@router.patch("/uploads/{upload_id}")
+async def append_resumable_upload(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(...),
+    x_user_email: str = Header(...),
+):
+    upload = await run_in_threadpool(get_owned_upload, upload_id, x_user_email)
+    try:
+        upload = await resumable_uploads.append(upload, upload_offset, request.stream())
+    except UploadOffsetMismatchError as e:
+        raise HTTPException(
+            status_code=409,
+            detail=str(e),
+            headers={"Upload-Offset": str(e.expected)},
+        )
+    except UploadLockedError as e:
+        raise HTTPException(status_code=423, detail=str(e))
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    return Response(status_code=204, headers={"Upload-Offset": str(upload.offset)})
+
+
+@router.post("/uploads/executions/{execution_id}/finalize")
+async def finalize_resumable_uploads(
+    execution_id: str,
+    input_text: Optional[str] = Form(None),
+    session: AsyncSession = Depends(get_session),
+    x_user_email: str = Header(...),
+):
+    result = await session.execute(
+        select(WorkflowExecution)
+        .options(selectinload(WorkflowExecution.workflow).selectinload(Workflow.user))
+        .where(WorkflowExecution.id == execution_id)
+    )
+    execution = result.scalar_one_or_none()
+    if not execution:
+        raise HTTPException(status_code=404, detail="Execution not found")
+    if execution.workflow.user.email != x_user_email:
+        raise HTTPException(status_code=403, detail="Not allowed")
+
+    # La sesión se revierte si algo falla y no debe recargar la ejecución
+    execution_uuid = execution.id
+    # Se toma la ejecución de forma atómica: un finalize repetido o concurrente
+    # no pasa de aquí y no vuelve a crear los assets ni a encolarla
+    claimed = await session.execute(
+        update(WorkflowExecution)
+        .where(
+            WorkflowExecution.id == execution_uuid,
+            WorkflowExecution.status == WorkflowExecutionStatus.PENDING,
+        )
+        .values(status=WorkflowExecutionStatus.IN_PROGRESS)
+    )
+    await session.commit()
+    if claimed.rowcount == 0:
+        raise HTTPException(status_code=409, detail="Execution already started")
+
+    asset_ids = []
+    moved = []
+    try:
+        uploads = await run_in_threadpool(
+            resumable_uploads.list_for_execution, execution_id
+        )
+        if not uploads and not input_text:
+            raise HTTPException(
+                status_code=400, detail="No input files or text provided"
+            )
+
+        incomplete = [u for u in uploads if not u.is_complete]
+        if incomplete:
+            raise HTTPException(
+                status_code=409,
+                detail={
+                    "message": "Some uploads are incomplete",
+                    "uploads": [
+                        {"upload_id": u.id, "offset": u.offset, "length": u.length}
+                        for u in incomplete
+                    ],
+                },
+            )
+
+        created = []
+        if input_text:
+            created.append(
+                Asset(
+                    workflow_execution_id=execution_uuid,
+                    name="input_text",
+                    asset_type=AssetType.TEXT,
+                    origin=AssetOrigin.UPLOAD,
+                    content=input_text,
+                    extracted_text=input_text,
+                    status=AssetStatus.DONE,
+                    brief="Texto complementario, información adicional, etc.",
+                )
+            )
+            session.add(created[-1])
+
+        assets = []
+        moves = []
+        for upload in uploads:
+            asset = Asset(
+                workflow_execution_id=execution_uuid,
+                name=upload.filename,
+                asset_type=AssetType.FILE,
+                origin=AssetOrigin.UPLOAD,
+                status=AssetStatus.PENDING,
+                brief=upload.brief,
+                size_bytes=upload.length,
+                content_hash=await run_in_threadpool(hash_file, upload.path),
+            )
+            session.add(asset)
+            await session.flush()
+            ext = os.path.splitext(upload.filename)[1]
+            moves.append(
+                (upload.path, f"{UPLOADS_PATH}/{execution_uuid}/{asset.id}{ext}")
+            )
+            assets.append(asset)
+        created.extend(assets)
+        await session.commit()
+        asset_ids = [a.id for a in created]
+
+        # Los archivos se mueven después del commit; si falla alguno se
+        # deshace todo y la ejecución vuelve a PENDING con las subidas intactas
+        for source, target in moves:
+            await run_in_threadpool(os.replace, source, target)
+            moved.append((source, target))
+    except BaseException:
+        await session.rollback()
+        for source, target in reversed(moved):
+            await run_in_threadpool(os.replace, target, source)
+        if asset_ids:
+            await session.execute(delete(Asset).where(Asset.id.in_(asset_ids)))
+        await session.execute(
+            update(WorkflowExecution)
+            .where(WorkflowExecution.id == execution_uuid)
+            .values(status=WorkflowExecutionStatus.PENDING)
+        )
+        await session.commit()
+        raise
+
+    await run_in_threadpool(resumable_uploads.delete_execution, execution_id)
+
+    enqueue_workflow_execution(execution_uuid)
+    printer.yellow(f"Background task started for execution id: {execution_uuid}")
+    return JSONResponse(
+        {
+            "workflow_execution_id": str(execution_uuid),
+            "uploaded_files": [a.name for a in assets],
+        }
+    )
+
+
 @router.post("/workflow-execution/{execution_id}/rerun")
 async def rerun_workflow_execution(
     execution_id: str,
@@ -487,16 +758,15 @@ async def rerun_workflow_execution(
     if execution.workflow.user.email != x_user_email:
         raise HTTPException(status_code=403, detail="Not allowed")
     execution.status = WorkflowExecutionStatus.PENDING
+    # Una ejecución terminada vuelve a correr el agente sin repetir la extracción;
+    # una que falló a medias conserva su checkpoint y continúa desde la etapa que falló.
+    if execution.stage == WorkflowExecutionStage.DONE:
+        execution.stage = WorkflowExecutionStage.BUILD_PROMPT
+        execution.checkpoint = None
     await session.commit()
     
-    # Feature flag to use V2 processor
-    use_v2 = os.getenv("USE_RESPONSES_API", "false").lower() == "true"
-    
-    if use_v2:
-        async_process_workflow_execution_v2.delay(execution.id)
-    else:
-        async_process_workflow_execution.delay(execution.id)
-    
+    enqueue_workflow_execution(execution.id)
+
     return JSONResponse(
         {
             "message": "Execution rerunned",
@@ -580,6 +850,7 @@ async def get_execution_assets(
                 "description": a.brief,
                 "content": a.content,
                 "format": a.format,
+                "size_bytes": a.size_bytes,
             }
             for a in assets_upload
         ],
@@ -660,78 +931,61 @@ async def convert_asset(
     if not export_type:
         export_type = "docx"
 
-    try:
-        # Get the content to convert
-        content_to_convert = None
-
-        content_to_convert = asset.content or asset.extracted_text or ""
+    content_to_convert = asset.content or asset.extracted_text or ""
+    if not content_to_convert:
+        raise HTTPException(status_code=400, detail="No content found in asset")
+
+    # Hashea el archivo de referencia del formato: se hace fuera del event loop
+    conversion_id = await run_in_threadpool(build_conversion_id, content_to_convert, export_type)
+    await run_in_threadpool(conversions.allow, conversion_id, x_user_email)
+    task = await conversions.start(conversion_id, content_to_convert, export_type)
+    if task:
+        # Las conversiones cortas se responden en la misma petición; las largas
+        # (PDF con xelatex) siguen en segundo plano y el cliente consulta el estado.
+        try:
+            await asyncio.wait_for(asyncio.shield(task), CONVERSION_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            pass
 
-        if not content_to_convert:
-            raise HTTPException(status_code=400, detail="No content found in asset")
+    output_name = f"{os.path.splitext(asset.name)[0]}.{export_type}"
+    return await conversion_response(conversion_id, output_name)
 
-        # Create a temporary markdown file with the content
-        with tempfile.NamedTemporaryFile(
-            mode="w", suffix=".md", delete=False, encoding="utf-8"
-        ) as temp_md:
-            temp_md.write(content_to_convert)
-            temp_md_path = temp_md.name
 
-        # Create output file path
-        output_filename = f"converted_asset_{asset.id}.{export_type}"
-        printer.yellow(output_filename, "OUTPUT FILENAME")
-        output_path = f"{UPLOADS_PATH}/converted/{output_filename}"
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+async def conversion_response(conversion_id: str, output_name: str | None = None) -> JSONResponse:
+    status = await run_in_threadpool(conversions.get_status, conversion_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Conversion not found")
 
-        # Convert using pandoc
-        try:
-            # Build pandoc command based on export type
-            pandoc_cmd = ["pandoc", temp_md_path, "-o", output_path]
-
-            # Add format-specific options
-            if export_type == "pdf":
-                pandoc_cmd.extend(["--pdf-engine=xelatex"])
-            elif export_type == "docx":
-                pandoc_cmd.extend(
-                    ["--reference-doc=template.docx"]
-                    if os.path.exists("template.docx")
-                    else []
-                )
-            elif export_type == "html":
-                pandoc_cmd.extend(
-                    ["--standalone", "--css=style.css"]
-                    if os.path.exists("style.css")
-                    else []
-                )
+    if status["status"] == "ERROR":
+        raise HTTPException(status_code=500, detail=status["error"])
 
-            result = subprocess.run(
-                pandoc_cmd, capture_output=True, text=True, check=True
-            )
-        except subprocess.CalledProcessError as e:
-            os.unlink(temp_md_path)  # Clean up temp file
-            raise HTTPException(
-                status_code=500, detail=f"Error converting file: {e.stderr}"
-            )
-        except FileNotFoundError:
-            os.unlink(temp_md_path)  # Clean up temp file
-            raise HTTPException(
-                status_code=500,
-                detail="Pandoc not found. Please install pandoc to use this feature.",
-            )
-
-        # Clean up temporary file
-        os.unlink(temp_md_path)
+    name_query = f"?name={quote(output_name)}" if output_name else ""
+    res = {
+        "conversion_id": conversion_id,
+        "status": status["status"],
+        "status_url": f"/api/convert/status/{conversion_id}{name_query}",
+    }
+    if status["status"] != "DONE":
+        return JSONResponse(res, status_code=202)
 
-        res = {
-            "retrieve_url": f"/api/download-converted/{output_filename}",
-            "filename": output_filename,
+    res.update(
+        {
+            "retrieve_url": f"/api/download-converted/{status['filename']}{name_query}",
+            "filename": status["filename"],
         }
-        return JSONResponse(res)
+    )
+    return JSONResponse(res)
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        printer.red(f"Error converting asset {asset_id}: {str(e)}", "CONVERT_ASSET")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.get("/convert/status/{conversion_id}")
+async def get_conversion_status(
+    conversion_id: str,
+    name: Optional[str] = None,
+    x_user_email: str = Header(...),
+):
+    if not await run_in_threadpool(conversions.is_allowed, conversion_id, x_user_email):
+        raise HTTPException(status_code=403, detail="Not allowed")
+    return await conversion_response(conversion_id, name)
 
 
 @router.get("/convert/supported-types")
@@ -832,12 +1086,13 @@ async def delete_asset(
 
 
 @router.get("/download-converted/{filename}")
-async def download_file(filename: str):
-    # Get the file, reutnr the content bu also deleteds the file
-    file_path = f"{UPLOADS_PATH}/converted/{filename}"
+async def download_file(filename: str, name: Optional[str] = None):
+    file_path = f"{UPLOADS_PATH}/converted/{os.path.basename(filename)}"
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(path=file_path, filename=filename)
+    return FileResponse(
+        path=file_path, filename=os.path.basename(name) if name else filename
+    )
 
 
 @router.get("/download-asset/{asset_id}")
@@ -1,5 +1,7 @@
-from typing import List, Optional, Dict
-from openai import OpenAI
+from typing import List, Optional, Dict, Callable
+from server.ai.ai_interface import provider_clients, StreamDelta
+from server.ai.context_compactor import count_tokens
+from server.ai.rate_limiter import rate_limiter
 from openai.types.responses import Response
 from openai.types.responses.response_output_item import ResponseOutputItem
 from openai.types.responses.response_input_item import Message
@@ -7,11 +9,15 @@ from openai.types.responses.response_output_message import ResponseOutputMessage
 from openai.types.responses.response_function_call_output_item import ResponseFunctionCallOutputItem
 from openai.types.responses.response_function_tool_call import ResponseFunctionToolCall
 
+class ResponseStreamError(Exception):
+    """A streamed response failed or ended without a terminal event"""
+
+
 class ResponsesAPIService:
     """Service for interacting with OpenAI's Responses API"""
     
-    def __init__(self, api_key: str):
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, api_key: str, base_url: Optional[str] = None):
+        self.client = provider_clients.openai(api_key=api_key, base_url=base_url)
     
     def create_response(
         self,
@@ -20,6 +26,7 @@ class ResponsesAPIService:
         model: str,
         instructions: str,
         previous_response_id: Optional[str] = None,
+        on_delta: Optional[Callable] = None,
     ) -> Response:
         """
         Create a response using OpenAI's Responses API.
@@ -30,6 +37,7 @@ class ResponsesAPIService:
             model: Model to use (e.g., 'gpt-4o-mini')
             instructions: System instructions
             previous_response_id: ID of previous response for continuation
+            on_delta: If given, the response is streamed and each fragment is passed as a StreamDelta
             
         Returns:
             Response object containing outputs and metadata
@@ -46,7 +54,63 @@ class ResponsesAPIService:
         if previous_response_id:
             create_kwargs["previous_response_id"] = previous_response_id
         
-        response = self.client.responses.create(**create_kwargs)
+        # Wait for a slot in the rate limiter shared by all workers; with a chained
+        # response only the new input is estimated and the real usage corrects it
+        scope = self.client.base_url.netloc.decode()
+        estimated_tokens = count_tokens(input_data, model, instructions) if rate_limiter.enabled else 0
+        rate_limiter.acquire(scope, model, estimated_tokens)
+        
+        if on_delta:
+            response = self._stream_response(create_kwargs, on_delta)
+        else:
+            response = self.client.responses.create(**create_kwargs)
+        
+        usage = getattr(response, "usage", None)
+        rate_limiter.record_usage(scope, model, estimated_tokens, usage.total_tokens if usage else None)
+        return response
+    
+    def _stream_response(self, create_kwargs: Dict, on_delta: Callable) -> Response:
+        """
+        Stream a response, forwarding text and function argument deltas, and return the final Response.
+        An incomplete response is returned like in the non-streaming path; a failed stream raises
+        ResponseStreamError so the caller does not take its partial output as the answer.
+        """
+        response = None
+        # output_index -> (function name, accumulated arguments)
+        function_calls: Dict[int, list] = {}
+        stream = self.client.responses.create(**create_kwargs, stream=True)
+        for event in stream:
+            if event.type == "response.output_text.delta":
+                on_delta(StreamDelta(kind="content", text=event.delta))
+            elif event.type == "response.output_item.added" and event.item.type == "function_call":
+                function_calls[event.output_index] = [event.item.name, ""]
+            elif event.type == "response.function_call_arguments.delta":
+                call = function_calls.setdefault(event.output_index, [None, ""])
+                call[1] += event.delta
+                on_delta(
+                    StreamDelta(
+                        kind="tool_arguments",
+                        text=event.delta,
+                        index=event.output_index,
+                        tool_name=call[0],
+                        arguments=call[1],
+                    )
+                )
+            elif event.type in ("response.completed", "response.incomplete"):
+                response = event.response
+            elif event.type == "response.failed":
+                on_delta(StreamDelta(kind="done"))
+                error = event.response.error
+                raise ResponseStreamError(
+                    f"Response {event.response.id} failed: "
+                    + (f"{error.code}: {error.message}" if error else "no error details")
+                )
+            elif event.type == "error":
+                on_delta(StreamDelta(kind="done"))
+                raise ResponseStreamError(f"Stream error {event.code}: {event.message}")
+        on_delta(StreamDelta(kind="done"))
+        if response is None:
+            raise ResponseStreamError("The stream ended without a completed or incomplete response")
         return response
     
     def extract_text_from_output(self, output: ResponseOutputItem) -> Optional[str]:
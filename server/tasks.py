@@ -3,6 +3,8 @@
 # from server.generator.generate_initial_demand import generate_initial_demand
 # from server.generator.generate_initial_agreement import generate_initial_agreement
 from server.celery_app import celery
+from celery import chord, group
+import os
 import time
 import json
 from server.utils.redis_cache import redis_client
@@ -10,17 +12,9 @@ from typing import List
 
 from server.utils.printer import Printer
 
-
-from server.utils.processor import (
-    process_workflow_execution,
-    request_changes,
-    process_example_files,
-    process_template_file,
-)
-
-from server.utils.processor_v2 import (
-    process_workflow_execution_v2,
-)
+# Los procesadores (PyMuPDF, Tesseract, Whisper/torch, clientes de IA) se
+# importan dentro de cada tarea: la API importa este módulo solo para
+# encolar con .delay() y no debe pagar el costo de cargarlos.
 
 printer = Printer("TASKS")
 
@@ -53,6 +47,8 @@ def async_process_workflow_execution(self, workflow_execution_id: str):
             f"Message sent to socketio to room: workflow_{workflow_execution_id}"
         )
 
+        from server.utils.processor import process_workflow_execution
+
         return process_workflow_execution(str(workflow_execution_id))
     except Exception as e:
         printer.error(f"Error al leer los archivos: {e}")
@@ -72,6 +68,8 @@ def async_request_changes(
 ):
     try:
         printer.info(f"Solicitando cambios para el asset {asset_id}")
+        from server.utils.processor import request_changes
+
         return request_changes(
             str(workflow_execution_id), str(asset_id), changes, not_id
         )
@@ -96,6 +94,8 @@ def async_process_example_files(
 ):
     try:
         printer.info(f"Procesando archivos de ejemplo para el workflow {workflow_id}")
+        from server.utils.processor import process_example_files
+
         return process_example_files(
             workflow_id, file_paths, output_examples_description
         )
@@ -115,6 +115,8 @@ def async_process_example_files(
 def async_process_template_file(self, workflow_id: str, file_path: str):
     try:
         printer.info(f"Procesando plantilla para el workflow {workflow_id}")
+        from server.utils.processor import process_template_file
+
         return process_template_file(workflow_id, file_path)
     except Exception as e:
         printer.error(f"Error al procesar plantilla: {e}")
@@ -149,7 +151,118 @@ def async_process_workflow_execution_v2(self, workflow_execution_id: str):
             f"Message sent to socketio to room: workflow_{workflow_execution_id}"
         )
 
+        from server.utils.processor_v2 import process_workflow_execution_v2
+
         return process_workflow_execution_v2(str(workflow_execution_id))
     except Exception as e:
         printer.error(f"Error al procesar workflow V2: {e}")
         raise e
+
+
+@celery.task(
+    name="process_asset",
+    autoretry_for=(Exception,),
+    retry_kwargs={"countdown": 10},
+    retry_backoff=True,
+    bind=True,
+    max_retries=5,
+)
+def async_process_asset(self, asset_id: str):
+    try:
+        printer.info(f"Extrayendo texto del asset {asset_id}")
+        from server.utils.asset_extractor import process_asset
+
+        return process_asset(str(asset_id))
+    except Exception as e:
+        printer.error(f"Error al extraer el texto del asset {asset_id}: {e}")
+        raise e
+
+
+@celery.task(name="workflow_execution_failed")
+def async_workflow_execution_failed(workflow_execution_id: str):
+    """
+    Errback del chord de extracción en paralelo: si una subtarea agota sus
+    reintentos el callback nunca corre, así que la ejecución se marca en
+    ERROR aquí. También corre si falla el propio callback.
+    """
+    printer.error(f"Falló el procesamiento en paralelo de la ejecución {workflow_execution_id}")
+    from server.utils.asset_extractor import mark_execution_failed
+
+    mark_execution_failed(
+        str(workflow_execution_id),
+        "No se pudo procesar la ejecución: falló la extracción de algún archivo o el agente.",
+    )
+
+
+@celery.task(name="process_workflow_execution_parallel", bind=True)
+def async_process_workflow_execution_parallel(
+    self, workflow_execution_id: str, use_v2: bool = False
+):
+    """
+    Lanza una subtarea por cada asset pendiente y, cuando todas terminan,
+    ejecuta el procesador (V1 o V2) como callback del chord. Los assets ya
+    quedan en DONE, así que el procesador pasa directo al agente.
+
+    No se reintenta: un reintento después de lanzar el chord lo lanzaría de
+    nuevo y se extraería todo dos veces. Si falla antes, la ejecución queda
+    en ERROR.
+    """
+    workflow_execution_id = str(workflow_execution_id)
+    try:
+        callback_task = (
+            async_process_workflow_execution_v2
+            if use_v2
+            else async_process_workflow_execution
+        )
+        callback = callback_task.si(workflow_execution_id).on_error(
+            async_workflow_execution_failed.si(workflow_execution_id)
+        )
+
+        from server.utils.asset_extractor import get_pending_asset_ids
+
+        pending_asset_ids = get_pending_asset_ids(workflow_execution_id)
+        if not pending_asset_ids:
+            return callback.delay().id
+
+        printer.info(
+            f"Extrayendo {len(pending_asset_ids)} assets en paralelo para la ejecución {workflow_execution_id}"
+        )
+        redis_client.publish(
+            "workflow_updates",
+            json.dumps(
+                {
+                    "workflow_execution_id": workflow_execution_id,
+                    "log": f"¡Proceso iniciado! Procesando {len(pending_asset_ids)} archivos en paralelo.",
+                    "status": "PROCESSING",
+                    "assets_ready": False,
+                }
+            ),
+        )
+        header = group(async_process_asset.s(asset_id) for asset_id in pending_asset_ids)
+    except Exception as e:
+        printer.error(f"Error al lanzar la extracción en paralelo: {e}")
+        from server.utils.asset_extractor import mark_execution_failed
+
+        mark_execution_failed(
+            workflow_execution_id, f"No se pudo iniciar el procesamiento: {e}"
+        )
+        raise e
+    return chord(header)(callback).id
+
+
+def enqueue_workflow_execution(workflow_execution_id: str):
+    """
+    Encola el procesamiento de una ejecución respetando los feature flags
+    USE_RESPONSES_API (procesador V2) y PARALLEL_ASSET_EXTRACTION (un chord
+    de subtareas por asset antes del agente).
+    """
+    use_v2 = os.getenv("USE_RESPONSES_API", "false").lower() == "true"
+    parallel = os.getenv("PARALLEL_ASSET_EXTRACTION", "false").lower() == "true"
+
+    if parallel:
+        return async_process_workflow_execution_parallel.delay(
+            str(workflow_execution_id), use_v2
+        )
+    if use_v2:
+        return async_process_workflow_execution_v2.delay(workflow_execution_id)
+    return async_process_workflow_execution.delay(workflow_execution_id)
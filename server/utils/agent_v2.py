@@ -2,17 +2,25 @@ from typing import List, Dict, Any, Callable, Optional
 from pydantic import BaseModel, Field
 from openai.types.responses.response_input_item import Message
 from openai.types.responses.response_output_message import ResponseOutputMessage
-from openai.types.responses import ResponseFunctionToolCall, ResponseFunctionCallOutputItem, ResponseFunctionToolCall
+from openai.types.responses import ResponseFunctionToolCall
 
 
 from openai.types.responses.response_input_text import ResponseInputText
+import os
 import json
 import logging
 
+from openai import NotFoundError
+
 from server.services.openai_responses_service import ResponsesAPIService    
+from server.ai.context_compactor import context_compactor
+from server.ai.tool_executor import execute_tool_calls
 
 logger = logging.getLogger(__name__)
 
+# Chain turns server-side with previous_response_id instead of resending the whole input
+RESPONSES_API_CHAIN = os.getenv("RESPONSES_API_CHAIN", "true").lower() == "true"
+
 
 class AgentTool(BaseModel):
     """Configuration for an agent tool"""
@@ -21,14 +29,12 @@ class AgentTool(BaseModel):
     parameters: Dict[str, Any] = Field(..., description="Tool parameters schema")
     
     def to_openai_format(self) -> Dict[str, Any]:
-        """Convert to OpenAI tool format"""
+        """Convert to the Responses API tool format (flat, unlike Chat Completions)"""
         return {
             "type": "function",
-            "function": {
-                "name": self.name,
-                "description": self.description,
-                "parameters": self.parameters,
-            }
+            "name": self.name,
+            "description": self.description,
+            "parameters": self.parameters,
         }
 
 
@@ -40,6 +46,18 @@ class AgentExecutionResult(BaseModel):
     iterations: int = Field(0, description="Number of iterations executed")
 
 
+def build_function_output(call_id: str, output: str) -> Dict[str, Any]:
+    """Function call result as a Responses API input item"""
+    return {"type": "function_call_output", "call_id": call_id, "output": output}
+
+
+def serialize_input_item(item: Any) -> Dict[str, Any]:
+    """Convert a Responses API input/output item into a JSON-serializable dict"""
+    if hasattr(item, "model_dump"):
+        return item.model_dump(exclude_none=True)
+    return item
+
+
 class WorkflowAgent:
     """Agent for executing workflows using OpenAI's Responses API"""
     
@@ -48,10 +66,12 @@ class WorkflowAgent:
         openai_service: ResponsesAPIService,
         model: str = "gpt-4o-mini",
         max_iterations: int = 20,
+        chain_responses: bool = RESPONSES_API_CHAIN,
     ):
         self.openai_service = openai_service
         self.model = model
         self.max_iterations = max_iterations
+        self.chain_responses = chain_responses
     
     def execute(
         self,
@@ -60,6 +80,9 @@ class WorkflowAgent:
         tools: List[AgentTool],
         tools_fn_map: Dict[str, Callable],
         on_message_callback: Optional[Callable] = None,
+        initial_messages: Optional[List[Dict[str, Any]]] = None,
+        on_turn_callback: Optional[Callable] = None,
+        on_delta_callback: Optional[Callable] = None,
     ) -> AgentExecutionResult:
         """
         Execute agent loop with function calling.
@@ -70,6 +93,9 @@ class WorkflowAgent:
             tools: List of tools available to the agent
             tools_fn_map: Map of tool names to callable functions
             on_message_callback: Optional callback for each message
+            initial_messages: Serialized input items from a previous run to resume from
+            on_turn_callback: Optional callback with the serialized input items after each tool turn
+            on_delta_callback: Optional callback that streams each response as StreamDelta fragments
             
         Returns:
             AgentExecutionResult with execution details
@@ -78,29 +104,59 @@ class WorkflowAgent:
         tools_openai = [tool.to_openai_format() for tool in tools]
         
         # Build initial messages
-        messages: List[Message | ResponseOutputMessage] = [
-            Message(
-                role="user",
-                content=[ResponseInputText(text=user_message, type="input_text")]
-            )
-        ]
+        if initial_messages:
+            messages: List[Any] = list(initial_messages)
+        else:
+            messages: List[Any] = [
+                Message(
+                    role="user",
+                    content=[ResponseInputText(text=user_message, type="input_text")]
+                )
+            ]
         
         all_messages = []
         iteration = 0
         final_response = ""
+        # When chaining, the server keeps the conversation and each request only
+        # carries the items added since the previous response. `messages` still
+        # holds the full history for checkpoints and for restarting the chain.
+        previous_response_id: Optional[str] = None
+        new_items: List[Any] = []
         
         try:
             while iteration < self.max_iterations:
                 iteration += 1
                 logger.info(f"Agent iteration {iteration}")
                 
-                # Get response from OpenAI
-                response = self.openai_service.create_response(
-                    input_data=messages,
-                    tools=tools_openai if tools else None,
-                    model=self.model,
-                    instructions=system_instructions,
-                )
+                response = None
+                if previous_response_id:
+                    try:
+                        response = self.openai_service.create_response(
+                            input_data=new_items,
+                            tools=tools_openai if tools else None,
+                            model=self.model,
+                            instructions=system_instructions,
+                            previous_response_id=previous_response_id,
+                            on_delta=on_delta_callback,
+                        )
+                    except NotFoundError:
+                        # The stored response expired or was deleted, resend the history
+                        logger.warning(f"Response {previous_response_id} not found, resending the full input")
+                
+                if response is None:
+                    # Compact old tool arguments/outputs so the full resend stays small
+                    messages = context_compactor.compact(
+                        [serialize_input_item(m) for m in messages],
+                        self.model,
+                        instructions=system_instructions,
+                    )
+                    response = self.openai_service.create_response(
+                        input_data=messages,
+                        tools=tools_openai if tools else None,
+                        model=self.model,
+                        instructions=system_instructions,
+                        on_delta=on_delta_callback,
+                    )
                 
                 if not response:
                     error_msg = "Error getting response from OpenAI"
@@ -112,6 +168,19 @@ class WorkflowAgent:
                         iterations=iteration
                     )
                 
+                if self.chain_responses:
+                    previous_response_id = response.id
+                    # The server-side context keeps growing; past the compaction target
+                    # the chain restarts from the compacted local history
+                    usage = getattr(response, "usage", None)
+                    if (
+                        context_compactor.enabled
+                        and usage
+                        and usage.input_tokens > context_compactor.target_tokens
+                    ):
+                        previous_response_id = None
+                new_items = []
+                
                 # Process response outputs
                 function_calls = []
                 
@@ -139,40 +208,43 @@ class WorkflowAgent:
                 if function_calls:
                     logger.info(f"Processing {len(function_calls)} function calls")
                     
+                    calls = []
                     for func_call in function_calls:
                         tool_name = func_call.name
-                        call_id = func_call.call_id
                         args_str = func_call.arguments if hasattr(func_call, 'arguments') else "{}"
                         
                         try:
                             args = json.loads(args_str) if isinstance(args_str, str) else args_str
-                            logger.info(f"Executing function: {tool_name} with args: {args}")
-                            
-                            # Execute the function
-                            if tool_name in tools_fn_map:
-                                result = tools_fn_map[tool_name](**args)
-                            else:
-                                result = f"Function {tool_name} not found"
-                                logger.error(f"Function {tool_name} not found in tools_fn_map")
-                            
-                            # Add function result to messages
-                            function_output = ResponseFunctionToolCall(
-                                call_id=call_id,
-                                output=str(result),
-                                type="function_call_output"
-                            )
-                            messages.append(function_output)
-                            
-                        except Exception as e:
-                            error_msg = f"Error executing function {tool_name}: {str(e)}"
-                            logger.error(error_msg, exc_info=True)
-                            
-                            function_output = ResponseFunctionToolCall(
-                                call_id=call_id,
-                                output=error_msg,
-                                type="function_call_output"
-                            )
-                            messages.append(function_output)
+                        except ValueError as e:
+                            def invalid_arguments(error=e):
+                                raise error
+                            calls.append((invalid_arguments, {}))
+                            continue
+                        logger.info(f"Executing function: {tool_name} with args: {args}")
+                        
+                        if tool_name in tools_fn_map:
+                            calls.append((tools_fn_map[tool_name], args))
+                        else:
+                            logger.error(f"Function {tool_name} not found in tools_fn_map")
+                            calls.append((lambda name=tool_name: f"Function {name} not found", {}))
+                    
+                    # Thread-safe tools run concurrently; results keep the call order
+                    results = execute_tool_calls(calls)
+                    for func_call, tool_result in zip(function_calls, results):
+                        if tool_result.error:
+                            error_msg = f"Error executing function {func_call.name}: {str(tool_result.error)}"
+                            logger.error(error_msg, exc_info=tool_result.error)
+                            output = error_msg
+                        else:
+                            output = str(tool_result.output)
+                        
+                        # Add function result to messages
+                        function_output = build_function_output(func_call.call_id, output)
+                        messages.append(function_output)
+                        new_items.append(function_output)
+                    
+                    if on_turn_callback:
+                        on_turn_callback([serialize_input_item(m) for m in messages])
                     
                     # Continue loop to process next iteration
                     continue
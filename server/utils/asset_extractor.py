@@ -0,0 +1,194 @@
+import os
+import json
+from datetime import datetime
+from sqlalchemy import func
+
+from server.utils.printer import Printer
+from server.utils.pdf_reader import DocumentReader
+from server.utils.image_reader import ImageReader
+from server.utils.audio_reader import AudioReader, get_whisper_model_name
+from server.utils.redis_cache import redis_client
+from server.db import session_context_sync
+from server.models import (
+    Asset,
+    AssetStatus,
+    AssetType,
+    WorkflowExecution,
+    WorkflowExecutionStatus,
+)
+
+printer = Printer("ASSET_EXTRACTOR")
+
+DOCUMENT_EXTENSIONS = [".pdf", ".docx"]
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png", ".bmp", ".tiff"]
+TEXT_EXTENSIONS = [".txt", ".xml", ".html", ".md", ".json", ".csv"]
+AUDIO_EXTENSIONS = [".mp3", ".wav", ".m4a", ".webm"]
+
+audio_reader = AudioReader(
+    model_name=get_whisper_model_name("assets"), include_timestamps=False
+)
+
+
+def publish_workflow_log(workflow_execution_id: str, log: str):
+    redis_client.publish(
+        "workflow_updates",
+        json.dumps(
+            {
+                "workflow_execution_id": str(workflow_execution_id),
+                "log": log,
+                "status": "PROCESSING",
+                "assets_ready": False,
+            }
+        ),
+    )
+
+
+def mark_execution_failed(workflow_execution_id: str, message: str):
+    """
+    Deja la ejecución en ERROR con el motivo en status_message y avisa a la
+    sala del workflow. Lo usa el errback del chord de extracción en paralelo,
+    donde ninguna otra tarea registra el fallo.
+    """
+    with session_context_sync() as session:
+        session.query(WorkflowExecution).filter(
+            WorkflowExecution.id == workflow_execution_id
+        ).update(
+            {
+                WorkflowExecution.status: WorkflowExecutionStatus.ERROR,
+                WorkflowExecution.status_message: message,
+                WorkflowExecution.finished_at: datetime.now(),
+                WorkflowExecution.generation_log: func.coalesce(
+                    WorkflowExecution.generation_log, ""
+                )
+                + f"<error>{message}</error>\n",
+            },
+            synchronize_session=False,
+        )
+        session.commit()
+
+    redis_client.publish(
+        "workflow_updates",
+        json.dumps(
+            {
+                "workflow_execution_id": str(workflow_execution_id),
+                "log": message,
+                "status": "ERROR",
+                "assets_ready": False,
+            }
+        ),
+    )
+
+
+def get_asset_file_path(asset: Asset) -> str:
+    file_extension = os.path.splitext(asset.name)[1]
+    return f"uploads/{asset.workflow_execution_id}/{asset.id}{file_extension}"
+
+
+def extract_asset_text(
+    asset: Asset,
+    workflow_description: str | None,
+    document_reader: DocumentReader | None = None,
+    image_reader: ImageReader | None = None,
+) -> tuple[str | None, str]:
+    """
+    Extrae el texto de un asset de tipo FILE según la extensión del archivo.
+    Devuelve el texto extraído y las líneas que se agregan al log de generación.
+    """
+    file_path = get_asset_file_path(asset)
+    ext = os.path.splitext(asset.name)[1].lower()
+    workflow_execution_id = str(asset.workflow_execution_id)
+
+    if ext in DOCUMENT_EXTENSIONS:
+        extracted_text = (document_reader or DocumentReader()).read(file_path)
+        return extracted_text, f"Contenido del archivo {asset.name} extraído con exito.\n"
+
+    if ext in IMAGE_EXTENSIONS:
+        brief_hint = (
+            "\nEsta descripción puede ser útil: " + asset.brief if asset.brief else ""
+        )
+        extracted_text = (image_reader or ImageReader()).read(
+            file_path,
+            f"Nombre del archivo adjunto: {asset.name}. Se está realizando un flujo de trabajo que requiere de la información de la imagen. Esta es una descripción del flujo de trabajo para que puedas entender mejor el tipo de información que se requiere extraer de la imagen: {workflow_description}. Extrae la información que pueda ser útil para el flujo de trabajo en la imagen. {brief_hint}",
+        )
+        return extracted_text, f"Contenido de la imagen {asset.name} extraído con exito.\n"
+
+    if ext in TEXT_EXTENSIONS:
+        with open(file_path, "r", encoding="utf-8") as f:
+            extracted_text = f.read()
+        return extracted_text, f"Contenido del archivo {asset.name} extraído con exito.\n"
+
+    if ext in AUDIO_EXTENSIONS:
+        publish_workflow_log(
+            workflow_execution_id,
+            f"El agente IA está transcribiendo el audio {asset.name}.",
+        )
+        extracted_text = audio_reader.read(
+            file_path,
+            on_progress=lambda done, total: publish_workflow_log(
+                workflow_execution_id,
+                f"Transcribiendo {asset.name}: segmento {done} de {total}.",
+            ),
+        )
+        return (
+            extracted_text,
+            f"Se realizó la transcripción del audio {asset.name} con exito.\n",
+        )
+
+    return None, ""
+
+
+def get_pending_asset_ids(workflow_execution_id: str) -> list[str]:
+    """Devuelve los ids de los assets de tipo FILE que aún no fueron extraídos."""
+    with session_context_sync() as session:
+        assets = (
+            session.query(Asset)
+            .filter(
+                Asset.workflow_execution_id == workflow_execution_id,
+                Asset.asset_type == AssetType.FILE,
+                Asset.status != AssetStatus.DONE,
+            )
+            .all()
+        )
+        return [str(asset.id) for asset in assets]
+
+
+def process_asset(asset_id: str):
+    """
+    Extrae el texto de un único asset. Se usa desde las subtareas de Celery
+    que procesan los assets de una ejecución en paralelo.
+    """
+    with session_context_sync() as session:
+        asset = session.query(Asset).filter(Asset.id == asset_id).first()
+        if not asset:
+            printer.error(f"No se encontró el asset {asset_id}")
+            return
+        if asset.status == AssetStatus.DONE:
+            return str(asset.id)
+
+        workflow_execution = asset.workflow_execution
+        extracted_text, log = extract_asset_text(
+            asset, workflow_execution.workflow.description
+        )
+
+        asset.extracted_text = extracted_text
+        asset.content = extracted_text
+        asset.status = AssetStatus.DONE
+        # Varias subtareas escriben el log de la misma ejecución a la vez,
+        # la concatenación se hace en la base de datos para no perder líneas.
+        session.query(WorkflowExecution).filter(
+            WorkflowExecution.id == workflow_execution.id
+        ).update(
+            {
+                WorkflowExecution.generation_log: func.coalesce(
+                    WorkflowExecution.generation_log, ""
+                )
+                + f"Procesando archivo: {asset.name}\n{log}"
+            },
+            synchronize_session=False,
+        )
+        session.commit()
+
+        publish_workflow_log(
+            str(workflow_execution.id), f"Se extrajo el texto de **{asset.name}**."
+        )
+        return str(asset.id)
@@ -1,9 +1,18 @@
 import os
+import time
+import socket
+import json
+import atexit
 import hashlib
+import threading
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable
 from dotenv import load_dotenv
-import whisper
 from server.utils.printer import Printer
+from server.utils.extraction_cache import extraction_cache
+from server.utils.redis_cache import redis_client
+from server.utils.audio_segmenter import split_on_silence, SAMPLE_RATE
 
 # =========================
 # Configuración flexible
@@ -17,15 +26,245 @@ load_dotenv()
 
 printer = Printer("AUDIO_READER")
 
+# Modelo por defecto; WHISPER_MODEL_<CARGA> lo cambia para una carga concreta,
+# ej. WHISPER_MODEL_EXAMPLES=tiny para los archivos de ejemplo de un workflow.
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+WHISPER_WARMUP = os.getenv("WHISPER_WARMUP", "true").lower() == "true"
+# "whisper" (openai-whisper/torch) o "faster-whisper" (CTranslate2, cuantizado en CPU)
+ASR_BACKEND = os.getenv("ASR_BACKEND", "whisper").lower()
+FASTER_WHISPER_COMPUTE_TYPE = os.getenv("FASTER_WHISPER_COMPUTE_TYPE", "int8")
+# Cada proceso hijo del worker de Celery puede estar transcribiendo a la vez
+# con su propio pool, así que los CPUs se reparten entre CELERY_CONCURRENCY
+# (igual que TESSERACT_WORKERS en image_reader)
+AUDIO_CPU_BUDGET = max(1, (os.cpu_count() or 1) // int(os.getenv("CELERY_CONCURRENCY", 8)))
+# Procesos para transcribir los segmentos de un audio largo; cada uno carga su modelo
+AUDIO_TRANSCRIBE_WORKERS = int(
+    os.getenv("AUDIO_TRANSCRIBE_WORKERS", max(1, min(4, AUDIO_CPU_BUDGET // 2)))
+)
+# El pool de transcripción se reutiliza entre audios; se cierra tras este tiempo sin uso
+AUDIO_POOL_IDLE_SECONDS = float(os.getenv("AUDIO_POOL_IDLE_SECONDS", 600))
+
+
+def get_whisper_model_name(workload: str | None = None) -> str:
+    if workload:
+        return os.getenv(f"WHISPER_MODEL_{workload.upper()}", WHISPER_MODEL)
+    return WHISPER_MODEL
+
+
+def get_rss_mb() -> float | None:
+    """Memoria residente actual del proceso en MB (solo Linux)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class FasterWhisperModel:
+    """
+    Adapta faster-whisper a la interfaz de openai-whisper: transcribe()
+    devuelve {"text", "segments"} con segmentos {"start", "end", "text"}.
+    """
+
+    def __init__(self, model_name: str, compute_type: str = FASTER_WHISPER_COMPUTE_TYPE):
+        from faster_whisper import WhisperModel
+
+        # cpu_threads=0 usa OMP_NUM_THREADS, que el pool de transcripción ajusta
+        self.model = WhisperModel(model_name, device="cpu", compute_type=compute_type)
+
+    def transcribe(self, audio, **kwargs) -> dict:
+        segments, info = self.model.transcribe(audio, **kwargs)
+        # segments es un generador: la transcripción ocurre al recorrerlo
+        segments = [
+            {"start": segment.start, "end": segment.end, "text": segment.text}
+            for segment in segments
+        ]
+        return {
+            "text": "".join(segment["text"] for segment in segments),
+            "segments": segments,
+            "language": info.language,
+        }
+
+
+class WhisperModelRegistry:
+    """
+    Modelos de Whisper cargados en este proceso, uno por backend y tamaño. Cada worker
+    de Celery carga un modelo una sola vez (o al arrancar, ver warmup) y lo
+    comparten el procesador V1, el V2 y los archivos de ejemplo.
+    """
+
+    METRICS_KEY = "worker_metrics:whisper"
+
+    def __init__(self):
+        self.models: dict = {}
+        self.metrics: dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def get(self, model_name: str, backend: str = ASR_BACKEND):
+        key = f"{backend}:{model_name}"
+        model = self.models.get(key)
+        if model is not None:
+            return model
+        with self.lock:
+            if key not in self.models:
+                self.models[key] = self._load(model_name, backend)
+        return self.models[key]
+
+    def _load(self, model_name: str, backend: str):
+        printer.yellow(f"Cargando modelo Whisper: {model_name} ({backend})")
+        rss_before = get_rss_mb()
+        start = time.perf_counter()
+        if backend == "faster-whisper":
+            model = FasterWhisperModel(model_name)
+        else:
+            # whisper importa torch; se carga solo en el worker que transcribe
+            import whisper
+
+            model = whisper.load_model(model_name)
+        load_seconds = time.perf_counter() - start
+        rss_after = get_rss_mb()
+
+        metrics = {
+            "model": model_name,
+            "backend": backend,
+            "pid": os.getpid(),
+            "load_seconds": round(load_seconds, 2),
+            "rss_mb": round(rss_after, 1) if rss_after is not None else None,
+            "rss_delta_mb": (
+                round(rss_after - rss_before, 1)
+                if rss_after is not None and rss_before is not None
+                else None
+            ),
+        }
+        self.metrics[f"{backend}:{model_name}"] = metrics
+        printer.green(
+            f"Modelo Whisper {model_name} cargado en {metrics['load_seconds']}s "
+            f"(RSS {metrics['rss_mb']} MB, +{metrics['rss_delta_mb']} MB)"
+        )
+        try:
+            redis_client.hset(
+                self.METRICS_KEY,
+                f"{socket.gethostname()}:{os.getpid()}:{backend}:{model_name}",
+                json.dumps(metrics),
+            )
+        except Exception as e:
+            printer.yellow(f"No se pudieron publicar las métricas de Whisper: {e}")
+        return model
+
+    def warmup(self, model_names: list[str], backend: str = ASR_BACKEND):
+        """Carga los modelos y transcribe un segundo de silencio para inicializar el backend."""
+        import numpy as np
+
+        for model_name in model_names:
+            try:
+                start = time.perf_counter()
+                self.get(model_name, backend).transcribe(np.zeros(16000, dtype=np.float32))
+                printer.green(
+                    f"Warmup de Whisper {model_name} listo en {time.perf_counter() - start:.2f}s"
+                )
+            except Exception as e:
+                printer.red(f"Error en el warmup de Whisper {model_name}: {e}")
+
+
+whisper_models = WhisperModelRegistry()
+
+
+class TranscriptionPoolRegistry:
+    """
+    Pools de procesos para transcribir segmentos, uno por backend y modelo en
+    este proceso. Se crean con el primer audio largo y se reutilizan, así cada
+    proceso del pool carga el modelo una sola vez y no una vez por archivo.
+    Cada pool ocupa AUDIO_TRANSCRIBE_WORKERS modelos en memoria; si no se usa
+    durante AUDIO_POOL_IDLE_SECONDS se cierra para devolverla.
+    """
+
+    def __init__(self, idle_seconds: float = AUDIO_POOL_IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self.pools: dict[tuple[str, str], dict] = {}
+        self.lock = threading.Lock()
+        atexit.register(self.close_all)
+
+    @contextmanager
+    def acquire(self, backend: str, model_name: str, workers: int = AUDIO_TRANSCRIBE_WORKERS):
+        key = (backend, model_name)
+        with self.lock:
+            entry = self.pools.get(key)
+            if entry is None:
+                entry = self.pools[key] = {
+                    "pool": self._create(backend, model_name, workers),
+                    "in_use": 0,
+                    "timer": None,
+                }
+            if entry["timer"] is not None:
+                entry["timer"].cancel()
+                entry["timer"] = None
+            entry["in_use"] += 1
+        try:
+            yield entry["pool"]
+        finally:
+            with self.lock:
+                entry["in_use"] -= 1
+                if entry["in_use"] == 0:
+                    entry["timer"] = threading.Timer(self.idle_seconds, self.close, args=(key,))
+                    entry["timer"].daemon = True
+                    entry["timer"].start()
+
+    def _create(self, backend: str, model_name: str, workers: int):
+        # billiard (el multiprocessing de Celery) permite crear el pool desde
+        # un proceso hijo del worker, que es daemon. Se usa spawn porque
+        # hacer fork de un proceso que ya inicializó torch puede colgarse.
+        from billiard import get_context
+
+        threads = max(1, AUDIO_CPU_BUDGET // workers)
+        printer.yellow(f"Creando pool de transcripción: {workers} procesos con {model_name} ({backend})")
+        return get_context("spawn").Pool(
+            workers,
+            initializer=init_transcription_worker,
+            initargs=(backend, model_name, threads),
+        )
+
+    def close(self, key: tuple[str, str]):
+        with self.lock:
+            entry = self.pools.get(key)
+            if entry is None or entry["in_use"]:
+                return
+            del self.pools[key]
+        printer.yellow(f"Cerrando pool de transcripción sin uso: {key[1]} ({key[0]})")
+        entry["pool"].terminate()
+
+    def close_all(self):
+        for key in list(self.pools):
+            self.close(key)
+
+
+transcription_pools = TranscriptionPoolRegistry()
+
+
+def get_warmup_model_names() -> list[str]:
+    """Modelos configurados: WHISPER_MODEL y cualquier WHISPER_MODEL_<CARGA>."""
+    model_names = [WHISPER_MODEL]
+    for key, value in os.environ.items():
+        if key.startswith("WHISPER_MODEL_") and value and value not in model_names:
+            model_names.append(value)
+    return model_names
+
+
+ProgressCallback = Callable[[int, int], None]
+
 
 class AudioStrategy(ABC):
     @abstractmethod
-    def read(self, path: str) -> str:
+    def read(self, path: str, on_progress: ProgressCallback | None = None) -> str:
         pass
 
     def hash_text(self, text: str) -> str:
         return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
+    def cache_identity(self) -> str:
+        """Identifica la estrategia (y el modelo, si aplica) en el cache de extracción."""
+        return type(self).__name__
+
 
 # =========================
 # Estrategias específicas
@@ -33,34 +272,86 @@ class AudioStrategy(ABC):
 
 
 class WhisperStrategy(AudioStrategy):
-    def __init__(self, model_name: str = "base"):
+    backend = "whisper"
+
+    def __init__(self, model_name: str | None = None):
         """
         Inicializa la estrategia de Whisper con el modelo especificado.
 
         Args:
-            model_name: Nombre del modelo de Whisper a usar ('tiny', 'base', 'small', 'medium', 'large')
+            model_name: Nombre del modelo de Whisper a usar ('tiny', 'base', 'small', 'medium', 'large').
+                Por defecto WHISPER_MODEL.
         """
-        self.model_name = model_name
+        self.model_name = model_name or WHISPER_MODEL
         self.model = None
         printer.yellow(f"WhisperStrategy inicializada con modelo: {model_name}")
 
+    def cache_identity(self) -> str:
+        return f"{type(self).__name__}:{self.model_name}"
+
     def _load_model(self):
-        """Carga el modelo de Whisper si no está cargado."""
+        """Obtiene el modelo de Whisper del registro del proceso."""
         if self.model is None:
-            printer.yellow(f"Cargando modelo Whisper: {self.model_name}")
             try:
-                self.model = whisper.load_model(self.model_name)
-                printer.green(f"Modelo Whisper {self.model_name} cargado exitosamente")
+                self.model = whisper_models.get(self.model_name, self.backend)
             except Exception as e:
                 printer.red(f"Error cargando modelo Whisper: {e}")
                 raise
 
-    def read(self, path: str) -> str:
+    def transcribe(self, path: str, on_progress: ProgressCallback | None = None) -> dict:
+        """
+        Corta el audio en los silencios y transcribe los segmentos, en un pool
+        de procesos si hay más de uno. Los timestamps de cada segmento se
+        desplazan por su offset para que sean relativos al archivo completo.
+
+        Returns:
+            dict: {"text": str, "segments": [{"start", "end", "text"}]}
+        """
+        audio = self.load_audio(path)
+        segments = split_on_silence(audio)
+        total = len(segments)
+        args = [
+            (self.backend, self.model_name, segment.offset, segment.samples)
+            for segment in segments
+        ]
+        workers = min(AUDIO_TRANSCRIBE_WORKERS, total)
+
+        results = []
+        if workers <= 1:
+            # Solo este camino usa el modelo del proceso; el pool carga el suyo
+            limit_transcription_threads(self.backend)
+            self._load_model()
+            for args_item in args:
+                results.append(transcribe_segment(args_item))
+                if on_progress:
+                    on_progress(len(results), total)
+        else:
+            printer.yellow(f"Transcribiendo {total} segmentos con {workers} procesos")
+            with transcription_pools.acquire(self.backend, self.model_name) as pool:
+                # imap conserva el orden de los segmentos
+                for result in pool.imap(transcribe_segment, args):
+                    results.append(result)
+                    if on_progress:
+                        on_progress(len(results), total)
+
+        return {
+            "text": " ".join(r["text"] for r in results if r["text"]),
+            "segments": [segment for r in results for segment in r["segments"]],
+        }
+
+    def load_audio(self, path: str):
+        """Decodifica el archivo a mono 16 kHz float32 (requiere ffmpeg)."""
+        import whisper
+
+        return whisper.load_audio(path)
+
+    def read(self, path: str, on_progress: ProgressCallback | None = None) -> str:
         """
         Transcribe el archivo de audio usando Whisper.
 
         Args:
             path: Ruta al archivo de audio
+            on_progress: Callback (segmentos terminados, total de segmentos)
 
         Returns:
             str: Texto transcrito del audio
@@ -78,12 +369,10 @@ class WhisperStrategy(AudioStrategy):
             )
 
         try:
-            self._load_model()
-
             printer.yellow(f"Transcribiendo archivo: {path}")
 
             # Transcribir el audio
-            result = self.model.transcribe(path)
+            result = self.transcribe(path, on_progress)
 
             # Extraer el texto transcrito
             transcribed_text = result["text"].strip()
@@ -104,12 +393,13 @@ class WhisperStrategy(AudioStrategy):
 
 
 class WhisperWithTimestampsStrategy(WhisperStrategy):
-    def read(self, path: str) -> str:
+    def read(self, path: str, on_progress: ProgressCallback | None = None) -> str:
         """
         Transcribe el archivo de audio usando Whisper y incluye timestamps.
 
         Args:
             path: Ruta al archivo de audio
+            on_progress: Callback (segmentos terminados, total de segmentos)
 
         Returns:
             str: Texto transcrito con timestamps
@@ -118,32 +408,17 @@ class WhisperWithTimestampsStrategy(WhisperStrategy):
             raise FileNotFoundError(f"Archivo de audio no encontrado: {path}")
 
         try:
-            self._load_model()
-
             printer.yellow(f"Transcribiendo archivo con timestamps: {path}")
 
             # Transcribir el audio con timestamps
-            result = self.model.transcribe(path, verbose=True)
+            result = self.transcribe(path, on_progress)
 
             # Construir texto con timestamps
             segments = result.get("segments", [])
             if not segments:
                 return result.get("text", "").strip()
 
-            transcribed_text = []
-            for segment in segments:
-                start_time = segment.get("start", 0)
-                end_time = segment.get("end", 0)
-                text = segment.get("text", "").strip()
-
-                if text:
-                    # Formatear tiempo como MM:SS
-                    start_str = f"{int(start_time//60):02d}:{int(start_time%60):02d}"
-                    end_str = f"{int(end_time//60):02d}:{int(end_time%60):02d}"
-
-                    transcribed_text.append(f"[{start_str}-{end_str}] {text}")
-
-            final_text = "\n".join(transcribed_text)
+            final_text = format_timestamped_segments(segments)
 
             printer.green(
                 f"Transcripción con timestamps completada. Longitud del texto: {len(final_text)} caracteres"
@@ -156,6 +431,73 @@ class WhisperWithTimestampsStrategy(WhisperStrategy):
             raise
 
 
+class FasterWhisperStrategy(WhisperStrategy):
+    """
+    Whisper sobre CTranslate2 (faster-whisper) con pesos int8 en CPU. Usa el
+    mismo corte por silencios y devuelve el texto con el mismo formato.
+    """
+
+    backend = "faster-whisper"
+
+    def load_audio(self, path: str):
+        from faster_whisper import decode_audio
+
+        return decode_audio(path, sampling_rate=SAMPLE_RATE)
+
+
+class FasterWhisperWithTimestampsStrategy(FasterWhisperStrategy, WhisperWithTimestampsStrategy):
+    pass
+
+
+def format_timestamped_segments(segments: list[dict]) -> str:
+    transcribed_text = []
+    for segment in segments:
+        start_time = segment.get("start", 0)
+        end_time = segment.get("end", 0)
+        text = segment.get("text", "").strip()
+
+        if text:
+            # Formatear tiempo como MM:SS
+            start_str = f"{int(start_time//60):02d}:{int(start_time%60):02d}"
+            end_str = f"{int(end_time//60):02d}:{int(end_time%60):02d}"
+
+            transcribed_text.append(f"[{start_str}-{end_str}] {text}")
+
+    return "\n".join(transcribed_text)
+
+
+def limit_transcription_threads(backend: str, threads: int = AUDIO_CPU_BUDGET):
+    """Limita los hilos de CPU del modelo en este proceso; con faster-whisper debe ir antes de cargarlo."""
+    if backend == "faster-whisper":
+        os.environ["OMP_NUM_THREADS"] = str(threads)
+    else:
+        import torch
+
+        torch.set_num_threads(threads)
+
+
+def init_transcription_worker(backend: str, model_name: str, threads: int):
+    """Inicializa un proceso del pool de transcripción: reparte los cores y carga el modelo."""
+    limit_transcription_threads(backend, threads)
+    whisper_models.get(model_name, backend)
+
+
+def transcribe_segment(args: tuple) -> dict:
+    """(backend, modelo, offset en segundos, muestras) -> texto y segmentos con tiempos absolutos."""
+    backend, model_name, offset, samples = args
+    result = whisper_models.get(model_name, backend).transcribe(samples)
+    text = result.get("text", "").strip()
+    segments = [
+        {
+            "start": segment["start"] + offset,
+            "end": segment["end"] + offset,
+            "text": segment["text"],
+        }
+        for segment in result.get("segments", [])
+    ]
+    return {"text": text, "segments": segments}
+
+
 # =========================
 # Lector de audio
 # =========================
@@ -164,7 +506,7 @@ class WhisperWithTimestampsStrategy(WhisperStrategy):
 class AudioReader:
     text: str | None = None
 
-    def __init__(self, model_name: str = "base", include_timestamps: bool = False):
+    def __init__(self, model_name: str | None = None, include_timestamps: bool = False):
         """
         Inicializa el lector de audio.
 
@@ -172,17 +514,25 @@ class AudioReader:
             model_name: Nombre del modelo de Whisper a usar
             include_timestamps: Si incluir timestamps en la transcripción
         """
-        if include_timestamps:
-            self.strategy: AudioStrategy = WhisperWithTimestampsStrategy(model_name)
+        if ASR_BACKEND == "faster-whisper":
+            strategy_class = (
+                FasterWhisperWithTimestampsStrategy
+                if include_timestamps
+                else FasterWhisperStrategy
+            )
         else:
-            self.strategy: AudioStrategy = WhisperStrategy(model_name)
+            strategy_class = (
+                WhisperWithTimestampsStrategy if include_timestamps else WhisperStrategy
+            )
+        self.strategy: AudioStrategy = strategy_class(model_name)
 
-    def read(self, path: str) -> str:
+    def read(self, path: str, on_progress: ProgressCallback | None = None) -> str:
         """
         Lee y transcribe un archivo de audio.
 
         Args:
             path: Ruta al archivo de audio
+            on_progress: Callback (segmentos terminados, total de segmentos)
 
         Returns:
             str: Texto transcrito del audio
@@ -191,7 +541,14 @@ class AudioReader:
         if not os.path.isfile(path):
             raise FileNotFoundError(f"Archivo no encontrado: {path}")
 
-        self.text = self.strategy.read(path)
+        cache_key = extraction_cache.build_key(path, self.strategy.cache_identity())
+        cached_text = extraction_cache.get(cache_key)
+        if cached_text is not None:
+            self.text = cached_text
+            return self.text
+
+        self.text = self.strategy.read(path, on_progress)
+        extraction_cache.set(cache_key, self.text)
         return self.text
 
     def get_hash(self) -> str:
@@ -250,7 +607,7 @@ def is_audio_file(path: str) -> bool:
 
 
 def transcribe_audio_file(
-    path: str, model_name: str = "base", include_timestamps: bool = False
+    path: str, model_name: str | None = None, include_timestamps: bool = False
 ) -> str:
     """
     Función de conveniencia para transcribir un archivo de audio.
@@ -0,0 +1,92 @@
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+# Whisper trabaja con audio mono a 16 kHz (whisper.load_audio ya lo remuestrea)
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.03
+
+# Duración objetivo de cada segmento; el corte real cae en el silencio más
+# largo dentro de ±25% de ese punto.
+AUDIO_SEGMENT_SECONDS = float(os.getenv("AUDIO_SEGMENT_SECONDS", 120))
+AUDIO_MIN_SILENCE_SECONDS = float(os.getenv("AUDIO_MIN_SILENCE_SECONDS", 0.4))
+# Un frame es silencio si su energía es menor a esta fracción de la mediana
+AUDIO_SILENCE_RATIO = float(os.getenv("AUDIO_SILENCE_RATIO", 0.1))
+
+
+@dataclass
+class AudioSegment:
+    index: int
+    offset: float  # segundos desde el inicio del archivo
+    samples: np.ndarray
+
+
+def frame_rms(audio: np.ndarray, frame_length: int) -> np.ndarray:
+    n_frames = len(audio) // frame_length
+    frames = audio[: n_frames * frame_length].reshape(n_frames, frame_length)
+    return np.sqrt(np.mean(frames.astype(np.float32) ** 2, axis=1))
+
+
+def longest_silence(silent: np.ndarray, min_frames: int) -> tuple[int, int] | None:
+    """Inicio y fin (en frames) del tramo silencioso más largo, si dura al menos min_frames."""
+    padded = np.concatenate(([0], silent.astype(np.int8), [0]))
+    edges = np.diff(padded)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if len(starts) == 0:
+        return None
+    lengths = ends - starts
+    best = int(np.argmax(lengths))
+    if lengths[best] < min_frames:
+        return None
+    return int(starts[best]), int(ends[best])
+
+
+def find_split_points(
+    audio: np.ndarray,
+    segment_seconds: float = AUDIO_SEGMENT_SECONDS,
+    min_silence_seconds: float = AUDIO_MIN_SILENCE_SECONDS,
+    silence_ratio: float = AUDIO_SILENCE_RATIO,
+) -> list[int]:
+    """
+    Devuelve las muestras donde cortar el audio, buscando silencios (VAD por
+    energía) cerca de cada múltiplo de segment_seconds. Si no hay un silencio
+    suficientemente largo se corta en el frame más silencioso de la ventana.
+    """
+    frame_length = int(SAMPLE_RATE * FRAME_SECONDS)
+    rms = frame_rms(audio, frame_length)
+    n_frames = len(rms)
+    frames_per_segment = int(segment_seconds / FRAME_SECONDS)
+    if n_frames <= frames_per_segment * 1.5:
+        return []
+
+    silent = rms <= np.median(rms) * silence_ratio
+    min_silence_frames = max(1, int(min_silence_seconds / FRAME_SECONDS))
+    tolerance = frames_per_segment // 4
+
+    cuts = []
+    start = 0
+    # El último segmento puede durar hasta 1.5 veces el objetivo para no dejar colas cortas
+    while n_frames - start > frames_per_segment * 1.5:
+        low = start + frames_per_segment - tolerance
+        high = start + frames_per_segment + tolerance
+        silence = longest_silence(silent[low:high], min_silence_frames)
+        if silence:
+            cut = low + (silence[0] + silence[1]) // 2
+        else:
+            cut = low + int(np.argmin(rms[low:high]))
+        cuts.append(cut)
+        start = cut
+
+    return [cut * frame_length for cut in cuts]
+
+
+def split_on_silence(
+    audio: np.ndarray, segment_seconds: float = AUDIO_SEGMENT_SECONDS
+) -> list[AudioSegment]:
+    bounds = [0] + find_split_points(audio, segment_seconds) + [len(audio)]
+    return [
+        AudioSegment(index=i, offset=start / SAMPLE_RATE, samples=audio[start:end])
+        for i, (start, end) in enumerate(zip(bounds, bounds[1:]))
+    ]
@@ -0,0 +1,112 @@
+import os
+
+from server.utils.printer import Printer
+
+printer = Printer("CASE RETRIEVAL")
+
+# Modo recuperación (opcional): en vez de pegar el texto completo de los assets en
+# el prompt, se indexa en Chroma por ejecución y el agente busca lo que necesita
+# con la tool search_case_documents.
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "false").lower() == "true"
+# Con menos texto que esto se sigue usando el prompt completo, que es mejor para casos chicos
+RETRIEVAL_MIN_CHARS = int(os.getenv("RETRIEVAL_MIN_CHARS", 30000))
+RETRIEVAL_CHUNK_WORDS = int(os.getenv("RETRIEVAL_CHUNK_WORDS", 300))
+RETRIEVAL_CHUNK_OVERLAP = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", 50))
+RETRIEVAL_RESULTS = int(os.getenv("RETRIEVAL_RESULTS", 5))
+# Caracteres del inicio de cada asset que se incluyen en el resumen del prompt
+RETRIEVAL_PREVIEW_CHARS = int(os.getenv("RETRIEVAL_PREVIEW_CHARS", 600))
+# Chroma limita el tamaño de cada upsert
+UPSERT_BATCH_SIZE = 500
+
+SEARCH_TOOL_INSTRUCTIONS = (
+    "The uploaded files are too large to include in full. Below is a summary of each "
+    "file with its first lines. Use the search_case_documents tool to look up the facts, "
+    "names, dates and amounts you need before writing each document; search as many "
+    "times as necessary and don't invent information that you didn't find."
+)
+
+
+def get_collection_name(workflow_execution_id) -> str:
+    return f"execution_{workflow_execution_id}"
+
+
+def get_assets_text_size(assets: list) -> int:
+    return sum(len(asset.content) for asset in assets if asset.content)
+
+
+def should_use_retrieval(assets: list) -> bool:
+    return RETRIEVAL_ENABLED and get_assets_text_size(assets) >= RETRIEVAL_MIN_CHARS
+
+
+def index_execution_assets(workflow_execution_id, assets: list) -> int:
+    """
+    Divide el texto de cada asset en chunks y los guarda en la colección de
+    la ejecución. La colección se borra antes, así reindexar tras un reintento
+    no deja chunks de un intento anterior. Devuelve el número de chunks.
+    """
+    from server.ai.vector_store import get_chroma_client
+
+    chroma = get_chroma_client()
+    collection_name = get_collection_name(workflow_execution_id)
+    chroma.delete_collection(collection_name)
+    chunks = []
+    for asset in assets:
+        if not asset.content:
+            continue
+        asset_chunks = chroma.chunkify(
+            asset.content,
+            chunk_size=RETRIEVAL_CHUNK_WORDS,
+            chunk_overlap=RETRIEVAL_CHUNK_OVERLAP,
+        )
+        for i, chunk in enumerate(asset_chunks):
+            chunk.id = f"{asset.id}:{i}"
+            chunk.metadata = {"id": chunk.id, "asset_name": asset.name, "position": i}
+        chunks.extend(asset_chunks)
+
+    for start in range(0, len(chunks), UPSERT_BATCH_SIZE):
+        chroma.bulk_upsert_chunks(collection_name, chunks[start : start + UPSERT_BATCH_SIZE])
+    printer.green(f"Ejecución {workflow_execution_id}: {len(chunks)} chunks indexados")
+    return len(chunks)
+
+
+def delete_execution_index(workflow_execution_id):
+    """Se llama al terminar el agente, también si falla: no debe tapar el error original."""
+    from server.ai.vector_store import get_chroma_client
+
+    try:
+        get_chroma_client().delete_collection(get_collection_name(workflow_execution_id))
+    except Exception as e:
+        printer.yellow(f"No se pudo borrar el índice de la ejecución {workflow_execution_id}: {e}")
+
+
+def build_assets_summary(assets: list) -> str:
+    """Resumen compacto de los assets para el prompt: nombre, descripción, tamaño e inicio."""
+    summaries = []
+    for asset in assets:
+        if not asset.content:
+            continue
+        preview = asset.content[:RETRIEVAL_PREVIEW_CHARS]
+        if len(asset.content) > RETRIEVAL_PREVIEW_CHARS:
+            preview += " [...]"
+        summaries.append(
+            f'<ASSET_SUMMARY name="{asset.name}" description="{asset.brief or "No description"}" '
+            f'words="{len(asset.content.split())}">{preview}</ASSET_SUMMARY>'
+        )
+    return f"{SEARCH_TOOL_INSTRUCTIONS}\n" + "\n".join(summaries)
+
+
+def search_execution_index(workflow_execution_id, query: str, n_results: int = RETRIEVAL_RESULTS) -> str:
+    """Busca en los chunks de la ejecución y los devuelve con el asset de origen."""
+    from server.ai.vector_store import get_chroma_client
+
+    results = get_chroma_client().get_results(
+        get_collection_name(workflow_execution_id), [query], n_results=n_results
+    )
+    documents = results["documents"][0] if results.get("documents") else []
+    metadatas = results["metadatas"][0] if results.get("metadatas") else [{}] * len(documents)
+    if not documents:
+        return "No results found in the case documents."
+    return "\n".join(
+        f'<RESULT asset="{metadata.get("asset_name", "")}" position="{metadata.get("position", "")}">{document}</RESULT>'
+        for document, metadata in zip(documents, metadatas)
+    )
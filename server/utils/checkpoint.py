@@ -0,0 +1,130 @@
+import json
+import hashlib
+import threading
+from typing import Any, Callable
+
+from sqlalchemy.orm import Session
+from server.utils.printer import Printer
+from server.ai.tool_executor import is_thread_safe
+from server.models import WorkflowExecution, WorkflowExecutionStage
+
+printer = Printer("CHECKPOINT")
+
+STAGE_ORDER = [
+    WorkflowExecutionStage.EXTRACT,
+    WorkflowExecutionStage.BUILD_PROMPT,
+    WorkflowExecutionStage.AGENT,
+    WorkflowExecutionStage.FINALIZE,
+    WorkflowExecutionStage.DONE,
+]
+
+
+class ExecutionCheckpoint:
+    """
+    Guarda en WorkflowExecution la etapa del pipeline
+    (extract -> build prompt -> agent -> finalize) y el progreso dentro de
+    cada una, para que un reintento de Celery o un /rerun continúe desde la
+    etapa que falló en vez de repetir llamadas al LLM.
+    """
+
+    def __init__(self, session: Session, workflow_execution: WorkflowExecution):
+        self.session = session
+        self.workflow_execution = workflow_execution
+        # La sesión no es thread-safe: las tools que corren en paralelo la usan
+        # (y el checkpoint la escribe) solo con este lock tomado
+        self.lock = threading.RLock()
+        # Llamada a tool en curso en cada hilo (ver stage_tool_result)
+        self.current_call = threading.local()
+        if self.workflow_execution.stage is None:
+            self.workflow_execution.stage = WorkflowExecutionStage.EXTRACT
+
+    @property
+    def stage(self) -> WorkflowExecutionStage:
+        return self.workflow_execution.stage
+
+    def should_run(self, stage: WorkflowExecutionStage) -> bool:
+        """True si la etapa aún no fue completada."""
+        return STAGE_ORDER.index(self.stage) <= STAGE_ORDER.index(stage)
+
+    def advance(self, stage: WorkflowExecutionStage):
+        if STAGE_ORDER.index(stage) <= STAGE_ORDER.index(self.stage):
+            return
+        printer.blue(
+            f"Ejecución {self.workflow_execution.id}: {self.stage.value} -> {stage.value}"
+        )
+        self.workflow_execution.stage = stage
+        self.session.commit()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return (self.workflow_execution.checkpoint or {}).get(key, default)
+
+    def set(self, key: str, value: Any):
+        # Se reasigna el dict completo para que SQLAlchemy detecte el cambio en la columna JSON
+        with self.lock:
+            data = dict(self.workflow_execution.checkpoint or {})
+            data[key] = value
+            self.workflow_execution.checkpoint = data
+            self.session.commit()
+
+    def save_agent_messages(self, messages: list):
+        """Callback de fin de turno del agente: guarda la conversación hasta ese punto."""
+        self.set("agent_messages", messages)
+
+    def _put_tool_result(self, call_key: str, result: str):
+        # Sin commit: lo hace quien llama, junto con lo que haya creado la tool
+        data = dict(self.workflow_execution.checkpoint or {})
+        data["tool_results"] = {**data.get("tool_results", {}), call_key: result}
+        self.workflow_execution.checkpoint = data
+
+    def stage_tool_result(self, result: str):
+        """
+        Para las tools que crean filas en la base: deja `result` como resultado
+        de la llamada en curso sin hacer commit, para que quede guardado en el
+        mismo commit que el asset. Se llama con el lock tomado, justo antes del
+        session.commit() de la tool.
+        """
+        call_key = getattr(self.current_call, "key", None)
+        if call_key is not None:
+            with self.lock:
+                self._put_tool_result(call_key, result)
+
+    def wrap_tools(self, tools_fn_map: dict[str, Callable]) -> dict[str, Callable]:
+        """
+        Envuelve las tools para que una llamada idéntica (mismo nombre y
+        argumentos) que ya se ejecutó devuelva el resultado guardado en vez de
+        volver a crear el asset o documento. Cada resultado se guarda apenas
+        la tool termina, así un reintento a mitad de turno no repite las
+        llamadas que ya se hicieron.
+        """
+
+        def wrap(tool_name: str, fn: Callable) -> Callable:
+            def wrapper(**kwargs):
+                call_key = hashlib.sha256(
+                    json.dumps([tool_name, kwargs], sort_keys=True).encode("utf-8")
+                ).hexdigest()
+                with self.lock:
+                    cached = self.get("tool_results", {}).get(call_key)
+                if cached is not None:
+                    printer.yellow(
+                        f"La tool {tool_name} ya se ejecutó con estos argumentos, se reutiliza el resultado"
+                    )
+                    return cached
+
+                self.current_call.key = call_key
+                try:
+                    result = str(fn(**kwargs))
+                finally:
+                    self.current_call.key = None
+                with self.lock:
+                    # Si la tool ya lo guardó con stage_tool_result no hace falta otro commit
+                    if self.get("tool_results", {}).get(call_key) != result:
+                        self._put_tool_result(call_key, result)
+                        self.session.commit()
+                return result
+
+            wrapper.__name__ = fn.__name__
+            wrapper.__doc__ = fn.__doc__
+            wrapper.thread_safe = is_thread_safe(fn)
+            return wrapper
+
+        return {name: wrap(name, fn) for name, fn in tools_fn_map.items()}
@@ -0,0 +1,209 @@
+import os
+import json
+import asyncio
+import hashlib
+import tempfile
+
+from server.utils.printer import Printer
+from server.utils.redis_cache import redis_client
+from server.utils.extraction_cache import hash_file
+
+printer = Printer("CONVERTER")
+
+CONVERTED_PATH = "uploads/converted"
+# Tiempo máximo de una conversión de pandoc (xelatex puede tardar bastante)
+CONVERSION_TIMEOUT = int(os.getenv("CONVERSION_TIMEOUT", 300))
+# Cuánto espera la petición antes de responder 202 y dejar que el cliente consulte el estado
+CONVERSION_WAIT_SECONDS = float(os.getenv("CONVERSION_WAIT_SECONDS", 15))
+
+# Archivos de referencia que cambian el resultado según el formato
+REFERENCE_FILES = {
+    "docx": "template.docx",
+    "html": "style.css",
+}
+
+
+class ConversionError(Exception):
+    pass
+
+
+def get_reference_version(export_type: str) -> str:
+    """Hash del archivo de referencia del formato, para invalidar el cache si cambia."""
+    reference_file = REFERENCE_FILES.get(export_type)
+    if reference_file and os.path.exists(reference_file):
+        return hash_file(reference_file)[:16]
+    return "none"
+
+
+def build_conversion_id(content: str, export_type: str) -> str:
+    sha = hashlib.sha256()
+    sha.update(content.encode("utf-8"))
+    sha.update(f"\0{export_type}\0{get_reference_version(export_type)}".encode("utf-8"))
+    return sha.hexdigest()[:32]
+
+
+def get_converted_filename(conversion_id: str, export_type: str) -> str:
+    return f"{conversion_id}.{export_type}"
+
+
+def build_pandoc_command(input_path: str, output_path: str, export_type: str) -> list[str]:
+    pandoc_cmd = ["pandoc", input_path, "-o", output_path]
+
+    # Add format-specific options
+    if export_type == "pdf":
+        pandoc_cmd.extend(["--pdf-engine=xelatex"])
+    elif export_type == "docx":
+        pandoc_cmd.extend(
+            ["--reference-doc=template.docx"] if os.path.exists("template.docx") else []
+        )
+    elif export_type == "html":
+        pandoc_cmd.extend(
+            ["--standalone", "--css=style.css"] if os.path.exists("style.css") else []
+        )
+    return pandoc_cmd
+
+
+async def run_pandoc(content: str, export_type: str, output_path: str):
+    """
+    Convierte markdown con pandoc en un subproceso asíncrono. El resultado se
+    escribe primero en un archivo parcial y se renombra al terminar, así nunca
+    se sirve desde el cache un archivo a medio escribir.
+    """
+    with tempfile.NamedTemporaryFile(
+        mode="w", suffix=".md", delete=False, encoding="utf-8"
+    ) as temp_md:
+        temp_md.write(content)
+        temp_md_path = temp_md.name
+
+    # Se conserva la extensión porque pandoc deduce el formato de salida de ella
+    partial_path = f"{output_path}.partial.{export_type}"
+    try:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *build_pandoc_command(temp_md_path, partial_path, export_type),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except FileNotFoundError:
+            raise ConversionError(
+                "Pandoc not found. Please install pandoc to use this feature."
+            )
+
+        try:
+            _, stderr = await asyncio.wait_for(
+                process.communicate(), timeout=CONVERSION_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise ConversionError(
+                f"Conversion timed out after {CONVERSION_TIMEOUT} seconds"
+            )
+
+        if process.returncode != 0:
+            raise ConversionError(
+                f"Error converting file: {stderr.decode('utf-8', errors='replace')}"
+            )
+        os.replace(partial_path, output_path)
+    finally:
+        os.unlink(temp_md_path)
+        if os.path.exists(partial_path):
+            os.unlink(partial_path)
+
+
+class ConversionManager:
+    """
+    Conversiones de assets con pandoc fuera del request. El resultado queda en
+    uploads/converted/{conversion_id}.{export_type}, donde el id es el hash del
+    contenido, el formato y la versión del archivo de referencia, así que una
+    exportación repetida se sirve directo del disco. El estado vive en Redis
+    para que cualquier worker de la API pueda responder la consulta de estado;
+    las llamadas a Redis y al disco van a un hilo para no bloquear el event loop.
+    """
+
+    PREFIX = "conversion"
+
+    def __init__(self):
+        # Conversiones en curso en este proceso, para no lanzar la misma dos veces
+        self.tasks: dict[str, asyncio.Task] = {}
+
+    def _key(self, conversion_id: str) -> str:
+        return f"{self.PREFIX}:{conversion_id}"
+
+    def _users_key(self, conversion_id: str) -> str:
+        return f"{self.PREFIX}:{conversion_id}:users"
+
+    def allow(self, conversion_id: str, user_email: str):
+        """
+        Registra que el usuario pidió la conversión. El id depende solo del
+        contenido, así que la consulta de estado se limita a quienes la pidieron.
+        """
+        key = self._users_key(conversion_id)
+        redis_client.sadd(key, user_email)
+        redis_client.expire(key, 60 * 60 * 24)
+
+    def is_allowed(self, conversion_id: str, user_email: str) -> bool:
+        return redis_client.sismember(self._users_key(conversion_id), user_email)
+
+    def get_output_path(self, conversion_id: str, export_type: str) -> str:
+        return os.path.join(
+            CONVERTED_PATH, get_converted_filename(conversion_id, export_type)
+        )
+
+    def get_status(self, conversion_id: str) -> dict | None:
+        data = redis_client.get(self._key(conversion_id))
+        return json.loads(data) if data else None
+
+    def _set_status(self, conversion_id: str, export_type: str, status: str, error: str | None = None):
+        redis_client.set(
+            self._key(conversion_id),
+            json.dumps(
+                {
+                    "status": status,
+                    "export_type": export_type,
+                    "filename": get_converted_filename(conversion_id, export_type),
+                    "error": error,
+                }
+            ),
+            # Si el proceso muere a mitad, el estado expira y se puede volver a pedir
+            ex=CONVERSION_TIMEOUT * 2 if status == "PROCESSING" else 60 * 60 * 24,
+        )
+
+    async def start(self, conversion_id: str, content: str, export_type: str) -> asyncio.Task | None:
+        """
+        Lanza la conversión si no existe ya el resultado ni hay una en curso.
+        Devuelve la tarea si corre en este proceso.
+        """
+        if conversion_id in self.tasks:
+            return self.tasks[conversion_id]
+        output_path = self.get_output_path(conversion_id, export_type)
+        if await asyncio.to_thread(os.path.exists, output_path):
+            await asyncio.to_thread(self._set_status, conversion_id, export_type, "DONE")
+            return None
+        status = await asyncio.to_thread(self.get_status, conversion_id)
+        if status and status["status"] == "PROCESSING":
+            return None
+
+        await asyncio.to_thread(self._set_status, conversion_id, export_type, "PROCESSING")
+        # Otra petición pudo lanzarla mientras se esperaba a Redis
+        if conversion_id in self.tasks:
+            return self.tasks[conversion_id]
+        task = asyncio.create_task(self._convert(conversion_id, content, export_type))
+        self.tasks[conversion_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(conversion_id, None))
+        return task
+
+    async def _convert(self, conversion_id: str, content: str, export_type: str):
+        output_path = self.get_output_path(conversion_id, export_type)
+        await asyncio.to_thread(os.makedirs, CONVERTED_PATH, exist_ok=True)
+        try:
+            await run_pandoc(content, export_type, output_path)
+        except Exception as e:
+            printer.red(f"Error en la conversión {conversion_id}: {e}")
+            await asyncio.to_thread(self._set_status, conversion_id, export_type, "ERROR", str(e))
+            return
+        printer.green(f"Conversión {conversion_id} lista: {output_path}")
+        await asyncio.to_thread(self._set_status, conversion_id, export_type, "DONE")
+
+
+conversions = ConversionManager()
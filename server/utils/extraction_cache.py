@@ -0,0 +1,82 @@
+import os
+import hashlib
+from server.utils.printer import Printer
+from server.utils.redis_cache import redis_client
+
+printer = Printer("EXTRACTION_CACHE")
+
+EXTRACTION_CACHE_ENABLED = (
+    os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+)
+# 30 días por defecto; cada hit renueva la expiración, así que solo se
+# eliminan las entradas que nadie vuelve a usar.
+EXTRACTION_CACHE_TTL = int(os.getenv("EXTRACTION_CACHE_TTL", 60 * 60 * 24 * 30))
+
+
+def settings_fingerprint(*settings) -> str:
+    """
+    Hash corto de los parámetros que cambian el texto extraído (umbrales,
+    prompts, separadores), para incluirlo en cache_identity.
+    """
+    return hashlib.sha256(repr(settings).encode("utf-8")).hexdigest()[:12]
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 del contenido del archivo, leído por bloques."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class ExtractionCache:
+    """
+    Cache de extracciones direccionado por contenido. La llave combina el hash
+    del archivo de entrada, la estrategia de lectura (incluyendo el modelo y
+    los parámetros que cambian el resultado) y, si aplica, el contexto que se
+    le pasa al modelo.
+    """
+
+    PREFIX = "extraction_cache"
+    # Subirla cuando cambia el formato del texto que devuelve algún lector
+    FORMAT_VERSION = 2
+
+    def __init__(
+        self,
+        ttl: int = EXTRACTION_CACHE_TTL,
+        enabled: bool = EXTRACTION_CACHE_ENABLED,
+    ):
+        self.ttl = ttl
+        self.enabled = enabled
+
+    def build_key(self, path: str, strategy: str, context: str | None = None) -> str:
+        key = f"{self.PREFIX}:v{self.FORMAT_VERSION}:{hash_file(path)}:{strategy}"
+        if context:
+            context_hash = hashlib.sha256(context.encode("utf-8")).hexdigest()
+            key += f":{context_hash[:16]}"
+        return key
+
+    def get(self, key: str) -> str | None:
+        if not self.enabled:
+            return None
+        try:
+            text = redis_client.get(key)
+            if text is not None:
+                redis_client.expire(key, self.ttl)
+                printer.green(f"Extracción encontrada en cache: {key}")
+            return text
+        except Exception as e:
+            printer.yellow(f"No se pudo leer el cache de extracción: {e}")
+            return None
+
+    def set(self, key: str, text: str | None) -> None:
+        if not self.enabled or not text:
+            return
+        try:
+            redis_client.set(key, text, ex=self.ttl)
+        except Exception as e:
+            printer.yellow(f"No se pudo guardar en el cache de extracción: {e}")
+
+
+extraction_cache = ExtractionCache()
@@ -6,25 +6,11 @@ import base64
 import io
 import pytesseract
 from dotenv import load_dotenv
+from server.utils.printer import Printer
 
-
-# tesseract_cmd = os.getenv("TESSERACT_CMD")
-# if tesseract_cmd:
-#     print("🔍 Usando tesseract_cmd:", tesseract_cmd)
-
-#     # Si es Windows, aseguramos que termina en tesseract.exe
-#     if os.name == "nt":
-#         if os.path.isdir(tesseract_cmd):
-#             tesseract_cmd = os.path.join(tesseract_cmd, "tesseract.exe")
-        
-#         if not os.path.isfile(tesseract_cmd):
-#             raise FileNotFoundError(
-#                 f"El ejecutable de tesseract no se encontró en: {tesseract_cmd}"
-#             )
-
-#     pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
 # IMPORTA TU INTERFAZ DE IA
 from server.ai.ai_interface import AIInterface
+from server.utils.extraction_cache import extraction_cache, settings_fingerprint
 
 # =========================
 # Configuración flexible
@@ -32,6 +18,51 @@ from server.ai.ai_interface import AIInterface
 
 load_dotenv()
 
+printer = Printer("IMAGE_READER")
+
+# Solo es necesario en Windows, donde tesseract no suele estar en el PATH
+tesseract_cmd = os.getenv("TESSERACT_CMD")
+if tesseract_cmd and os.name == "nt":
+    print("🔍 Usando tesseract_cmd:", tesseract_cmd)
+
+    if os.path.isdir(tesseract_cmd):
+        tesseract_cmd = os.path.join(tesseract_cmd, "tesseract.exe")
+
+    if not os.path.isfile(tesseract_cmd):
+        raise FileNotFoundError(
+            f"El ejecutable de tesseract no se encontró en: {tesseract_cmd}"
+        )
+
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+# "ai" envía todas las imágenes al modelo de visión; "tesseract" intenta
+# primero OCR local y solo escala al modelo cuando la confianza es baja
+OCR_ENGINE = os.getenv("OCR_ENGINE", "ai").lower()
+TESSERACT_LANG = os.getenv("TESSERACT_LANG", "spa")
+TESSERACT_MIN_CONFIDENCE = float(os.getenv("TESSERACT_MIN_CONFIDENCE", 70))
+TESSERACT_MIN_CHARS = int(os.getenv("TESSERACT_MIN_CHARS", 20))
+# Páginas por documento en paralelo. Cada proceso hijo de Celery tiene su
+# propio pool, así que por defecto se reparten los CPUs entre CELERY_CONCURRENCY
+TESSERACT_WORKERS = int(
+    os.getenv(
+        "TESSERACT_WORKERS",
+        max(1, (os.cpu_count() or 1) // int(os.getenv("CELERY_CONCURRENCY", 8))),
+    )
+)
+
+# Cada tesseract usa un solo hilo de OpenMP: el paralelismo ya viene de
+# TESSERACT_WORKERS. Se aplica solo al subproceso (pytesseract le pasa este
+# environ); en os.environ limitaría también a torch en Whisper.
+pytesseract.pytesseract.environ = {**os.environ, "OMP_THREAD_LIMIT": "1"}
+
+IMAGE_PROMPT = (
+    "Eres un asistente de IA que extrae información útil de imágenes. Si no hay texto, "
+    "solo explica en qué consiste la imagen de forma detallada. Si hay texto, la "
+    "extracción debe contener exactamente todo el texto disponible en la imagen junto "
+    "con la interpretación de lo que significa la imagen. Dicen que una imagen vale "
+    "más que mil palabras."
+)
+
 # =========================
 # Estrategia base
 # =========================
@@ -45,6 +76,10 @@ class ImageStrategy(ABC):
     def hash_text(self, text: str) -> str:
         return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
+    def cache_identity(self) -> str:
+        """Identifica la estrategia (y el modelo, si aplica) en el cache de extracción."""
+        return type(self).__name__
+
 
 # =========================
 # Utilidad para base64
@@ -59,12 +94,47 @@ def get_base64_image(path: str) -> str:
     return img_str
 
 
+def tesseract_ocr(image_bytes: bytes, lang: str = TESSERACT_LANG) -> tuple[str, float]:
+    """
+    Ejecuta Tesseract sobre una imagen y devuelve el texto (línea por línea,
+    en orden de lectura) y la confianza media de las palabras, de 0 a 100.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    data = pytesseract.image_to_data(
+        image, lang=lang, output_type=pytesseract.Output.DICT
+    )
+
+    lines: dict[tuple, list[str]] = {}
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        confidence = float(data["conf"][i])
+        if confidence < 0 or not word.strip():
+            continue
+        line_key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(line_key, []).append(word)
+        confidences.append(confidence)
+
+    text = "\n".join(" ".join(words) for words in lines.values())
+    confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return text, confidence
+
+
+def is_reliable_ocr(text: str, confidence: float) -> bool:
+    return (
+        confidence >= TESSERACT_MIN_CONFIDENCE
+        and len(text.strip()) >= TESSERACT_MIN_CHARS
+    )
+
+
 # =========================
 # Estrategias específicas
 # =========================
 
 
 class AIImageStrategy(ImageStrategy):
+    def cache_identity(self) -> str:
+        return f"{type(self).__name__}:{os.getenv('MODEL', 'gemma3')}:{settings_fingerprint(IMAGE_PROMPT)}"
+
     def read(self, path: str, context: str = "Archivo adjunto") -> str:
         ai = AIInterface(
             provider=os.getenv("PROVIDER", "ollama"),
@@ -77,7 +147,7 @@ class AIImageStrategy(ImageStrategy):
             messages=[
                 {
                     "role": "system",
-                    "content": "Eres un asistente de IA que extrae información útil de imágenes. Si no hay texto, solo explica en qué consiste la imagen de forma detallada. Si hay texto, la extracción debe contener exactamente todo el texto disponible en la imagen junto con la interpretación de lo que significa la imagen. Dicen que una imagen vale más que mil palabras.",
+                    "content": IMAGE_PROMPT,
                 },
                 {
                     "role": "user",
@@ -97,6 +167,36 @@ class AIImageStrategy(ImageStrategy):
         return res.choices[0].message.content.strip()
 
 
+class TesseractStrategy(ImageStrategy):
+    """
+    OCR local con Tesseract. Si la confianza es baja o casi no hay texto
+    (fotos, documentos muy dañados) se usa AIImageStrategy.
+    """
+
+    def __init__(self):
+        self.fallback = AIImageStrategy()
+
+    def cache_identity(self) -> str:
+        return (
+            f"{type(self).__name__}:{TESSERACT_LANG}:"
+            f"{settings_fingerprint(TESSERACT_MIN_CONFIDENCE, TESSERACT_MIN_CHARS)}:"
+            f"{self.fallback.cache_identity()}"
+        )
+
+    def read(self, path: str, context: str = "Archivo adjunto") -> str:
+        with open(path, "rb") as f:
+            text, confidence = tesseract_ocr(f.read())
+
+        if is_reliable_ocr(text, confidence):
+            printer.green(f"Tesseract extrajo {path} con confianza {confidence:.1f}")
+            return text.strip()
+
+        printer.yellow(
+            f"Confianza de Tesseract {confidence:.1f} para {path}, se usa el modelo de visión"
+        )
+        return self.fallback.read(path, context)
+
+
 # =========================
 # Lector de imágenes
 # =========================
@@ -106,13 +206,26 @@ class ImageReader:
     text: str | None = None
 
     def __init__(self):
-        self.strategy: ImageStrategy = AIImageStrategy()
+        if OCR_ENGINE == "tesseract":
+            self.strategy: ImageStrategy = TesseractStrategy()
+        else:
+            self.strategy: ImageStrategy = AIImageStrategy()
 
     def read(self, path: str, context: str = "Archivo adjunto") -> str:
         if not os.path.isfile(path):
             raise FileNotFoundError(f"Archivo no encontrado: {path}")
 
+        # El contexto cambia lo que el modelo extrae, así que forma parte de la llave
+        cache_key = extraction_cache.build_key(
+            path, self.strategy.cache_identity(), context
+        )
+        cached_text = extraction_cache.get(cache_key)
+        if cached_text is not None:
+            self.text = cached_text
+            return self.text
+
         self.text = self.strategy.read(path, context)
+        extraction_cache.set(cache_key, self.text)
         return self.text
 
     def get_hash(self) -> str:
@@ -1,19 +1,32 @@
 # utils/document_reader.py
+import io
 import subprocess
 import re
 from abc import ABC, abstractmethod
 import os
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import fitz  # PyMuPDF
 from fitz import Document as FPDFDocument
 from server.utils.printer import Printer
 import base64
 from PIL import Image
 from server.ai.ai_interface import AIInterface
+from server.utils.extraction_cache import extraction_cache, settings_fingerprint
+from server.utils.image_reader import (
+    OCR_ENGINE,
+    TESSERACT_LANG,
+    TESSERACT_MIN_CONFIDENCE,
+    TESSERACT_MIN_CHARS,
+    TESSERACT_WORKERS,
+    tesseract_ocr,
+    is_reliable_ocr,
+)
 from docx import Document
 from docxtpl import DocxTemplate
 
 PAGE_CONNECTOR = "\n---PAGE---\n"
+PAGE_SEPARATOR_PATTERN = r"\s*---PAGE---\s*"
 
 
 # =========================
@@ -32,6 +45,10 @@ class DocumentStrategy(ABC):
     def hash_text(self, text: str) -> str:
         return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
+    def cache_identity(self) -> str:
+        """Identifica la estrategia (y el modelo, si aplica) en el cache de extracción."""
+        return type(self).__name__
+
     def split_pages(self, text: str) -> list[str]:
         return text.split(PAGE_CONNECTOR)
 
@@ -50,114 +67,255 @@ def get_base64_image(page: fitz.Page) -> str:
     return img_str
 
 
+# =========================
+# Clasificador local TEXT vs OCR
+# =========================
+
+# Menos caracteres que esto en la capa de texto se considera una página sin texto
+MIN_TEXT_CHARS = int(os.getenv("PDF_MIN_TEXT_CHARS", 40))
+# Fracción de la página cubierta por imágenes a partir de la cual se considera escaneada
+SCANNED_IMAGE_COVERAGE = float(os.getenv("PDF_SCANNED_IMAGE_COVERAGE", 0.6))
+# Caracteres por cada 1000 pt² por debajo de los cuales una página cubierta
+# por una imagen se considera un escaneo con un texto marginal (sellos, folios)
+MIN_TEXT_DENSITY = float(os.getenv("PDF_MIN_TEXT_DENSITY", 1.5))
+# Proporción de caracteres ilegibles (mala codificación de fuentes) que obliga a OCR
+MAX_GARBLED_RATIO = float(os.getenv("PDF_MAX_GARBLED_RATIO", 0.3))
+
+
+def get_page_signals(page: fitz.Page) -> dict:
+    """
+    Calcula señales baratas de PyMuPDF para decidir si una página tiene
+    una capa de texto utilizable, sin rasterizar ni llamar a ningún modelo.
+    """
+    text = page.get_text().strip()
+    page_area = abs(page.rect) or 1.0
+
+    image_area = 0.0
+    for image in page.get_image_info():
+        bbox = fitz.Rect(image["bbox"]) & page.rect
+        if not bbox.is_empty:
+            image_area += abs(bbox)
+
+    printable = sum(1 for c in text if c.isprintable() or c.isspace())
+    garbled = text.count("\ufffd") + (len(text) - printable)
+
+    return {
+        "chars": len(text),
+        "fonts": len(page.get_fonts()),
+        "image_coverage": min(image_area / page_area, 1.0),
+        "text_density": len(text) * 1000 / page_area,
+        "garbled_ratio": garbled / len(text) if text else 0.0,
+    }
+
+
+def classify_page(page: fitz.Page, signals: dict | None = None) -> str:
+    """Devuelve "TEXT" si basta con page.get_text() o "OCR" si la página es una imagen."""
+    signals = signals or get_page_signals(page)
+    is_covered_by_images = signals["image_coverage"] >= SCANNED_IMAGE_COVERAGE
+
+    if signals["chars"] < MIN_TEXT_CHARS or signals["fonts"] == 0:
+        # Sin capa de texto: si hay una imagen grande es un escaneo, si no es una página en blanco
+        return "OCR" if is_covered_by_images else "TEXT"
+
+    if signals["garbled_ratio"] > MAX_GARBLED_RATIO:
+        return "OCR"
+
+    if is_covered_by_images and signals["text_density"] < MIN_TEXT_DENSITY:
+        return "OCR"
+
+    return "TEXT"
+
+
+# Lotes de OCR que se envían a la vez al modelo. Ollama procesa una petición
+# por modelo a la vez por defecto; los proveedores compatibles con OpenAI
+# (vLLM, OpenAI) se benefician de varias peticiones concurrentes.
+DEFAULT_OCR_CONCURRENCY = {"openai": 4, "ollama": 1}
+
+
+OCR_PROMPT = (
+    "Extrae el texto de CADA imagen adjunta. Si hay elementos gráficos asociados, explícalo."
+    "Devuelve un bloque por página, en el mismo orden. "
+    f"Separa cada bloque con una línea que diga exactamente {PAGE_CONNECTOR.strip()}. "
+    "Si una imagen no tiene texto, explícalo."
+)
+
+
+def get_ocr_concurrency(provider: str) -> int:
+    """OCR_CONCURRENCY_<PROVIDER> tiene prioridad sobre OCR_CONCURRENCY."""
+    value = os.getenv(
+        f"OCR_CONCURRENCY_{provider.upper()}",
+        os.getenv("OCR_CONCURRENCY", DEFAULT_OCR_CONCURRENCY.get(provider, 1)),
+    )
+    return max(1, int(value))
+
+
 class PyMuPDFWithOCRStrategy(DocumentStrategy):
-    SAMPLE_PAGES = 3
     MAX_OCR_PAGES_PER_READ = 7
 
     def __init__(self):
+        provider = os.getenv("PROVIDER", "ollama")
         self.ai = AIInterface(
-            provider=os.getenv("PROVIDER", "ollama"),
+            provider=provider,
             api_key=os.getenv("PROVIDER_API_KEY", "asdasd"),
             base_url=os.getenv("PROVIDER_BASE_URL", None),
         )
+        self.ocr_concurrency = get_ocr_concurrency(provider)
+
+    def extraction_settings(self) -> tuple:
+        """Lo que, además del archivo y el modelo, cambia el texto extraído."""
+        return (
+            PAGE_CONNECTOR,
+            OCR_PROMPT,
+            self.MAX_OCR_PAGES_PER_READ,
+            MIN_TEXT_CHARS,
+            SCANNED_IMAGE_COVERAGE,
+            MIN_TEXT_DENSITY,
+            MAX_GARBLED_RATIO,
+        )
+
+    def cache_identity(self) -> str:
+        return (
+            f"{type(self).__name__}:{os.getenv('MODEL', 'gemma3')}:"
+            f"{settings_fingerprint(*self.extraction_settings())}"
+        )
 
     def read(self, path: str) -> str:
-        pages = []
         with fitz.open(path, filetype="pdf") as pdf:
-            what_to_do = self.select_strategy(pdf)
-
-            if what_to_do == "OCR":
-                # Procesar en lotes de MAX_OCR_PAGES_PER_READ
-                total_pages = pdf.page_count
-                for i in range(0, total_pages, self.MAX_OCR_PAGES_PER_READ):
-                    batch = []
-                    page_indices = range(
-                        i, min(i + self.MAX_OCR_PAGES_PER_READ, total_pages)
-                    )
-                    for page_idx in page_indices:
-                        page = pdf[page_idx]
-                        img_str = get_base64_image(page)
-                        batch.append(
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{img_str}"
-                                },
-                            }
-                        )
-                    # Un solo mensaje con varias imágenes
-                    res = self.ai.chat(
-                        model=os.getenv("MODEL", "gemma3"),
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": [
-                                    {
-                                        "type": "text",
-                                        "text": (
-                                            "Extrae el texto de CADA imagen adjunta. Si hay elementos gráficos asociados, explícalo."
-                                            "Devuelve un bloque por página, en el mismo orden. "
-                                            "Si una imagen no tiene texto, explícalo."
-                                        ),
-                                    },
-                                    *batch,
-                                ],
-                            }
-                        ],
-                    )
-                    # Suponiendo que la respuesta contiene bloques de texto separados por marcador
-                    batch_texts = res.choices[0].message.content.split(PAGE_CONNECTOR)
-                    pages.extend(batch_texts)
-            else:
-                # Estrategia normal, página por página
-                for page in pdf:
-                    text = page.get_text()
-                    pages.append(text)
+            page_kinds = self.classify_pages(pdf)
+            pages = [""] * pdf.page_count
+
+            # Las páginas con capa de texto se leen directamente
+            ocr_indices = []
+            for page_idx, kind in enumerate(page_kinds):
+                if kind == "TEXT":
+                    pages[page_idx] = pdf[page_idx].get_text()
+                else:
+                    ocr_indices.append(page_idx)
+
+            for page_idx, text in self.ocr(pdf, ocr_indices).items():
+                pages[page_idx] = text
         return PAGE_CONNECTOR.join(pages)
 
-    def select_strategy(self, sample: FPDFDocument):
-        printer.yellow(f"Number of pages for PDF: {sample.page_count}")
-        sample_count = min(sample.page_count, self.SAMPLE_PAGES)
-        printer.yellow(f"Sample count: {sample_count}")
-
-        sample_results = []
-
-        for page in sample.pages(0, sample_count):
-            text_result = page.get_text()
-            img_str = get_base64_image(page)
-            res = self.ai.chat(
-                model=os.getenv("MODEL", "gemma3"),
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "Extrae únicamente el texto presente en la imagen, si no hay texto, devuelve un texto vacío que diga: 'EMPTY'.",
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{img_str}"
-                                },
-                            },
-                        ],
-                    },
-                ],
+    def ocr(self, pdf: FPDFDocument, page_indices: list[int]) -> dict[int, str]:
+        """
+        OCR de las páginas escaneadas con el modelo de visión, en lotes de
+        MAX_OCR_PAGES_PER_READ. Devuelve {índice de página: texto}.
+        """
+        # PyMuPDF no es thread-safe, así que las imágenes se generan aquí y
+        # solo las llamadas al modelo se hacen en paralelo.
+        batches = []
+        for i in range(0, len(page_indices), self.MAX_OCR_PAGES_PER_READ):
+            batch_indices = page_indices[i : i + self.MAX_OCR_PAGES_PER_READ]
+            batches.append(
+                (batch_indices, [get_base64_image(pdf[idx]) for idx in batch_indices])
+            )
+        if not batches:
+            return {}
+
+        texts = {}
+        workers = max(1, min(self.ocr_concurrency, len(batches)))
+        printer.yellow(f"OCR de {len(page_indices)} páginas en {len(batches)} lotes, {workers} en paralelo")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # map conserva el orden de los lotes
+            results = executor.map(lambda batch: self.ocr_pages(batch[1]), batches)
+            for (batch_indices, _), batch_texts in zip(batches, results):
+                texts.update(zip(batch_indices, batch_texts))
+        return texts
+
+    def ocr_pages(self, images: list[str]) -> list[str]:
+        """
+        Envía un lote de páginas (PNG en base64) al modelo de visión en un solo
+        mensaje y devuelve un texto por página, en el mismo orden.
+        """
+        batch = [
+            {
+                "type": "image_url",
+                "image_url": {"url": f"data:image/jpeg;base64,{img_str}"},
+            }
+            for img_str in images
+        ]
+        # Un solo mensaje con varias imágenes
+        res = self.ai.chat(
+            model=os.getenv("MODEL", "gemma3"),
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": OCR_PROMPT,
+                        },
+                        *batch,
+                    ],
+                }
+            ],
+        )
+        content = res.choices[0].message.content or ""
+        batch_texts = re.split(PAGE_SEPARATOR_PATTERN, content.strip())
+        if len(batch_texts) != len(images):
+            printer.yellow(
+                f"El modelo devolvió {len(batch_texts)} bloques para {len(images)} páginas, se conserva el lote completo"
             )
-            ocr_result = res.choices[0].message.content
+            return [content] + [""] * (len(images) - 1)
+        return batch_texts
 
-            if len(text_result) > len(ocr_result):
-                sample_results.append("TEXT")
-            else:
-                sample_results.append("OCR")
+    def classify_pages(self, pdf: FPDFDocument) -> list[str]:
+        printer.yellow(f"Number of pages for PDF: {pdf.page_count}")
 
-        printer.yellow(f"Sample results: {sample_results}")
+        page_kinds = [classify_page(page) for page in pdf]
 
-        if sample_results.count("OCR") > sample_results.count("TEXT"):
-            return "OCR"
-        else:
-            return "TEXT"
+        printer.yellow(
+            f"Pages TEXT: {page_kinds.count('TEXT')}, pages OCR: {page_kinds.count('OCR')}"
+        )
+        return page_kinds
+
+
+class PyMuPDFWithTesseractStrategy(PyMuPDFWithOCRStrategy):
+    """
+    Igual que PyMuPDFWithOCRStrategy, pero las páginas escaneadas pasan
+    primero por Tesseract en local. Solo las páginas con confianza menor a
+    TESSERACT_MIN_CONFIDENCE se envían al modelo de visión.
+    """
+
+    OCR_DPI = 300
+
+    def extraction_settings(self) -> tuple:
+        return (
+            *super().extraction_settings(),
+            self.OCR_DPI,
+            TESSERACT_MIN_CONFIDENCE,
+            TESSERACT_MIN_CHARS,
+        )
+
+    def cache_identity(self) -> str:
+        return (
+            f"{type(self).__name__}:{TESSERACT_LANG}:{os.getenv('MODEL', 'gemma3')}:"
+            f"{settings_fingerprint(*self.extraction_settings())}"
+        )
+
+    def ocr(self, pdf: FPDFDocument, page_indices: list[int]) -> dict[int, str]:
+        if not page_indices:
+            return {}
+
+        images = [pdf[idx].get_pixmap(dpi=self.OCR_DPI).tobytes("png") for idx in page_indices]
+        # pytesseract ejecuta el binario de tesseract en un subproceso por página,
+        # así que un pool de hilos ya reparte el trabajo entre los núcleos
+        with ThreadPoolExecutor(max_workers=TESSERACT_WORKERS) as executor:
+            results = list(executor.map(tesseract_ocr, images))
+
+        texts = {}
+        escalated = []
+        for page_idx, (text, confidence) in zip(page_indices, results):
+            if is_reliable_ocr(text, confidence):
+                texts[page_idx] = text
+            else:
+                escalated.append(page_idx)
+
+        printer.yellow(
+            f"Tesseract: {len(texts)} páginas aceptadas, {len(escalated)} enviadas al modelo de visión"
+        )
+        texts.update(super().ocr(pdf, escalated))
+        return texts
 
 
 class DocxStrategy(DocumentStrategy):
@@ -246,6 +404,8 @@ class DocumentReader:
         ext = os.path.splitext(path)[1].lower()
 
         if ext == ".pdf":
+            if OCR_ENGINE == "tesseract":
+                return PyMuPDFWithTesseractStrategy()
             return PyMuPDFWithOCRStrategy()
         elif ext == ".docx":
             return DocxStrategy()
@@ -261,7 +421,15 @@ class DocumentReader:
             raise FileNotFoundError(f"Archivo no encontrado: {path}")
 
         self.strategy = self._get_strategy(path)
+
+        cache_key = extraction_cache.build_key(path, self.strategy.cache_identity())
+        cached_text = extraction_cache.get(cache_key)
+        if cached_text is not None:
+            self.text = cached_text
+            return self.text
+
         self.text = self.strategy.read(path)
+        extraction_cache.set(cache_key, self.text)
 
         return self.text
 
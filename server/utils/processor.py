@@ -6,7 +6,17 @@ import traceback
 from server.utils.printer import Printer
 from server.utils.pdf_reader import DocumentReader, find_placeholders, generate_docx_from_template, docx_to_html
 from server.utils.image_reader import ImageReader
-from server.utils.audio_reader import AudioReader
+from server.utils.audio_reader import AudioReader, get_whisper_model_name
+from server.utils.asset_extractor import extract_asset_text, publish_workflow_log
+from server.utils.checkpoint import ExecutionCheckpoint
+from server.utils.stream_publisher import WorkflowStreamPublisher, STREAM_AGENT_OUTPUT
+from server.utils.case_retrieval import (
+    should_use_retrieval,
+    index_execution_assets,
+    delete_execution_index,
+    build_assets_summary,
+    search_execution_index,
+)
 
 from server.db import session_context_sync
 from server.models import (
@@ -15,6 +25,7 @@ from server.models import (
     Asset,
     AssetOrigin,
     WorkflowExecutionStatus,
+    WorkflowExecutionStage,
     Message,
     AssetStatus,
     Workflow,
@@ -22,14 +33,13 @@ from server.models import (
 )
 
 from server.ai.ai_interface import AIInterface, function_to_openai_schema
+from server.ai.tool_executor import thread_safe
 import os
 import json
 from server.utils.redis_cache import redis_client
 
 printer = Printer("PROCESSOR")
 
-audio_reader = AudioReader(model_name="base", include_timestamps=False)
-
 
 def send_message_to_user(message: str, workflow_execution_id: str):
     redis_client.publish(
@@ -66,6 +76,61 @@ def create_workflow_example_text(workflow_example: WorkflowOutputExample):
 </EXAMPLE>
         """
 
+
+def build_workflow_messages(w: WorkflowExecution, retrieval: bool = False) -> list[dict]:
+    """
+    Construye el prompt inicial (system + user con el texto de los assets).
+    En modo recuperación el user lleva solo un resumen de cada asset.
+    """
+    if retrieval:
+        assets_text = build_assets_summary(w.assets)
+    else:
+        assets_text = "\n".join(
+            [
+                f'<ASSET name="{asset.name}" description="{asset.brief or "No description"}">{asset.content}</ASSET>'
+                for asset in w.assets
+                if asset.content
+            ]
+        )
+
+    output_examples_text = "\n".join(
+        [
+            create_workflow_example_text(example)
+            for example in w.workflow.output_examples
+        ]
+    )
+
+    return [
+        {
+            "role": "system",
+            "content": f"""
+                
+ROLE: You are a helpful agent that can use different tools to execute workflows. 
+
+TASK DESCRIPTION:                
+- The goal is to use the available tools until the workflow is completed and you have generated all the required files. 
+- Interact with the user to let him know the progress of the workflow. 
+- Stop calling tools ONLY when the workflow is completed, if you don't call tools, your loop will stop and you can maybe not finish the workflow. You will receive the text of the uploaded files, and you will have to use the tools to craft new files based on the requirements. The new files will be in markdown format unless you're working with templates. Don't stop until all necessary assets are created. Keep in mind that you cannot interact with the user directly, you can only use the tools to interact with the user. You need to work only with the information available at the moment. The user will see the result later. 
+
+CURRENT WORKFLOW: 
+NAME: {w.workflow.name}
+```instructions
+{w.workflow.instructions}
+```
+
+EXAMPLES or TEMPLATES (if provided):
+
+{output_examples_text}
+
+""",
+        },
+        {
+            "role": "user",
+            "content": f"Use the following information to execute the workflow and craft the new files: {assets_text}",
+        },
+    ]
+
+
 def process_workflow_execution(workflow_execution_id: str):
     printer.info(f"Procesando ejecución de workflow {workflow_execution_id}")
     # Usar el context manager para obtener la sesión
@@ -79,6 +144,11 @@ def process_workflow_execution(workflow_execution_id: str):
             printer.error(f"No se encontró la ejecución #{workflow_execution_id}")
             return
 
+        checkpoint = ExecutionCheckpoint(session, w)
+        if checkpoint.stage == WorkflowExecutionStage.DONE:
+            printer.yellow(f"La ejecución #{workflow_execution_id} ya fue completada")
+            return
+
         log = w.generation_log
         if not log:
             log = "Ejecución iniciada.\n"
@@ -88,79 +158,45 @@ def process_workflow_execution(workflow_execution_id: str):
         assets = w.assets
 
         w.status = WorkflowExecutionStatus.IN_PROGRESS
-        w.started_at = datetime.now()
+        w.started_at = w.started_at or datetime.now()
         session.commit()
 
-        document_reader = DocumentReader()
-        image_reader = ImageReader()
-
-        for asset in assets:
-            if asset.status == AssetStatus.DONE:
-                continue
-            log += f"Procesando archivo: {asset.name}\n"
-            if asset.asset_type == AssetType.FILE:
-                file_extension = os.path.splitext(asset.name)[1]
-                file_path = (
-                    f"uploads/{asset.workflow_execution_id}/{asset.id}{file_extension}"
-                )
-                ext = file_extension.lower()
-                extracted_text = None
-                if ext in [".pdf", ".docx"]:
-                    extracted_text = document_reader.read(file_path)
-                    log += f"Contenido del archivo {asset.name} extraído con exito.\n"
-                elif ext in [".jpg", ".jpeg", ".png", ".bmp", ".tiff"]:
-                    extracted_text = image_reader.read(
-                        file_path,
-                        f"Nombre del archivo adjunto: {asset.name}. Se está realizando un flujo de trabajo que requiere de la información de la imagen. Esta es una descripción del flujo de trabajo para que puedas entender mejor el tipo de información que se requiere extraer de la imagen: {w.workflow.description}. Extrae la información que pueda ser útil para el flujo de trabajo en la imagen. {'\nEsta descripción puede ser útil: ' + asset.brief if asset.brief else ''}",
+        if checkpoint.should_run(WorkflowExecutionStage.EXTRACT):
+            document_reader = DocumentReader()
+            image_reader = ImageReader()
+
+            for asset in assets:
+                if asset.status == AssetStatus.DONE:
+                    continue
+                log += f"Procesando archivo: {asset.name}\n"
+                if asset.asset_type == AssetType.FILE:
+                    extracted_text, extraction_log = extract_asset_text(
+                        asset,
+                        w.workflow.description,
+                        document_reader=document_reader,
+                        image_reader=image_reader,
                     )
-                    log += f"Contenido de la imagen {asset.name} extraído con exito.\n"
-                elif ext in [".txt", ".xml", ".html", ".md", ".json", ".csv"]:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        extracted_text = f.read()
-                    log += f"Contenido del archivo {asset.name} extraído con exito.\n"
-                elif ext in [".mp3", ".wav", ".m4a", ".webm"]:
-                    redis_client.publish(
-                        "workflow_updates",
-                        json.dumps(
-                            {
-                                "workflow_execution_id": workflow_execution_id,
-                                "log": f"El agente IA está transcribiendo el audio {asset.name}.",
-                                "status": "PROCESSING",
-                                "assets_ready": False,
-                            }
-                        ),
+                    log += extraction_log
+
+                    asset.extracted_text = extracted_text
+                    asset.content = extracted_text
+                    asset.status = AssetStatus.DONE
+                    w.generation_log = log
+                    session.commit()
+                    publish_workflow_log(
+                        workflow_execution_id, f"Se extrajo el texto de **{asset.name}**."
                     )
-                    extracted_text = audio_reader.read(file_path)
-                    log += f"Se realizó la transcripción del audio {asset.name} con exito.\n"
-
-                redis_client.publish(
-                    "workflow_updates",
-                    json.dumps(
-                        {
-                            "workflow_execution_id": workflow_execution_id,
-                            "log": f"Se extrajo el texto de **{asset.name}**.",
-                            "status": "PROCESSING",
-                            "assets_ready": False,
-                        }
-                    ),
-                )
+            checkpoint.advance(WorkflowExecutionStage.BUILD_PROMPT)
 
-                asset.extracted_text = extracted_text
-                asset.content = extracted_text
-                asset.status = AssetStatus.DONE
-                w.generation_log = log
-                session.commit()
-                redis_client.publish(
-                    "workflow_updates",
-                    json.dumps(
-                        {
-                            "workflow_execution_id": workflow_execution_id,
-                            "log": f"Se extrajo el texto de **{asset.name}**.",
-                            "status": "PROCESSING",
-                            "assets_ready": False,
-                        }
-                    ),
-                )
+        if checkpoint.should_run(WorkflowExecutionStage.BUILD_PROMPT):
+            retrieval = should_use_retrieval(w.assets)
+            checkpoint.set("retrieval", retrieval)
+            checkpoint.set("prompt", build_workflow_messages(w, retrieval))
+            checkpoint.advance(WorkflowExecutionStage.AGENT)
+        retrieval = checkpoint.get("retrieval", False)
+
+        # Si el agente ya había avanzado, se continúa desde el último turno guardado
+        messages = checkpoint.get("agent_messages") or checkpoint.get("prompt")
 
         ai = AIInterface(
             provider=os.getenv("PROVIDER", "ollama"),
@@ -172,51 +208,6 @@ def process_workflow_execution(workflow_execution_id: str):
             print("New response received from agent")
             print(message)
 
-        assets_text = "\n".join(
-            [
-                f'<ASSET name="{asset.name}" description="{asset.brief or "No description"}">{asset.content}</ASSET>'
-                for asset in assets
-                if asset.content
-            ]
-        )
-
-        output_examples_text = "\n".join(
-            [
-                create_workflow_example_text(example)
-                for example in w.workflow.output_examples
-            ]
-        )
-
-        messages = [
-            {
-                "role": "system",
-                "content": f"""
-                
-ROLE: You are a helpful agent that can use different tools to execute workflows. 
-
-TASK DESCRIPTION:                
-- The goal is to use the available tools until the workflow is completed and you have generated all the required files. 
-- Interact with the user to let him know the progress of the workflow. 
-- Stop calling tools ONLY when the workflow is completed, if you don't call tools, your loop will stop and you can maybe not finish the workflow. You will receive the text of the uploaded files, and you will have to use the tools to craft new files based on the requirements. The new files will be in markdown format unless you're working with templates. Don't stop until all necessary assets are created. Keep in mind that you cannot interact with the user directly, you can only use the tools to interact with the user. You need to work only with the information available at the moment. The user will see the result later. 
-
-CURRENT WORKFLOW: 
-NAME: {w.workflow.name}
-```instructions
-{w.workflow.instructions}
-```
-
-EXAMPLES or TEMPLATES (if provided):
-
-{output_examples_text}
-
-""",
-            },
-            {
-                "role": "user",
-                "content": f"Use the following information to execute the workflow and craft the new files: {assets_text}",
-            },
-        ]
-
         def emit_message(message):
             """
             This function is used to emit a message to the user.
@@ -233,6 +224,7 @@ EXAMPLES or TEMPLATES (if provided):
             session.commit()
             return "Message sent successfully"
 
+        @thread_safe
         def use_template(template_id: str, variables: str, document_name: str):
             """
             This function use a template to generate a new file.
@@ -241,9 +233,12 @@ EXAMPLES or TEMPLATES (if provided):
             The document_name parameter is the name of the document to create. It must not contain spaces or special characters.
             """
             printer.green(f"Using template {template_id} with variables {variables}")
-            template = next(
-                (t for t in w.workflow.output_examples if str(t.id) == template_id), None
-            )
+            # Puede correr en paralelo con otras tools: la sesión solo se usa con el lock
+            with checkpoint.lock:
+                template = next(
+                    (t for t in w.workflow.output_examples if str(t.id) == template_id), None
+                )
+                template_path = template.internal_path if template else None
 
             
 
@@ -255,7 +250,7 @@ EXAMPLES or TEMPLATES (if provided):
                 output_path = os.path.join("uploads", str(workflow_execution_id), f"{random_id}.docx")
                 absolute_output_path = os.path.join(os.getcwd(), output_path)
                 printer.green(f"Generating docx file at {absolute_output_path}")
-                generate_docx_from_template(template.internal_path, variables_dict, output_path)
+                generate_docx_from_template(template_path, variables_dict, output_path)
                 printer.green(f"Generated docx file at {absolute_output_path}")
                 html_content = docx_to_html(absolute_output_path)
                 # If the document name doesn't have a .docx extension, add it
@@ -273,9 +268,12 @@ EXAMPLES or TEMPLATES (if provided):
                     origin=AssetOrigin.AI,
                     internal_path=output_path,
                 )
-                session.add(asset)
-                session.commit()
-                return "The template was used successfully and the file was created successfuly"
+                result = "The template was used successfully and the file was created successfuly"
+                with checkpoint.lock:
+                    session.add(asset)
+                    checkpoint.stage_tool_result(result)
+                    session.commit()
+                return result
             except Exception as e:
                 traceback.print_exc()
                 printer.error(f"Error using template {template_id}: {e}")
@@ -290,6 +288,7 @@ EXAMPLES or TEMPLATES (if provided):
             session.commit()
             return "Scratchpad annotated successfully"
 
+        @thread_safe
         def create_new_markdown_asset(name: str, content: str):
             """
             This function is used to create a new markdown asset, use it only when there is not a template to use.
@@ -306,11 +305,13 @@ EXAMPLES or TEMPLATES (if provided):
                 workflow_execution_id=workflow_execution_id,
                 origin=AssetOrigin.AI,
             )
-            session.add(asset)
-
-            w.generation_log += (
-                f"\n<ai_message>Se creó el asset **{name}**.</ai_message>"
-            )
+            with checkpoint.lock:
+                session.add(asset)
+                w.generation_log += (
+                    f"\n<ai_message>Se creó el asset **{name}**.</ai_message>"
+                )
+                checkpoint.stage_tool_result("Asset created successfully")
+                session.commit()
             redis_client.publish(
                 "workflow_updates",
                 json.dumps(
@@ -322,30 +323,71 @@ EXAMPLES or TEMPLATES (if provided):
                     }
                 ),
             )
-            session.commit()
             return "Asset created successfully"
 
-        ai.agent_loop(
-            messages,
-            model=os.getenv("MODEL", "gemma3"),
-            tools=[
+        @thread_safe
+        def search_case_documents(query: str):
+            """
+            This function searches the uploaded case documents and returns the most relevant passages, with the file they come from.
+            Use specific queries (names, dates, amounts, facts) and search again if the results are not enough.
+            """
+            return search_execution_index(workflow_execution_id, query)
+
+        if checkpoint.should_run(WorkflowExecutionStage.AGENT):
+            tools = [
                 # function_to_openai_schema(emit_message),
                 function_to_openai_schema(create_new_markdown_asset),
                 function_to_openai_schema(annotate_in_scratchpad),
                 function_to_openai_schema(use_template),
                 function_to_openai_schema(annotate_in_scratchpad),
-            ],
-            tools_fn_map={
+            ]
+            tools_fn_map = {
                 "emit_message": emit_message,
                 "create_new_markdown_asset": create_new_markdown_asset,
                 "use_template": use_template,
                 "annotate_in_scratchpad": annotate_in_scratchpad,
-            },
-            on_message=on_message,
-        )
+            }
+            if retrieval:
+                tools.append(function_to_openai_schema(search_case_documents))
+                # Las búsquedas no se cachean: no crean nada y el agente puede repetirlas
+                search_tools = {"search_case_documents": search_case_documents}
+            else:
+                search_tools = {}
+            try:
+                # El índice vive solo mientras corre el agente: se crea en cada
+                # intento (un /rerun continúa desde AGENT) y se borra al terminar
+                if retrieval:
+                    index_execution_assets(workflow_execution_id, w.assets)
+                    publish_workflow_log(
+                        workflow_execution_id, "Se indexaron los documentos para búsqueda."
+                    )
+                agent_result = ai.agent_loop(
+                    messages,
+                    model=os.getenv("MODEL", "gemma3"),
+                    tools=tools,
+                    tools_fn_map={**checkpoint.wrap_tools(tools_fn_map), **search_tools},
+                    on_message=on_message,
+                    on_turn=checkpoint.save_agent_messages,
+                    on_delta=(
+                        WorkflowStreamPublisher(workflow_execution_id).on_delta
+                        if STREAM_AGENT_OUTPUT
+                        else None
+                    ),
+                )
+            finally:
+                if retrieval:
+                    delete_execution_index(workflow_execution_id)
+            if not agent_result.completed:
+                # Los assets creados hasta el límite se conservan; el motivo queda registrado
+                w.status_message = agent_result.describe()
+                session.commit()
+                publish_workflow_log(workflow_execution_id, agent_result.describe())
+            checkpoint.advance(WorkflowExecutionStage.FINALIZE)
+
         w.status = WorkflowExecutionStatus.DONE
         w.finished_at = datetime.now()
         session.commit()
+        checkpoint.advance(WorkflowExecutionStage.DONE)
         redis_client.publish(
             "workflow_updates",
             json.dumps(
@@ -456,7 +498,7 @@ def request_changes(
             )
             return "The search string was found and replaced successfully"
 
-        ai.agent_loop(
+        agent_result = ai.agent_loop(
             messages=[
                 {
                     "role": "system",
@@ -478,6 +520,10 @@ def request_changes(
             },
         )
         asset.status = AssetStatus.DONE
+        message = "El agente IA ha completado el proceso de solicitud de cambios."
+        if not agent_result.completed:
+            w.status_message = agent_result.describe()
+            message = f"{message} {agent_result.describe()}"
         session.commit()
         printer.success("Agent request changes process completed")
         redis_client.publish(
@@ -485,7 +531,7 @@ def request_changes(
             json.dumps(
                 {
                     "not_id": not_id,
-                    "message": "El agente IA ha completado el proceso de solicitud de cambios.",
+                    "message": message,
                     "status": "DONE",
                 }
             ),
@@ -547,7 +593,10 @@ def process_example_files(
                     )
                 )
             elif ext in [".mp3", ".wav", ".m4a", ".webm"]:
-                audio_reader = AudioReader(model_name="base", include_timestamps=False)
+                audio_reader = AudioReader(
+                    model_name=get_whisper_model_name("examples"),
+                    include_timestamps=False,
+                )
                 extracted_text = audio_reader.read(file_path)
                 print(extracted_text)
                 session.add(
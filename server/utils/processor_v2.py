@@ -9,7 +9,16 @@ from sqlalchemy.orm import Session
 from server.utils.printer import Printer
 from server.utils.pdf_reader import DocumentReader, find_placeholders, generate_docx_from_template, docx_to_html
 from server.utils.image_reader import ImageReader
-from server.utils.audio_reader import AudioReader
+from server.utils.asset_extractor import extract_asset_text, publish_workflow_log
+from server.utils.checkpoint import ExecutionCheckpoint
+from server.utils.stream_publisher import WorkflowStreamPublisher, STREAM_AGENT_OUTPUT
+from server.utils.case_retrieval import (
+    should_use_retrieval,
+    index_execution_assets,
+    delete_execution_index,
+    build_assets_summary,
+    search_execution_index,
+)
 from server.utils.redis_cache import redis_client
 
 from server.models import (
@@ -18,6 +27,7 @@ from server.models import (
     Asset,
     AssetOrigin,
     WorkflowExecutionStatus,
+    WorkflowExecutionStage,
     Message,
     AssetStatus,
     Workflow,
@@ -25,12 +35,11 @@ from server.models import (
 )
 
 from server.utils.agent_v2 import WorkflowAgent, AgentTool
+from server.ai.tool_executor import thread_safe
 from server.services.openai_responses_service import ResponsesAPIService
 
 printer = Printer("PROCESSOR_V2")
 
-audio_reader = AudioReader(model_name="base", include_timestamps=False)
-
 
 def send_message_to_user(message: str, workflow_execution_id: str):
     redis_client.publish(
@@ -80,6 +89,7 @@ class WorkflowProcessorV2:
         self.session = session
         self.workflow_execution: Optional[WorkflowExecution] = None
         self.agent: Optional[WorkflowAgent] = None
+        self.checkpoint: Optional[ExecutionCheckpoint] = None
         self.document_reader = DocumentReader()
         self.image_reader = ImageReader()
     
@@ -91,19 +101,61 @@ class WorkflowProcessorV2:
                 return False
             
             # 2. Process assets (extract text from files)
-            self._process_assets()
+            if self.checkpoint.should_run(WorkflowExecutionStage.EXTRACT):
+                self._process_assets()
+                self.checkpoint.advance(WorkflowExecutionStage.BUILD_PROMPT)
             
-            # 3. Build system instructions
-            system_instructions = self._build_system_instructions()
+            # 3. Build system instructions and user message
+            if self.checkpoint.should_run(WorkflowExecutionStage.BUILD_PROMPT):
+                retrieval = should_use_retrieval(self.workflow_execution.assets)
+                self.checkpoint.set("retrieval", retrieval)
+                self.checkpoint.set(
+                    "prompt",
+                    {
+                        "system_instructions": self._build_system_instructions(),
+                        "user_message": self._build_user_message(retrieval),
+                    },
+                )
+                self.checkpoint.advance(WorkflowExecutionStage.AGENT)
+            prompt = self.checkpoint.get("prompt")
+            retrieval = self.checkpoint.get("retrieval", False)
             
             # 4. Create tools
             tools, tools_fn_map = self._create_tools()
+            tools_fn_map = self.checkpoint.wrap_tools(tools_fn_map)
+            if retrieval:
+                tools.append(self._search_tool())
+                # Searches are not cached: they don't create anything and may be repeated
+                tools_fn_map["search_case_documents"] = self._search_case_documents
             
             # 5. Execute agent
-            self._execute_agent(system_instructions, tools, tools_fn_map)
+            if self.checkpoint.should_run(WorkflowExecutionStage.AGENT):
+                try:
+                    # The index only lives while the agent runs: it is rebuilt on each
+                    # attempt (a /rerun resumes from AGENT) and deleted afterwards
+                    if retrieval:
+                        index_execution_assets(self.workflow_execution_id, self.workflow_execution.assets)
+                        publish_workflow_log(
+                            self.workflow_execution_id, "Se indexaron los documentos para búsqueda."
+                        )
+                    agent_error = self._execute_agent(
+                        prompt["system_instructions"],
+                        prompt["user_message"],
+                        tools,
+                        tools_fn_map,
+                    )
+                finally:
+                    if retrieval:
+                        delete_execution_index(self.workflow_execution_id)
+                if agent_error:
+                    # The stage stays at AGENT so a /rerun resumes from the last turn
+                    self._set_error_status(agent_error)
+                    return False
+                self.checkpoint.advance(WorkflowExecutionStage.FINALIZE)
             
             # 6. Update status
             self._update_status()
+            self.checkpoint.advance(WorkflowExecutionStage.DONE)
             
             return True
         except Exception as e:
@@ -124,6 +176,11 @@ class WorkflowProcessorV2:
             printer.error(f"No se encontró la ejecución #{self.workflow_execution_id}")
             return False
         
+        self.checkpoint = ExecutionCheckpoint(self.session, self.workflow_execution)
+        if self.checkpoint.stage == WorkflowExecutionStage.DONE:
+            printer.yellow(f"La ejecución #{self.workflow_execution_id} ya fue completada")
+            return False
+        
         # Initialize log if needed
         if not self.workflow_execution.generation_log:
             self.workflow_execution.generation_log = "Ejecución iniciada.\n"
@@ -131,7 +188,7 @@ class WorkflowProcessorV2:
         
         # Update status
         self.workflow_execution.status = WorkflowExecutionStatus.IN_PROGRESS
-        self.workflow_execution.started_at = datetime.now()
+        self.workflow_execution.started_at = self.workflow_execution.started_at or datetime.now()
         self.session.commit()
         
         return True
@@ -148,50 +205,13 @@ class WorkflowProcessorV2:
             log += f"Procesando archivo: {asset.name}\n"
             
             if asset.asset_type == AssetType.FILE:
-                file_extension = os.path.splitext(asset.name)[1]
-                file_path = f"uploads/{asset.workflow_execution_id}/{asset.id}{file_extension}"
-                ext = file_extension.lower()
-                extracted_text = None
-                
-                if ext in [".pdf", ".docx"]:
-                    extracted_text = self.document_reader.read(file_path)
-                    log += f"Contenido del archivo {asset.name} extraído con exito.\n"
-                elif ext in [".jpg", ".jpeg", ".png", ".bmp", ".tiff"]:
-                    extracted_text = self.image_reader.read(
-                        file_path,
-                        f"Nombre del archivo adjunto: {asset.name}. Se está realizando un flujo de trabajo que requiere de la información de la imagen. Esta es una descripción del flujo de trabajo para que puedas entender mejor el tipo de información que se requiere extraer de la imagen: {self.workflow_execution.workflow.description}. Extrae la información que pueda ser útil para el flujo de trabajo en la imagen. {'\nEsta descripción puede ser útil: ' + asset.brief if asset.brief else ''}",
-                    )
-                    log += f"Contenido de la imagen {asset.name} extraído con exito.\n"
-                elif ext in [".txt", ".xml", ".html", ".md", ".json", ".csv"]:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        extracted_text = f.read()
-                    log += f"Contenido del archivo {asset.name} extraído con exito.\n"
-                elif ext in [".mp3", ".wav", ".m4a", ".webm"]:
-                    redis_client.publish(
-                        "workflow_updates",
-                        json.dumps(
-                            {
-                                "workflow_execution_id": self.workflow_execution_id,
-                                "log": f"El agente IA está transcribiendo el audio {asset.name}.",
-                                "status": "PROCESSING",
-                                "assets_ready": False,
-                            }
-                        ),
-                    )
-                    extracted_text = audio_reader.read(file_path)
-                    log += f"Se realizó la transcripción del audio {asset.name} con exito.\n"
-                
-                redis_client.publish(
-                    "workflow_updates",
-                    json.dumps(
-                        {
-                            "workflow_execution_id": self.workflow_execution_id,
-                            "log": f"Se extrajo el texto de **{asset.name}**.",
-                            "status": "PROCESSING",
-                            "assets_ready": False,
-                        }
-                    ),
+                extracted_text, extraction_log = extract_asset_text(
+                    asset,
+                    self.workflow_execution.workflow.description,
+                    document_reader=self.document_reader,
+                    image_reader=self.image_reader,
                 )
+                log += extraction_log
                 
                 asset.extracted_text = extracted_text
                 asset.content = extracted_text
@@ -199,16 +219,9 @@ class WorkflowProcessorV2:
                 self.workflow_execution.generation_log = log
                 self.session.commit()
                 
-                redis_client.publish(
-                    "workflow_updates",
-                    json.dumps(
-                        {
-                            "workflow_execution_id": self.workflow_execution_id,
-                            "log": f"Se extrajo el texto de **{asset.name}**.",
-                            "status": "PROCESSING",
-                            "assets_ready": False,
-                        }
-                    ),
+                publish_workflow_log(
+                    self.workflow_execution_id,
+                    f"Se extrajo el texto de **{asset.name}**.",
                 )
         
         self.workflow_execution.generation_log = log
@@ -251,15 +264,18 @@ EXAMPLES or TEMPLATES (if provided):
 """
         return system_instructions
     
-    def _build_user_message(self) -> str:
-        """Build user message with assets content"""
-        assets_text = "\n".join(
-            [
-                f'<ASSET name="{asset.name}" description="{asset.brief or "No description"}">{asset.content}</ASSET>'
-                for asset in self.workflow_execution.assets
-                if asset.content
-            ]
-        )
+    def _build_user_message(self, retrieval: bool = False) -> str:
+        """Build user message with assets content, or only a summary in retrieval mode"""
+        if retrieval:
+            assets_text = build_assets_summary(self.workflow_execution.assets)
+        else:
+            assets_text = "\n".join(
+                [
+                    f'<ASSET name="{asset.name}" description="{asset.brief or "No description"}">{asset.content}</ASSET>'
+                    for asset in self.workflow_execution.assets
+                    if asset.content
+                ]
+            )
         return f"Use the following information to execute the workflow and craft the new files: {assets_text}"
     
     def _create_tools(self) -> tuple[List[AgentTool], dict]:
@@ -311,8 +327,27 @@ EXAMPLES or TEMPLATES (if provided):
         
         return tools, tools_fn_map
     
-    def _execute_agent(self, system_instructions: str, tools: List[AgentTool], tools_fn_map: dict):
-        """Execute the agent loop"""
+    def _search_tool(self) -> AgentTool:
+        return AgentTool(
+            name="search_case_documents",
+            description="Search the uploaded case documents and return the most relevant passages, with the file they come from. Use specific queries (names, dates, amounts, facts) and search again if the results are not enough.",
+            parameters={
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string"},
+                },
+                "required": ["query"],
+            }
+        )
+    
+    def _execute_agent(
+        self,
+        system_instructions: str,
+        user_message: str,
+        tools: List[AgentTool],
+        tools_fn_map: dict,
+    ) -> Optional[str]:
+        """Execute the agent loop, returns the error if the agent stopped before finishing"""
         # Initialize OpenAI service
         api_key = os.getenv("PROVIDER_API_KEY", "")
         if not api_key:
@@ -330,8 +365,6 @@ EXAMPLES or TEMPLATES (if provided):
         )
         
         # Execute agent
-        user_message = self._build_user_message()
-        
         def on_message(message):
             printer.info(f"New response from agent: {message}")
         
@@ -341,12 +374,18 @@ EXAMPLES or TEMPLATES (if provided):
             tools=tools,
             tools_fn_map=tools_fn_map,
             on_message_callback=on_message,
+            initial_messages=self.checkpoint.get("agent_messages"),
+            on_turn_callback=self.checkpoint.save_agent_messages,
+            on_delta_callback=(
+                WorkflowStreamPublisher(self.workflow_execution_id).on_delta
+                if STREAM_AGENT_OUTPUT
+                else None
+            ),
         )
         
-        # Process result
+        # Process result (the error is logged by _set_error_status)
         if result.error:
             printer.error(f"Agent execution error: {result.error}")
-            self.workflow_execution.generation_log += f"\n<error>{result.error}</error>"
         
         # Save messages
         for msg in result.messages:
@@ -358,6 +397,7 @@ EXAMPLES or TEMPLATES (if provided):
             self.session.add(message)
         
         self.session.commit()
+        return result.error
     
     def _update_status(self):
         """Update workflow execution status to done"""
@@ -380,13 +420,26 @@ EXAMPLES or TEMPLATES (if provided):
     def _set_error_status(self, error_message: str):
         """Set workflow execution status to error"""
         if self.workflow_execution:
-            self.workflow_execution.status = WorkflowExecutionStatus.FAILED
+            self.workflow_execution.status = WorkflowExecutionStatus.ERROR
+            self.workflow_execution.status_message = error_message
             self.workflow_execution.finished_at = datetime.now()
             if self.workflow_execution.generation_log:
                 self.workflow_execution.generation_log += f"\n<error>{error_message}</error>"
             self.session.commit()
+            redis_client.publish(
+                "workflow_updates",
+                json.dumps(
+                    {
+                        "workflow_execution_id": self.workflow_execution_id,
+                        "log": error_message,
+                        "status": "ERROR",
+                        "assets_ready": False,
+                    }
+                ),
+            )
     
     # Tool implementations
+    @thread_safe
     def _create_markdown_asset(self, name: str, content: str) -> str:
         """Tool: Create markdown asset"""
         printer.magenta(content, "CONTENT", name, "NAME")
@@ -400,11 +453,14 @@ EXAMPLES or TEMPLATES (if provided):
             workflow_execution_id=self.workflow_execution_id,
             origin=AssetOrigin.AI,
         )
-        self.session.add(asset)
-        
-        self.workflow_execution.generation_log += (
-            f"\n<ai_message>Se creó el asset **{name}**.</ai_message>"
-        )
+        # May run concurrently with other tools: the session is only used under the lock
+        with self.checkpoint.lock:
+            self.session.add(asset)
+            self.workflow_execution.generation_log += (
+                f"\n<ai_message>Se creó el asset **{name}**.</ai_message>"
+            )
+            self.checkpoint.stage_tool_result("Asset created successfully")
+            self.session.commit()
         redis_client.publish(
             "workflow_updates",
             json.dumps(
@@ -416,17 +472,19 @@ EXAMPLES or TEMPLATES (if provided):
                 }
             ),
         )
-        self.session.commit()
         return "Asset created successfully"
     
+    @thread_safe
     def _use_template(self, template_id: str, variables: str, document_name: str) -> str:
         """Tool: Fill template with variables"""
         printer.green(f"Using template {template_id} with variables {variables}")
         
-        template = next(
-            (t for t in self.workflow_execution.workflow.output_examples if str(t.id) == template_id),
-            None
-        )
+        with self.checkpoint.lock:
+            template = next(
+                (t for t in self.workflow_execution.workflow.output_examples if str(t.id) == template_id),
+                None
+            )
+            template_path = template.internal_path if template else None
         
         if not template:
             return "The template was not found, please check the template id"
@@ -438,7 +496,7 @@ EXAMPLES or TEMPLATES (if provided):
             absolute_output_path = os.path.join(os.getcwd(), output_path)
             printer.green(f"Generating docx file at {absolute_output_path}")
             
-            generate_docx_from_template(template.internal_path, variables_dict, output_path)
+            generate_docx_from_template(template_path, variables_dict, output_path)
             printer.green(f"Generated docx file at {absolute_output_path}")
             
             html_content = docx_to_html(absolute_output_path)
@@ -455,16 +513,24 @@ EXAMPLES or TEMPLATES (if provided):
                 origin=AssetOrigin.AI,
                 internal_path=output_path,
             )
-            self.session.add(asset)
-            self.session.commit()
+            result = "The template was used successfully and the file was created successfully"
+            with self.checkpoint.lock:
+                self.session.add(asset)
+                self.checkpoint.stage_tool_result(result)
+                self.session.commit()
             
-            return "The template was used successfully and the file was created successfully"
+            return result
             
         except Exception as e:
             traceback.print_exc()
             printer.error(f"Error using template {template_id}: {e}")
             return f"Error using template {template_id}: {e}. The file was not created."
     
+    @thread_safe
+    def _search_case_documents(self, query: str) -> str:
+        """Tool: Search the indexed case documents"""
+        return search_execution_index(self.workflow_execution_id, query)
+    
     def _annotate_scratchpad(self, message: str) -> str:
         """Tool: Add note to scratchpad"""
         self.workflow_execution.generation_log += f"\n<scratchpad>{message}</scratchpad>"
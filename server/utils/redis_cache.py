@@ -32,6 +32,9 @@ class RedisCache:
     def delete(self, key: str) -> None:
         self.client.delete(key)
 
+    def expire(self, key: str, ex: int) -> None:
+        self.client.expire(key, ex)
+
     def flush_all(self):
         self.client.flushall()
 
@@ -47,10 +50,34 @@ class RedisCache:
     def hgetall(self, name: str) -> dict:
         return self.client.hgetall(name)
 
-    def publish(self, channel: str, message: str) -> None:
-        printer.green(f"Publishing message to channel: {channel}")
+    def hincrby(self, name: str, key: str, amount: int = 1) -> int:
+        return self.client.hincrby(name, key, amount)
+
+    def hincrbyfloat(self, name: str, key: str, amount: float) -> float:
+        return self.client.hincrbyfloat(name, key, amount)
+
+    # ------------ Sets ------------
+    def sadd(self, name: str, value: str) -> None:
+        self.client.sadd(name, value)
+
+    def smembers(self, name: str) -> "set[str]":
+        return self.client.smembers(name)
+
+    def sismember(self, name: str, value: str) -> bool:
+        return bool(self.client.sismember(name, value))
+
+    def register_script(self, script: str):
+        return self.client.register_script(script)
+
+    def lock(self, name: str, timeout: int | None = None, blocking_timeout: float | None = None):
+        return self.client.lock(name, timeout=timeout, blocking_timeout=blocking_timeout)
+
+    def publish(self, channel: str, message: str, log: bool = True) -> None:
+        if log:
+            printer.green(f"Publishing message to channel: {channel}")
         self.client.publish(channel, message)
-        printer.green(f"Message published to channel: {channel}")
+        if log:
+            printer.green(f"Message published to channel: {channel}")
 
 
 redis_client = RedisCache()
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+
+from server.utils.redis_cache import redis_client
+
+# Si es true, las respuestas del agente se piden en streaming y el texto parcial
+# se reenvía a la sala workflow_{id} mientras se genera
+STREAM_AGENT_OUTPUT = os.getenv("STREAM_AGENT_OUTPUT", "true").lower() == "true"
+# Mínimo de segundos entre dos mensajes de progreso de una misma ejecución
+STREAM_PUBLISH_INTERVAL = float(os.getenv("STREAM_PUBLISH_INTERVAL", 0.5))
+
+# Argumento de texto que se muestra en vivo para cada tool que genera documentos
+STREAMED_ARGUMENTS = {
+    "create_new_markdown_asset": "content",
+}
+
+
+def extract_partial_string(arguments: str, field: str) -> str | None:
+    """
+    Decodifica lo que ya llegó del valor de `field` en un JSON de argumentos
+    incompleto, por ejemplo '{"name": "a.md", "content": "# Demanda\\nEl ac'.
+    Devuelve None si el campo todavía no empezó.
+    """
+    key = f'"{field}"'
+    position = arguments.find(key)
+    if position == -1:
+        return None
+    position = arguments.find('"', arguments.find(":", position + len(key)) + 1)
+    if position == -1:
+        return None
+
+    raw = []
+    i = position + 1
+    while i < len(arguments):
+        char = arguments[i]
+        if char == '"':
+            break
+        if char == "\\":
+            # Un escape cortado al final del bloque se decodifica en el próximo
+            escape_length = 6 if arguments[i + 1 : i + 2] == "u" else 2
+            if i + escape_length > len(arguments):
+                break
+            raw.append(arguments[i : i + escape_length])
+            i += escape_length
+            continue
+        raw.append(char)
+        i += 1
+
+    try:
+        return json.loads(f'"{"".join(raw)}"')
+    except ValueError:
+        return None
+
+
+class WorkflowStreamPublisher:
+    """
+    Recibe los fragmentos (StreamDelta) de una respuesta en streaming y
+    publica en workflow_updates, como máximo cada `interval` segundos, el
+    texto nuevo: lo que el agente escribe como mensaje y el contenido de los
+    documentos que está generando con las tools de STREAMED_ARGUMENTS. Cada
+    mensaje lleva el texto agregado desde el anterior y su offset, y el
+    cliente lo va concatenando.
+    """
+
+    def __init__(self, workflow_execution_id: str, interval: float = STREAM_PUBLISH_INTERVAL):
+        self.workflow_execution_id = str(workflow_execution_id)
+        self.interval = interval
+        self.last_publish = 0.0
+        self.response = 0
+        # Por stream (respuesta, índice de tool call o "message"): el texto del
+        # mensaje o los argumentos crudos de la tool call
+        self.streams: dict[tuple, dict] = {}
+        # Caracteres de cada stream ya publicados
+        self.published: dict[tuple, int] = {}
+
+    def on_delta(self, delta):
+        if delta.kind == "done":
+            self.flush()
+            self.response += 1
+            return
+
+        if delta.kind == "content":
+            stream = self.streams.setdefault(
+                (self.response, "message"), {"kind": "message", "text": ""}
+            )
+            stream["text"] += delta.text
+        elif delta.kind == "tool_arguments" and delta.tool_name in STREAMED_ARGUMENTS:
+            # Los argumentos se decodifican recién al publicar, no en cada fragmento
+            self.streams[(self.response, delta.index)] = {
+                "kind": "document",
+                "field": STREAMED_ARGUMENTS[delta.tool_name],
+                "arguments": delta.arguments,
+            }
+
+        if time.monotonic() - self.last_publish >= self.interval:
+            self.flush()
+
+    def flush(self):
+        for key, stream in self.streams.items():
+            if stream["kind"] == "document":
+                text = extract_partial_string(stream["arguments"], stream["field"]) or ""
+                name = extract_partial_string(stream["arguments"], "name")
+            else:
+                text, name = stream["text"], None
+            offset = self.published.get(key, 0)
+            if len(text) <= offset:
+                continue
+            self.published[key] = len(text)
+            redis_client.publish(
+                "workflow_updates",
+                json.dumps(
+                    {
+                        "workflow_execution_id": self.workflow_execution_id,
+                        "status": "PROCESSING",
+                        "assets_ready": False,
+                        "stream": {
+                            "id": f"{key[0]}-{key[1]}",
+                            "kind": stream["kind"],
+                            "name": name,
+                            "offset": offset,
+                            "text": text[offset:],
+                        },
+                    }
+                ),
+                # Varios mensajes por segundo: no se loguean
+                log=False,
+            )
+        # Las respuestas terminadas ya no cambian
+        self.streams = {key: s for key, s in self.streams.items() if key[0] == self.response}
+        self.last_publish = time.monotonic()
@@ -0,0 +1,212 @@
+import os
+import json
+import uuid
+import hashlib
+from functools import partial
+from dataclasses import dataclass, asdict
+from typing import AsyncIterator
+
+import anyio
+from fastapi import UploadFile
+
+from server.utils.printer import Printer
+from server.utils.redis_cache import redis_client
+
+printer = Printer("UPLOADS")
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Límite por archivo; los audios largos son los que más se acercan.
+UPLOAD_MAX_FILE_SIZE_MB = int(os.getenv("UPLOAD_MAX_FILE_SIZE_MB", 250))
+UPLOAD_MAX_FILE_SIZE = UPLOAD_MAX_FILE_SIZE_MB * 1024 * 1024
+# Las subidas reanudables que no reciben bloques en este tiempo se descartan
+RESUMABLE_UPLOAD_TTL = int(os.getenv("RESUMABLE_UPLOAD_TTL", 60 * 60 * 24))
+
+
+class UploadTooLargeError(ValueError):
+    def __init__(self, filename: str, max_bytes: int):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        super().__init__(
+            f"El archivo {filename} supera el tamaño máximo de {max_bytes / (1024 * 1024):.1f} MB"
+        )
+
+
+@dataclass
+class SavedUpload:
+    path: str
+    content_hash: str
+    size_bytes: int
+
+
+async def save_upload_file(
+    upload: UploadFile,
+    path: str,
+    max_bytes: int = UPLOAD_MAX_FILE_SIZE,
+) -> SavedUpload:
+    """
+    Copia el archivo subido a `path` por bloques sin bloquear el event loop
+    (la lectura y la escritura se hacen en el threadpool de anyio), calculando
+    el SHA-256 y el tamaño mientras se escribe. Si el archivo supera
+    `max_bytes` se borra lo escrito y se lanza UploadTooLargeError.
+    """
+    sha = hashlib.sha256()
+    size = 0
+    try:
+        async with await anyio.open_file(path, "wb") as buffer:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(upload.filename, max_bytes)
+                sha.update(chunk)
+                await buffer.write(chunk)
+    except BaseException:
+        await remove_file(path)
+        raise
+
+    printer.green(f"{upload.filename} guardado en {path} ({size} bytes)")
+    return SavedUpload(path=path, content_hash=sha.hexdigest(), size_bytes=size)
+
+
+async def remove_file(path: str):
+    try:
+        await anyio.Path(path).unlink(missing_ok=True)
+    except OSError as e:
+        printer.yellow(f"No se pudo eliminar {path}: {e}")
+
+
+# =========================
+# Subidas reanudables (estilo tus)
+# =========================
+
+
+class UploadOffsetMismatchError(ValueError):
+    def __init__(self, expected: int, received: int):
+        self.expected = expected
+        self.received = received
+        super().__init__(
+            f"El offset recibido ({received}) no coincide con el del servidor ({expected})"
+        )
+
+
+class UploadLockedError(RuntimeError):
+    pass
+
+
+@dataclass
+class ResumableUpload:
+    id: str
+    workflow_execution_id: str
+    user_email: str
+    filename: str
+    length: int
+    offset: int = 0
+    brief: str | None = None
+
+    @property
+    def path(self) -> str:
+        ext = os.path.splitext(self.filename)[1]
+        return f"uploads/{self.workflow_execution_id}/{self.id}{ext}.part"
+
+    @property
+    def is_complete(self) -> bool:
+        return self.offset == self.length
+
+
+class ResumableUploadStore:
+    """
+    Guarda en Redis el estado de las subidas por bloques: el archivo parcial
+    vive en uploads/{execution_id} y Redis lleva el offset confirmado, para
+    que el cliente pueda preguntar desde dónde continuar tras un corte.
+    """
+
+    PREFIX = "resumable_upload"
+
+    def __init__(self, ttl: int = RESUMABLE_UPLOAD_TTL):
+        self.ttl = ttl
+
+    def _key(self, upload_id: str) -> str:
+        return f"{self.PREFIX}:{upload_id}"
+
+    def _execution_key(self, workflow_execution_id: str) -> str:
+        return f"{self.PREFIX}:execution:{workflow_execution_id}"
+
+    def create(
+        self,
+        workflow_execution_id: str,
+        user_email: str,
+        filename: str,
+        length: int,
+        brief: str | None = None,
+    ) -> ResumableUpload:
+        upload = ResumableUpload(
+            id=str(uuid.uuid4()),
+            workflow_execution_id=str(workflow_execution_id),
+            user_email=user_email,
+            filename=filename,
+            length=length,
+            brief=brief,
+        )
+        os.makedirs(os.path.dirname(upload.path), exist_ok=True)
+        open(upload.path, "wb").close()
+        self.save(upload)
+        execution_key = self._execution_key(upload.workflow_execution_id)
+        redis_client.sadd(execution_key, upload.id)
+        redis_client.expire(execution_key, self.ttl)
+        return upload
+
+    def get(self, upload_id: str) -> ResumableUpload | None:
+        data = redis_client.get(self._key(upload_id))
+        return ResumableUpload(**json.loads(data)) if data else None
+
+    def save(self, upload: ResumableUpload):
+        redis_client.set(self._key(upload.id), json.dumps(asdict(upload)), ex=self.ttl)
+
+    def list_for_execution(self, workflow_execution_id: str) -> list[ResumableUpload]:
+        upload_ids = redis_client.smembers(self._execution_key(str(workflow_execution_id)))
+        uploads = [self.get(upload_id) for upload_id in upload_ids]
+        return [upload for upload in uploads if upload is not None]
+
+    def delete_execution(self, workflow_execution_id: str):
+        for upload in self.list_for_execution(workflow_execution_id):
+            redis_client.delete(self._key(upload.id))
+        redis_client.delete(self._execution_key(str(workflow_execution_id)))
+
+    async def append(
+        self, upload: ResumableUpload, offset: int, chunks: AsyncIterator[bytes]
+    ) -> ResumableUpload:
+        """
+        Escribe los bloques del cuerpo de un PATCH a partir de `offset`. Si la
+        conexión se corta a mitad, el offset queda en lo que sí se escribió y
+        el cliente continúa desde ahí. Las llamadas a Redis van al threadpool
+        para no bloquear el event loop.
+        """
+        # El timeout libera el lock si el proceso muere a mitad de un bloque
+        lock = redis_client.lock(f"{self._key(upload.id)}:lock", timeout=60 * 15)
+        if not await anyio.to_thread.run_sync(partial(lock.acquire, blocking=False)):
+            raise UploadLockedError(f"La subida {upload.id} está recibiendo otro bloque")
+
+        try:
+            # Se relee dentro del lock por si otro PATCH terminó mientras tanto
+            upload = await anyio.to_thread.run_sync(self.get, upload.id) or upload
+            if offset != upload.offset:
+                raise UploadOffsetMismatchError(upload.offset, offset)
+
+            try:
+                async with await anyio.open_file(upload.path, "r+b") as buffer:
+                    # Descarta bytes de un PATCH anterior que no se llegaron a confirmar
+                    await buffer.truncate(upload.offset)
+                    await buffer.seek(upload.offset)
+                    async for chunk in chunks:
+                        if upload.offset + len(chunk) > upload.length:
+                            raise UploadTooLargeError(upload.filename, upload.length)
+                        await buffer.write(chunk)
+                        upload.offset += len(chunk)
+            finally:
+                await anyio.to_thread.run_sync(self.save, upload)
+        finally:
+            await anyio.to_thread.run_sync(lock.release)
+
+        return upload
+
+
+resumable_uploads = ResumableUploadStore()